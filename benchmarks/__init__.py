@@ -0,0 +1,9 @@
+"""
+Benchmarks for todayi. Not installed with the package.
+
+- `python -m benchmarks` runs the end to end suite against
+  synthetic journals and writes results as json.
+- `python -m benchmarks.compare OLD NEW` compares two results.
+- `python -m benchmarks.generate` writes a synthetic journal.
+- `python -m benchmarks.backends` compares backend latency.
+"""
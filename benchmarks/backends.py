@@ -0,0 +1,86 @@
+"""
+Compares per-write and per-read latency of the sqlite backends,
+as well as the cold start cost of writing a single entry from
+a fresh process, which is what `todayi "did x" -t a b` pays.
+
+Usage: `python -m benchmarks.backends [-n ITERATIONS] [--seed N]`
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.generate import generate_entries
+from benchmarks.timing import summarize, timed
+from todayi.backend.filter import EntryFilterSettings
+from todayi.backend.sqlite import SqliteBackend
+from todayi.backend.sqlite_core import SqliteCoreBackend
+from todayi.model.entry import Entry
+from todayi.model.tag import Tag
+
+
+backends = {
+    "sqlite": SqliteBackend,
+    "sqlite_core": SqliteCoreBackend,
+}
+
+
+cold_write = """
+import sys
+from todayi.backend.{module} import {cls}
+from todayi.model.entry import Entry
+from todayi.model.tag import Tag
+{cls}(sys.argv[1]).write_entry(Entry("did x", tags=[Tag("a"), Tag("b")]))
+"""
+
+
+def bench_backend(name, cls, iterations, seed):
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "todayi.db")
+        backend = cls(db_path)
+        backend.write_entries(generate_entries(seed), 10000)
+        results["write_entry"] = timed(
+            lambda: backend.write_entry(Entry("did x", tags=[Tag("a"), Tag("b")])),
+            iterations,
+        )
+        recent = EntryFilterSettings(order_by="created_at", descending=True, limit=10)
+        results["read_latest_10"] = timed(
+            lambda: backend.read_entries(recent), iterations
+        )
+        tagged = EntryFilterSettings(
+            with_tags=[Tag("review")], without_tags=[Tag("oncall")]
+        )
+        results["read_tagged"] = timed(lambda: backend.read_entries(tagged), iterations)
+        script = cold_write.format(
+            module=cls.__module__.split(".")[-1], cls=cls.__name__
+        )
+        results["cold_start_write"] = timed(
+            lambda: subprocess.run([sys.executable, "-c", script, db_path], check=True),
+            max(1, iterations // 10),
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--iterations", type=int, default=100)
+    parser.add_argument(
+        "--seed", type=int, default=10000, help="# of entries to seed db with"
+    )
+    args = parser.parse_args()
+    print("{:<12} {:<18} {:>12} {:>12}".format("backend", "op", "median ms", "p95 ms"))
+    for name, cls in backends.items():
+        for op, timings in bench_backend(name, cls, args.iterations, args.seed).items():
+            summary = summarize(timings)
+            print(
+                "{:<12} {:<18} {:>12.3f} {:>12.3f}".format(
+                    name, op, summary["median_ms"], summary["p95_ms"]
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
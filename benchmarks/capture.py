@@ -0,0 +1,90 @@
+"""
+Compares latency of capturing an entry from a fresh process,
+`todayi "did x" -t a b`, when writing to the db directly and
+when appending to the journal, with and without fsync. Also
+times compacting journaled entries into the db, as the next
+read pays for it.
+
+Usage: `python -m benchmarks.capture [-n ITERATIONS] [--compact N]`
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.backends import backends
+from benchmarks.timing import summarize, timed
+from todayi.backend import journal
+from todayi.model.entry import Entry
+from todayi.model.tag import Tag
+
+
+"""
+Available write modes, as config overrides
+"""
+write_modes = {
+    "direct": {"write_mode": "direct"},
+    "journal": {"write_mode": "journal", "journal_fsync": "false"},
+    "journal_fsync": {"write_mode": "journal", "journal_fsync": "true"},
+}
+
+
+def bench_capture(backend, overrides, iterations):
+    with tempfile.TemporaryDirectory() as tmp:
+        config_path = os.path.join(tmp, "todayi.config")
+        with open(config_path, "w") as f:
+            json.dump(dict(backend=backend, backend_dir=tmp, **overrides), f)
+        env = dict(
+            os.environ,
+            HOME=tmp,
+            TODAYI_CONFIG_PATH=config_path,
+            TODAYI_SOCKET=os.path.join(tmp, "none.sock"),
+        )
+        argv = [sys.executable, "-m", "todayi", "did x", "-t", "a", "b"]
+        return timed(lambda: subprocess.run(argv, env=env, check=True), iterations)
+
+
+def bench_compact(cls, entries):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "todayi.db")
+        path = journal.journal_path(db_path)
+        backend = cls(db_path)
+
+        def append():
+            for i in range(entries):
+                journal.append(
+                    path, Entry("did {}".format(i), tags=[Tag("a")]), fsync=False
+                )
+
+        timings = timed(lambda: journal.compact(path, backend), 5, setup=append)
+        backend.close()
+        return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--iterations", type=int, default=20)
+    parser.add_argument(
+        "--compact", type=int, default=100, help="# of journaled entries to compact"
+    )
+    args = parser.parse_args()
+    print("{:<12} {:<24} {:>12} {:>12}".format("backend", "op", "median ms", "p95 ms"))
+    for name, cls in backends.items():
+        results = {}
+        for mode, overrides in write_modes.items():
+            results["capture_" + mode] = bench_capture(name, overrides, args.iterations)
+        results["compact_{}".format(args.compact)] = bench_compact(cls, args.compact)
+        for op, timings in results.items():
+            summary = summarize(timings)
+            print(
+                "{:<12} {:<24} {:>12.3f} {:>12.3f}".format(
+                    name, op, summary["median_ms"], summary["p95_ms"]
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
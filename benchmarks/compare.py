@@ -0,0 +1,52 @@
+"""
+Compares median timings of two benchmark results, as written
+by `python -m benchmarks`. Only meaningful for results from the
+same machine.
+
+Usage: `python -m benchmarks.compare OLD NEW [--threshold RATIO]`
+"""
+
+import argparse
+import json
+import sys
+from typing import Any, Dict, Tuple
+
+
+def _by_key(path: str) -> Dict[Tuple[int, str, str], Dict[str, Any]]:
+    with open(path) as f:
+        results = json.load(f)["results"]
+    return {(r["size"], r["backend"], r["benchmark"]): r for r in results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.1,
+        help="new / old median ratio above which a benchmark regressed",
+    )
+    args = parser.parse_args()
+    old, new = _by_key(args.old), _by_key(args.new)
+    regressions = 0
+    for key in sorted(old.keys() & new.keys()):
+        ratio = new[key]["median_ms"] / max(old[key]["median_ms"], 1e-9)
+        regressed = ratio > args.threshold
+        regressions += regressed
+        print(
+            "{:>8} {:<12} {:<60} {:>10.3f} {:>10.3f} {:>7.2f}x{}".format(
+                *key,
+                old[key]["median_ms"],
+                new[key]["median_ms"],
+                ratio,
+                " !" if regressed else "",
+            )
+        )
+    print("{} regressions".format(regressions))
+    sys.exit(1 if regressions > 0 else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Measures throughput of several processes writing entries to one
+db at once, as scripts logging at the same time do. Each writer
+opens its own backend, then writes entries one transaction at a
+time. Reports total writes per second, and writes that failed.
+
+Usage: `python -m benchmarks.concurrency [--writers N [N ...]] [-n WRITES]`
+"""
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+from benchmarks.backends import backends
+from todayi.model.entry import Entry
+from todayi.model.tag import Tag
+
+
+def write(cls, db_path, writes, barrier, failures):
+    backend = cls(db_path)
+    barrier.wait()
+    for i in range(writes):
+        try:
+            backend.write_entry(Entry("did {}".format(i), tags=[Tag("a"), Tag("b")]))
+        except Exception:
+            with failures.get_lock():
+                failures.value += 1
+    backend.close()
+
+
+def bench_writers(cls, writers, writes):
+    """
+    Times writers writing to a new db at once.
+
+    :return: Tuple[float, int] of seconds taken, and # of failed writes
+    """
+    context = multiprocessing.get_context("fork")
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "todayi.db")
+        cls(db_path).close()
+        barrier = context.Barrier(writers + 1)
+        failures = context.Value("i", 0)
+        processes = [
+            context.Process(
+                target=write, args=(cls, db_path, writes, barrier, failures)
+            )
+            for _ in range(writers)
+        ]
+        for process in processes:
+            process.start()
+        barrier.wait()
+        start = time.perf_counter()
+        for process in processes:
+            process.join()
+        return time.perf_counter() - start, failures.value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--writers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument(
+        "-n", "--writes", type=int, default=200, help="# of writes per writer"
+    )
+    args = parser.parse_args()
+    print(
+        "{:<12} {:>8} {:>12} {:>10}".format("backend", "writers", "writes/s", "failed")
+    )
+    for name, cls in backends.items():
+        for writers in args.writers:
+            seconds, failed = bench_writers(cls, writers, args.writes)
+            print(
+                "{:<12} {:>8} {:>12.1f} {:>10}".format(
+                    name, writers, (writers * args.writes - failed) / seconds, failed
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
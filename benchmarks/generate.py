@@ -0,0 +1,203 @@
+"""
+Generates synthetic journals. Tag usage follows a Zipf like
+distribution, since a handful of tags (a current project, a team)
+are used far more often than the long tail, and entries are spread
+evenly over the covered period. Output is deterministic for a
+given seed and end date.
+
+Usage: `python -m benchmarks.generate [-n ENTRIES] [--seed N] [--jsonl] PATH`
+"""
+
+import argparse
+from datetime import datetime, timedelta
+from itertools import accumulate
+import json
+import random
+from typing import Iterator, List, Optional
+from uuid import UUID
+
+from todayi.backend.sqlite_core import SqliteCoreBackend
+from todayi.model.entry import Entry
+from todayi.model.tag import Tag
+
+
+sizes = [10000, 100000, 1000000]
+
+
+common_tags = [
+    "standup",
+    "review",
+    "oncall",
+    "meeting",
+    "frontend",
+    "backend",
+    "infra",
+    "gcp",
+    "terraform",
+    "hiring",
+    "docs",
+    "incident",
+    "release",
+    "perf",
+    "security",
+    "testing",
+    "design",
+    "mentoring",
+    "planning",
+    "migration",
+]
+
+
+verbs = [
+    "Fixed",
+    "Reviewed",
+    "Wrote",
+    "Deployed",
+    "Debugged",
+    "Paired on",
+    "Planned",
+    "Refactored",
+    "Documented",
+    "Presented",
+]
+
+
+subjects = [
+    "flaky test",
+    "release notes",
+    "design doc",
+    "on call handoff",
+    "schema migration",
+    "latency dashboard",
+    "incident postmortem",
+    "code review backlog",
+    "performance regression",
+    "onboarding guide",
+    "api pagination",
+    "build pipeline",
+]
+
+
+"""
+Relative weights of entries having 0, 1, 2, 3 or 4 tags.
+"""
+tag_count_weights = [10, 35, 30, 17, 8]
+
+
+def tag_names(count: int = 200) -> List[str]:
+    """
+    Gets tag names, most frequently used first.
+
+    :param count: # of distinct tags
+    :type count: int
+    :return: List[str]
+    """
+    names = common_tags[:count]
+    names += ["project{}".format(i) for i in range(count - len(names))]
+    return names
+
+
+def generate_entries(
+    n: int,
+    seed: int = 0,
+    end: Optional[datetime] = None,
+    days: int = 5 * 365,
+    tag_count: int = 200,
+    zipf_exponent: float = 1.1,
+) -> Iterator[Entry]:
+    """
+    Generates entries, oldest first.
+
+    :param n: # of entries
+    :type n: int
+    :param seed: random seed
+    :type seed: int
+    :param end: creation time of newest entry, by default today
+    :type end: datetime
+    :param days: # of days covered by entries
+    :type days: int
+    :param tag_count: # of distinct tags
+    :type tag_count: int
+    :param zipf_exponent: skew of tag usage, higher is more skewed
+    :type zipf_exponent: float
+    :return: Iterator[Entry]
+    """
+    rng = random.Random(seed)
+    names = tag_names(tag_count)
+    cum_weights = list(
+        accumulate(1 / (rank + 1) ** zipf_exponent for rank in range(len(names)))
+    )
+    tag_counts = range(len(tag_count_weights))
+    if end is None:
+        end = datetime.combine(datetime.now().date(), datetime.min.time())
+    start = end - timedelta(days=days)
+    step = (end - start) / max(1, n - 1)
+    for i in range(n):
+        count = rng.choices(tag_counts, tag_count_weights)[0]
+        picked = dict.fromkeys(rng.choices(names, cum_weights=cum_weights, k=count))
+        content = "{} {} for {}".format(
+            rng.choice(verbs), rng.choice(subjects), rng.choice(names)
+        )
+        yield Entry(
+            content,
+            uuid=str(UUID(int=rng.getrandbits(128), version=4)),
+            tags=[Tag(name) for name in picked],
+            created_at=start + step * i,
+        )
+
+
+def write_journal(path: str, n: int, seed: int = 0, batch_size: int = 10000) -> int:
+    """
+    Writes synthetic journal to sqlite db at path.
+
+    :param path: path to sqlite db
+    :type path: str
+    :param n: # of entries
+    :type n: int
+    :param seed: random seed
+    :type seed: int
+    :param batch_size: # of entries to write per transaction
+    :type batch_size: int
+    :return: int # of entries written
+    """
+    backend = SqliteCoreBackend(path)
+    return backend.write_entries(generate_entries(n, seed), batch_size)
+
+
+def write_jsonl(path: str, n: int, seed: int = 0) -> int:
+    """
+    Writes synthetic journal as json lines, as read by `todayi import`.
+
+    :param path: path to output file
+    :type path: str
+    :param n: # of entries
+    :type n: int
+    :param seed: random seed
+    :type seed: int
+    :return: int # of entries written
+    """
+    with open(path, "w") as f:
+        for entry in generate_entries(n, seed):
+            record = {
+                "content": entry.content,
+                "uuid": entry.uuid,
+                "tags": [t.name for t in entry.tags],
+                "created_at": entry.created_at.isoformat(),
+            }
+            f.write(json.dumps(record) + "\n")
+    return n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("path", help="sqlite db, or jsonl file with --jsonl")
+    parser.add_argument("-n", "--entries", type=int, default=sizes[0])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--jsonl", action="store_true", help="write json lines")
+    args = parser.parse_args()
+    write = write_jsonl if args.jsonl else write_journal
+    print("Wrote {} entries".format(write(args.path, args.entries, args.seed)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Compares storage profiles of the sqlite backends, see
+`todayi.backend.profiles`, so that a profile may be chosen from
+numbers. For each backend and profile, reports latency of single
+writes and of reads against a seeded db, throughput of a bulk
+import, and throughput of parallel writers.
+
+Usage: `python -m benchmarks.profiles [-n ITERATIONS] [--seed N] [--writers N]`
+"""
+
+import argparse
+from functools import partial
+import os
+import tempfile
+import time
+
+from benchmarks.backends import backends
+from benchmarks.concurrency import bench_writers
+from benchmarks.generate import generate_entries
+from benchmarks.timing import summarize, timed
+from todayi.backend.filter import EntryFilterSettings
+from todayi.backend.profiles import storage_profiles
+from todayi.model.entry import Entry
+from todayi.model.tag import Tag
+
+
+def bench_profile(cls, profile, iterations, seed, writers):
+    """
+    Benchmarks a backend opened with a storage profile.
+
+    :return: Tuple[Dict[str, List[float]], Dict[str, float]] of
+             latencies in seconds, and throughputs in entries/s
+    """
+    latencies = {}
+    throughputs = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "todayi.db")
+        backend = cls(db_path, storage_profile=profile)
+        start = time.perf_counter()
+        backend.write_entries(generate_entries(seed), 10000)
+        throughputs["bulk_import"] = seed / (time.perf_counter() - start)
+        latencies["write_entry"] = timed(
+            lambda: backend.write_entry(Entry("did x", tags=[Tag("a"), Tag("b")])),
+            iterations,
+        )
+        recent = EntryFilterSettings(order_by="created_at", descending=True, limit=10)
+        latencies["read_latest_10"] = timed(
+            lambda: backend.read_entries(recent), iterations
+        )
+        tagged = EntryFilterSettings(
+            with_tags=[Tag("review")], without_tags=[Tag("oncall")]
+        )
+        latencies["read_tagged"] = timed(
+            lambda: backend.read_entries(tagged), iterations
+        )
+        latencies["count_by_tag"] = timed(
+            lambda: backend.aggregate(EntryFilterSettings(), "tag"), iterations
+        )
+        backend.close()
+    seconds, failed = bench_writers(
+        partial(cls, storage_profile=profile), writers, iterations
+    )
+    throughputs["{}_writers".format(writers)] = (
+        writers * iterations - failed
+    ) / seconds
+    return latencies, throughputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--iterations", type=int, default=100)
+    parser.add_argument(
+        "--seed", type=int, default=20000, help="# of entries to bulk import"
+    )
+    parser.add_argument("--writers", type=int, default=4, help="# of parallel writers")
+    args = parser.parse_args()
+    print(
+        "{:<12} {:<11} {:<16} {:>10} {:>10} {:>10}".format(
+            "backend", "profile", "op", "median ms", "p95 ms", "entries/s"
+        )
+    )
+    for name, cls in backends.items():
+        for profile in storage_profiles:
+            latencies, throughputs = bench_profile(
+                cls, profile, args.iterations, args.seed, args.writers
+            )
+            for op, timings in latencies.items():
+                summary = summarize(timings)
+                print(
+                    "{:<12} {:<11} {:<16} {:>10.3f} {:>10.3f} {:>10}".format(
+                        name, profile, op, summary["median_ms"], summary["p95_ms"], ""
+                    )
+                )
+            for op, throughput in throughputs.items():
+                print(
+                    "{:<12} {:<11} {:<16} {:>10} {:>10} {:>10.1f}".format(
+                        name, profile, op, "", "", throughput
+                    )
+                )
+
+
+if __name__ == "__main__":
+    main()
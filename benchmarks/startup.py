@@ -0,0 +1,104 @@
+"""
+Measures cli cold start, as time spent importing todayi modules,
+including everything they import, reported by
+`python -X importtime`. Times importing the cli, and capturing
+an entry per write mode. Heavy dependencies are only imported by
+the commands that need them, see `tests/test_startup.py`.
+
+Usage: `python -m benchmarks.startup [-n ITERATIONS]`
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.timing import summarize
+
+
+"""
+Available startups, as code run by a fresh interpreter
+"""
+startups = {
+    "import_cli": "import todayi.cli",
+    "capture": (
+        "import sys\n"
+        "sys.argv = ['todayi', 'note', '-t', 'a']\n"
+        "from todayi.cli import run\n"
+        "run()"
+    ),
+}
+
+"""
+Available write modes, as config overrides
+"""
+write_modes = {
+    "direct": {"write_mode": "direct"},
+    "journal": {"write_mode": "journal", "journal_fsync": "false"},
+}
+
+
+def todayi_import_seconds(importtime_output):
+    """
+    Sums cumulative import time of top level todayi imports
+    reported by `python -X importtime`.
+
+    :return: float
+    """
+    total_us = 0
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        if name.startswith(" todayi"):
+            total_us += int(cumulative)
+    return total_us / 1000000
+
+
+def bench_startup(code, overrides, iterations):
+    timings = []
+    with tempfile.TemporaryDirectory() as tmp:
+        config_path = os.path.join(tmp, "todayi.config")
+        with open(config_path, "w") as f:
+            json.dump(dict(backend="sqlite_core", backend_dir=tmp, **overrides), f)
+        env = dict(
+            os.environ,
+            HOME=tmp,
+            TODAYI_CONFIG_PATH=config_path,
+            TODAYI_SOCKET=os.path.join(tmp, "none.sock"),
+        )
+        for _ in range(iterations):
+            result = subprocess.run(
+                [sys.executable, "-X", "importtime", "-c", code],
+                env=env,
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            timings.append(todayi_import_seconds(result.stderr))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--iterations", type=int, default=20)
+    args = parser.parse_args()
+    print("{:<24} {:>12} {:>12}".format("op", "median ms", "p95 ms"))
+    results = {"import_cli": bench_startup(startups["import_cli"], {}, args.iterations)}
+    for mode, overrides in write_modes.items():
+        results["capture_" + mode] = bench_startup(
+            startups["capture"], overrides, args.iterations
+        )
+    for op, timings in results.items():
+        summary = summarize(timings)
+        print(
+            "{:<24} {:>12.3f} {:>12.3f}".format(
+                op, summary["median_ms"], summary["p95_ms"]
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
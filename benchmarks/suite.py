@@ -0,0 +1,349 @@
+"""
+End to end benchmarks, run against synthetic journals of
+increasing size. Times the controller paths used by the cli,
+every combination of filter settings, as well as cli start up
+and import from fresh processes. Results are written as json,
+so that runs of different commits on one machine can be compared
+with `python -m benchmarks.compare`.
+
+Usage: `python -m benchmarks [--sizes N [N ...]] [-n ITERATIONS] [-o OUTPUT]`
+"""
+
+import argparse
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime, timedelta
+from itertools import combinations
+import json
+import os
+from pathlib import Path
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+from typing import Any, Dict, Iterator, List, Optional
+
+from benchmarks.generate import sizes as default_sizes, write_journal, write_jsonl
+from benchmarks.timing import summarize, timed
+from todayi.backend.filter import EntryFilterSettings
+from todayi.controller import Controller
+from todayi.model.tag import Tag
+
+
+repo_dir = Path(__file__).resolve().parent.parent
+
+
+def filter_values(now: datetime) -> Dict[str, Any]:
+    """
+    Gets a representative value for each filter field of
+    `EntryFilterSettings`, given the generated journal.
+
+    :param now: time benchmarks are run
+    :type now: datetime
+    :return: Dict[str, Any]
+    """
+    return {
+        "content_contains": "migration",
+        "content_equals": "Fixed flaky test for review",
+        "content_not_contains": "standup",
+        "content_not_equals": "Wrote design doc for docs",
+        "after": now - timedelta(days=90),
+        "before": now - timedelta(days=7),
+        "with_tags": [Tag("review")],
+        "without_tags": [Tag("oncall")],
+        "search": "regression",
+    }
+
+
+def filter_combinations(
+    values: Dict[str, Any], max_fields: Optional[int] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yields every combination of filter fields, from no fields
+    up to max_fields.
+
+    :param values: filter field to value
+    :type values: Dict[str, Any]
+    :param max_fields: max # of fields per combination, by default all
+    :type max_fields: int
+    :return: Iterator[Dict[str, Any]]
+    """
+    max_fields = len(values) if max_fields is None else max_fields
+    for count in range(min(max_fields, len(values)) + 1):
+        for fields in combinations(values.keys(), count):
+            yield {field: values[field] for field in fields}
+
+
+@contextmanager
+def _environ(values: Dict[str, str]):
+    previous = {key: os.environ.get(key) for key in values}
+    os.environ.update(values)
+    try:
+        yield
+    finally:
+        for key, value in previous.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def _config_environ(backend: str, db_path: Path) -> Dict[str, str]:
+    return {
+        "TODAYI_BACKEND": backend,
+        "TODAYI_BACKEND_DIR": str(db_path.parent),
+        "TODAYI_BACKEND_FILENAME": db_path.name,
+        "TODAYI_CONFIG_PATH": str(db_path.parent / "todayi.config"),
+    }
+
+
+def ensure_journal(journal_dir: Path, size: int, seed: int) -> Path:
+    """
+    Gets path to synthetic journal, generating it if it does
+    not exist yet.
+
+    :param journal_dir: directory journals are kept in
+    :type journal_dir: Path
+    :param size: # of entries
+    :type size: int
+    :param seed: random seed
+    :type seed: int
+    :return: Path
+    """
+    journal = journal_dir / "journal-{}-{}.db".format(size, seed)
+    if not journal.exists():
+        tmp = journal.with_suffix(".tmp")
+        try:
+            tmp.unlink()
+        except FileNotFoundError:
+            pass
+        write_journal(str(tmp), size, seed)
+        tmp.replace(journal)
+    return journal
+
+
+def ensure_jsonl(journal_dir: Path, size: int, seed: int) -> Path:
+    journal = journal_dir / "journal-{}-{}.jsonl".format(size, seed)
+    if not journal.exists():
+        tmp = journal.with_suffix(".tmp")
+        write_jsonl(str(tmp), size, seed)
+        tmp.replace(journal)
+    return journal
+
+
+def bench_controller(
+    backend: str, db_path: Path, work_dir: Path, iterations: int
+) -> Dict[str, List[float]]:
+    """
+    Times controller paths used by the cli, in process.
+    """
+    results = {}
+    with _environ(_config_environ(backend, db_path)), open(
+        os.devnull, "w"
+    ) as devnull, redirect_stdout(devnull):
+        controller = Controller()
+        results["write_entry"] = timed(
+            lambda: controller.write_entry("did x", ["a", "b"]), iterations
+        )
+        results["print_entries"] = timed(controller.print_entries, iterations)
+        long_ago = datetime.now() - timedelta(days=100 * 365)
+        results["print_entries_all_time"] = timed(
+            lambda: controller.print_entries(after=long_ago), iterations
+        )
+        results["print_entries_tagged"] = timed(
+            lambda: controller.print_entries(after=long_ago, with_tags="review"),
+            iterations,
+        )
+        for format in ["md", "csv"]:
+            output = str(work_dir / "report.{}".format(format))
+            results["file_report_{}".format(format)] = timed(
+                lambda: controller.file_report(format, output), iterations
+            )
+    return results
+
+
+def bench_filters(
+    backend: str,
+    db_path: Path,
+    iterations: int,
+    limit: Optional[int],
+    max_fields: Optional[int],
+) -> Dict[str, List[float]]:
+    """
+    Times reading entries for every combination of filter fields.
+    """
+    results = {}
+    backend = Controller._backends.get(backend)(str(db_path))
+    for values in filter_combinations(filter_values(datetime.now()), max_fields):
+        entry_filter = EntryFilterSettings(limit=limit, **values)
+        name = "filter[{}]".format("+".join(values.keys()))
+        results[name] = timed(lambda: backend.read_entries(entry_filter), iterations)
+    return results
+
+
+def bench_cli(
+    backend: str, jsonl: Path, work_dir: Path, iterations: int
+) -> Dict[str, List[float]]:
+    """
+    Times cli commands run from fresh processes, including
+    interpreter start up.
+    """
+    db_path = work_dir / "cli.db"
+    env = dict(os.environ, HOME=str(work_dir), **_config_environ(backend, db_path))
+
+    def todayi(*args):
+        return lambda: subprocess.run(
+            [sys.executable, "-m", "todayi", *args],
+            env=env,
+            stdout=subprocess.DEVNULL,
+            check=True,
+        )
+
+    def remove_db():
+        try:
+            db_path.unlink()
+        except FileNotFoundError:
+            pass
+
+    results = {}
+    cli_iterations = max(1, iterations // 5)
+    results["cli_start"] = timed(todayi("config", "get", "backend"), cli_iterations)
+    results["cli_import"] = timed(
+        todayi("import", str(jsonl)), cli_iterations, setup=remove_db
+    )
+    results["cli_write"] = timed(todayi("did x", "-t", "a", "b"), cli_iterations)
+    results["cli_show"] = timed(todayi("show"), cli_iterations)
+    return results
+
+
+def run_suite(
+    sizes: List[int],
+    backends: List[str],
+    journal_dir: Path,
+    iterations: int = 10,
+    seed: int = 0,
+    filter_limit: Optional[int] = 1000,
+    max_filter_fields: Optional[int] = None,
+    cli: bool = True,
+) -> List[Dict[str, Any]]:
+    """
+    Runs benchmarks for each journal size and backend.
+
+    :return: List[Dict[str, Any]] one result per size, backend
+             and benchmark
+    """
+    results = []
+    for size in sizes:
+        journal = ensure_journal(journal_dir, size, seed)
+        jsonl = ensure_jsonl(journal_dir, size, seed) if cli else None
+        for backend in backends:
+            with tempfile.TemporaryDirectory() as tmp:
+                work_dir = Path(tmp)
+                db_path = work_dir / "todayi.db"
+                shutil.copyfile(str(journal), str(db_path))
+                timings = bench_filters(
+                    backend, db_path, iterations, filter_limit, max_filter_fields
+                )
+                timings.update(bench_controller(backend, db_path, work_dir, iterations))
+                if cli:
+                    timings.update(bench_cli(backend, jsonl, work_dir, iterations))
+            for benchmark, benchmark_timings in timings.items():
+                result = {"size": size, "backend": backend, "benchmark": benchmark}
+                result.update(summarize(benchmark_timings))
+                results.append(result)
+                print(
+                    "{:>8} {:<12} {:<60} {:>10.3f} {:>10.3f}".format(
+                        size,
+                        backend,
+                        benchmark,
+                        result["median_ms"],
+                        result["p95_ms"],
+                    ),
+                    file=sys.stderr,
+                )
+    return results
+
+
+def _git(*args) -> Optional[str]:
+    result = subprocess.run(
+        ["git", *args], cwd=str(repo_dir), capture_output=True, text=True
+    )
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def metadata(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Describes the run, so results are only compared between
+    like machines and settings.
+    """
+    return {
+        "commit": _git("rev-parse", "HEAD"),
+        "describe": _git("describe", "--always", "--dirty"),
+        "created_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "machine": platform.node(),
+        "settings": {
+            key: value for key, value in vars(args).items() if key != "output"
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=default_sizes[:1],
+        help="# of entries of journals, ie 10000 100000 1000000",
+    )
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        choices=list(Controller._backends.keys()),
+        default=list(Controller._backends.keys()),
+    )
+    parser.add_argument("-n", "--iterations", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--journal-dir",
+        help="directory to keep generated journals in, reused between runs",
+    )
+    parser.add_argument(
+        "--filter-limit",
+        type=int,
+        default=1000,
+        help="max # of entries read per filter, 0 for no limit",
+    )
+    parser.add_argument(
+        "--max-filter-fields",
+        type=int,
+        help="max # of fields per filter combination, by default all",
+    )
+    parser.add_argument("--no-cli", action="store_true", help="skip cli benchmarks")
+    parser.add_argument("-o", "--output", default="bench-results.json")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        journal_dir = Path(args.journal_dir or tmp)
+        journal_dir.mkdir(parents=True, exist_ok=True)
+        results = run_suite(
+            args.sizes,
+            args.backends,
+            journal_dir,
+            iterations=args.iterations,
+            seed=args.seed,
+            filter_limit=args.filter_limit or None,
+            max_filter_fields=args.max_filter_fields,
+            cli=not args.no_cli,
+        )
+    with open(args.output, "w") as f:
+        json.dump({"metadata": metadata(args), "results": results}, f, indent=2)
+    print("Wrote {} results to {}".format(len(results), args.output))
+
+
+if __name__ == "__main__":
+    main()
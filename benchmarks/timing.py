@@ -0,0 +1,50 @@
+"""
+Helpers to time benchmarks and summarize timings.
+"""
+
+import statistics
+import time
+from typing import Callable, Dict, List, Optional
+
+
+def timed(
+    fn: Callable[[], None], iterations: int, setup: Optional[Callable[[], None]] = None
+) -> List[float]:
+    """
+    Times calls of fn, in seconds.
+
+    :param fn: function to time
+    :type fn: Callable
+    :param iterations: # of calls
+    :type iterations: int
+    :param setup: optional function called before each call, untimed
+    :type setup: Callable
+    :return: List[float]
+    """
+    timings = []
+    for _ in range(iterations):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def summarize(timings: List[float]) -> Dict[str, float]:
+    """
+    Summarizes timings in ms.
+
+    :param timings: timings in seconds
+    :type timings: List[float]
+    :return: Dict[str, float]
+    """
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    return {
+        "n": len(timings),
+        "median_ms": statistics.median(timings) * 1000,
+        "p95_ms": p95 * 1000,
+        "min_ms": timings[0] * 1000,
+        "mean_ms": statistics.mean(timings) * 1000,
+    }
@@ -5,7 +5,7 @@ setup(
     version="0.0.1",
     author="Brighton Balfrey",
     author_email="balfrey@usc.edu",
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks", "benchmarks.*"]),
     entry_points={
         "console_scripts": [
             "todayi = todayi.__main__:main",
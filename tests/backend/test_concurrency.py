@@ -0,0 +1,165 @@
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from todayi.backend import concurrency
+from todayi.backend.concurrency import replace_db, retry_when_locked
+from todayi.backend.filter import EntryFilterSettings
+from todayi.backend.sqlite import SqliteBackend
+from todayi.backend.sqlite_core import SqliteCoreBackend
+from todayi.model.entry import Entry
+from todayi.model.tag import Tag
+
+
+backends = [SqliteBackend, SqliteCoreBackend]
+
+"""
+Min throughput of parallel writers, relative to a single writer
+"""
+min_throughput_ratio = 1 / 3
+
+
+def _write(cls, db_path, writes, barrier, failures, locked):
+    backend = cls(db_path)
+    barrier.wait()
+    for i in range(writes):
+        try:
+            backend.write_entry(Entry("did {}".format(i), tags=[Tag("a"), Tag("b")]))
+        except Exception as e:
+            with failures.get_lock():
+                failures.value += 1
+            if "database is locked" in str(e):
+                with locked.get_lock():
+                    locked.value += 1
+    backend.close()
+
+
+def _write_in_parallel(cls, db_path, writers, writes):
+    context = multiprocessing.get_context("fork")
+    barrier = context.Barrier(writers + 1)
+    failures = context.Value("i", 0)
+    locked = context.Value("i", 0)
+    processes = [
+        context.Process(
+            target=_write, args=(cls, db_path, writes, barrier, failures, locked)
+        )
+        for _ in range(writers)
+    ]
+    for process in processes:
+        process.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for process in processes:
+        process.join()
+    throughput = writers * writes / (time.perf_counter() - start)
+    return throughput, failures.value, locked.value
+
+
+def _count(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("cls", backends)
+def test_parallel_writers(tmp_path, cls):
+    writes = 50
+    single_path = str(tmp_path / "single.db")
+    cls(single_path).close()
+    single_throughput, failed, _ = _write_in_parallel(cls, single_path, 1, writes)
+    assert failed == 0
+
+    # New tags are written by every writer at once. No write may
+    # fail with the db locked once retries are exhausted
+    db_path = str(tmp_path / "todayi.db")
+    cls(db_path).close()
+    throughput, failed, locked = _write_in_parallel(cls, db_path, 6, writes)
+    assert locked == 0
+    assert failed == 0
+    assert _count(db_path) == 6 * writes
+    # Writes are serialized by sqlite, so throughput stays about
+    # flat rather than scaling with writers, but waiting on locks
+    # does not collapse it. The bound is loose, for noisy machines.
+    # Throughput is compared closely by `benchmarks.concurrency`
+    assert throughput > single_throughput * min_throughput_ratio
+
+
+@pytest.mark.parametrize("cls", backends)
+def test_writes_wait_for_locks(tmp_path, cls):
+    db_path = str(tmp_path / "todayi.db")
+    backend = cls(db_path, busy_timeout_ms=5000)
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    locker = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+    locker.execute("BEGIN IMMEDIATE")
+    locker.execute("INSERT INTO tags (name, uuid) VALUES ('held', 'uuid')")
+    # Readers are not blocked by the writer holding the lock
+    assert backend.read_entries(EntryFilterSettings()) == []
+    release = threading.Timer(0.3, locker.execute, args=("COMMIT",))
+    release.start()
+    backend.write_entry(Entry("waited", tags=[Tag("held")]))
+    release.join()
+    assert _count(db_path) == 1
+    backend.close()
+
+
+def test_retry_when_locked(monkeypatch):
+    monkeypatch.setattr(concurrency, "_retry_backoff", 0)
+    calls = []
+
+    @retry_when_locked
+    def locked_twice():
+        calls.append(1)
+        if len(calls) < 3:
+            raise sqlite3.OperationalError("database is locked")
+        return "written"
+
+    assert locked_twice() == "written"
+    assert len(calls) == 3
+
+    @retry_when_locked
+    def always_locked():
+        calls.append(1)
+        raise sqlite3.OperationalError("database is locked")
+
+    del calls[:]
+    with pytest.raises(sqlite3.OperationalError):
+        always_locked()
+    assert len(calls) == concurrency._retry_attempts
+
+    @retry_when_locked
+    def broken():
+        calls.append(1)
+        raise sqlite3.OperationalError("no such table: entries")
+
+    del calls[:]
+    with pytest.raises(sqlite3.OperationalError):
+        broken()
+    assert len(calls) == 1
+
+
+def test_replace_db_drops_wal(tmp_path):
+    db_path = str(tmp_path / "todayi.db")
+    backend = SqliteCoreBackend(db_path)
+    backend.write_entry(Entry("local"))
+    # Kept open, so the write is still only in the wal
+    assert os.path.getsize(db_path + "-wal") > 0
+
+    pulled_path = str(tmp_path / "pulled.db")
+    pulled = SqliteCoreBackend(pulled_path)
+    pulled.write_entries([Entry("pulled"), Entry("pulled too")])
+    pulled.close()
+
+    backup_path = str(tmp_path / "backup.db")
+    replace_db(pulled_path, db_path, backup_path)
+    backend.close()
+    assert not os.path.exists(db_path + "-wal")
+    assert _count(db_path) == 2
+    assert _count(backup_path) == 1
@@ -0,0 +1,158 @@
+import json
+import multiprocessing
+import os
+
+import pytest
+
+from todayi import config
+from todayi.backend import journal
+from todayi.backend.sqlite import SqliteBackend
+from todayi.backend.sqlite_core import SqliteCoreBackend
+from todayi.controller import Controller
+from todayi.importer import entry_from_dict
+from todayi.model.entry import Entry
+from todayi.model.tag import Tag
+
+
+backends = [SqliteBackend, SqliteCoreBackend]
+
+
+def _append(path, writes, fsync):
+    for i in range(writes):
+        journal.append(path, Entry("did {}".format(i), tags=[Tag("a")]), fsync=fsync)
+
+
+@pytest.mark.parametrize("cls", backends)
+def test_compact_writes_entries(tmp_path, cls):
+    db_path = str(tmp_path / "todayi.db")
+    path = journal.journal_path(db_path)
+    backend = cls(db_path)
+    assert journal.compact(path, backend) == 0
+
+    entry = Entry("did x", tags=[Tag("a"), Tag("b")])
+    journal.append(path, entry)
+    journal.append(path, Entry("did y"), fsync=False)
+    assert journal.has_pending(path)
+    assert backend.read_entries() == []
+
+    assert journal.compact(path, backend) == 2
+    assert not journal.has_pending(path)
+    entries = backend.read_entries()
+    assert [e.content for e in entries] == ["did x", "did y"]
+    assert entries[0].uuid == entry.uuid
+    assert entries[0].created_at == entry.created_at
+    assert sorted(t.name for t in entries[0].tags) == ["a", "b"]
+    assert journal.compact(path, backend) == 0
+    backend.close()
+
+
+@pytest.mark.parametrize("cls", backends)
+def test_compact_leftover_journal(tmp_path, cls):
+    db_path = str(tmp_path / "todayi.db")
+    path = journal.journal_path(db_path)
+    backend = cls(db_path)
+    journal.append(path, Entry("did x"))
+    journal.append(path, Entry("did y"))
+
+    # Compaction that wrote its entries, then stopped before
+    # removing the journal
+    leftover = path + journal._compacting_suffix
+    os.rename(path, leftover)
+    with open(leftover) as f:
+        backend.write_entries(entry_from_dict(json.loads(line)) for line in f)
+    journal.append(path, Entry("did z"))
+
+    assert journal.compact(path, backend) == 1
+    assert sorted(e.content for e in backend.read_entries()) == [
+        "did x",
+        "did y",
+        "did z",
+    ]
+    assert not journal.has_pending(path)
+    backend.close()
+
+
+def test_compact_skips_cut_short_line(tmp_path):
+    db_path = str(tmp_path / "todayi.db")
+    path = journal.journal_path(db_path)
+    journal.append(path, Entry("did x"))
+    with open(path, "a") as f:
+        f.write('{"content": "did')
+    backend = SqliteCoreBackend(db_path)
+    assert journal.compact(path, backend) == 1
+    assert [e.content for e in backend.read_entries()] == ["did x"]
+    backend.close()
+
+
+def test_parallel_appends(tmp_path):
+    db_path = str(tmp_path / "todayi.db")
+    path = journal.journal_path(db_path)
+    backend = SqliteCoreBackend(db_path)
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(target=_append, args=(path, 50, False)) for _ in range(4)
+    ]
+    for process in processes:
+        process.start()
+    compacted = 0
+    while any(p.is_alive() for p in processes):
+        compacted += journal.compact(path, backend)
+    for process in processes:
+        process.join()
+    compacted += journal.compact(path, backend)
+    assert compacted == 200
+    assert len(backend.read_entries()) == 200
+    backend.close()
+
+
+@pytest.fixture
+def controller(tmp_path, monkeypatch):
+    config_path = tmp_path / "todayi.config"
+    config_path.write_text(
+        json.dumps(
+            {
+                "backend": "sqlite_core",
+                "backend_dir": str(tmp_path / "todayi"),
+                "write_mode": "journal",
+                "journal_fsync": "false",
+            }
+        )
+    )
+    monkeypatch.setattr(config, "_config", config.Config(str(config_path)))
+    return Controller()
+
+
+def test_controller_journal_write_mode(controller, tmp_path, capsys):
+    controller.write_entry("did x", ["a"])
+    assert controller._cached_backend is None
+    assert os.path.exists(controller._journal_path)
+
+    controller.print_stats()
+    assert "a" in capsys.readouterr().out
+    assert not journal.has_pending(controller._journal_path)
+    assert [e.content for e in controller._backend.read_entries()] == ["did x"]
+
+
+def test_controller_invalid_write_mode(controller):
+    config.set("write_mode", "xyz")
+    with pytest.raises(config.InvalidConfigError):
+        controller.write_entry("did x")
+
+
+def test_controller_pull_compacts_journal_first(controller):
+    class Remote:
+        def pull(self, backup=False):
+            self.pending = journal.has_pending(controller._journal_path)
+
+    controller._cached_remote = remote = Remote()
+    controller.write_entry("did x")
+    controller.pull_remote()
+    assert remote.pending is False
+
+
+def test_append_without_fcntl(tmp_path, monkeypatch):
+    monkeypatch.setattr(journal, "fcntl", None)
+    path = journal.journal_path(str(tmp_path / "todayi.db"))
+    with pytest.raises(ImportError):
+        journal.append(path, Entry("did x"))
+    assert not journal.has_pending(path)
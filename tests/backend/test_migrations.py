@@ -0,0 +1,89 @@
+import sqlite3
+
+import pytest
+
+from todayi.backend.migrations import (
+    _baseline,
+    latest_version,
+    migrate,
+    schema_version,
+)
+from todayi.backend.sqlite import SqliteBackend
+from todayi.backend.sqlite_core import SqliteCoreBackend
+
+
+def _legacy_db(db_path):
+    conn = sqlite3.connect(str(db_path))
+    for statement in _baseline:
+        conn.execute(statement)
+    conn.executemany(
+        "INSERT INTO tags (id, name, uuid) VALUES (?, ?, ?)",
+        [(1, "a", "t1"), (2, "b", "t2"), (3, "a", "t3")],
+    )
+    conn.executemany(
+        "INSERT INTO entries (id, content, uuid, created_at) VALUES (?, ?, ?, ?)",
+        [
+            (1, "Entry 1", "dup", "2020-12-21 12:00:00.000000"),
+            (2, "Entry 2", "dup", "2020-12-22 12:00:00.000000"),
+        ],
+    )
+    conn.executemany(
+        "INSERT INTO entries_tags_associations (entry_id, tag_id) VALUES (?, ?)",
+        [(1, 1), (1, 3), (2, 2), (2, 3)],
+    )
+    conn.commit()
+    return conn
+
+
+def _index_names(conn):
+    rows = conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+    return set(r[0] for r in rows)
+
+
+@pytest.mark.parametrize("backend_class", [SqliteBackend, SqliteCoreBackend])
+def test_migrate_legacy_db_in_place(tmp_path, backend_class):
+    db_path = tmp_path / "todayi.db"
+    conn = _legacy_db(db_path)
+    assert schema_version(conn) == 0
+
+    backend_class(str(db_path))
+
+    assert schema_version(conn) == latest_version()
+    assert {
+        "ix_entries_created_at",
+        "ux_entries_uuid",
+        "ux_tags_name",
+        "ux_entries_tags_associations_tag_entry",
+    } <= _index_names(conn)
+    assert conn.execute("SELECT id, name FROM tags ORDER BY id").fetchall() == [
+        (1, "a"),
+        (2, "b"),
+    ]
+    associations = conn.execute(
+        "SELECT entry_id, tag_id FROM entries_tags_associations "
+        "ORDER BY entry_id, tag_id"
+    ).fetchall()
+    assert associations == [(1, 1), (2, 1), (2, 2)]
+    uuids = [r[0] for r in conn.execute("SELECT uuid FROM entries ORDER BY id")]
+    assert uuids[0] == "dup"
+    assert uuids[1] != "dup"
+    assert conn.execute("SELECT * FROM daily_tag_counts ORDER BY day").fetchall() == [
+        ("2020-12-21", 1, 1),
+        ("2020-12-22", 1, 1),
+        ("2020-12-22", 2, 1),
+    ]
+
+
+def test_migrate_is_idempotent(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "todayi.db"))
+    assert migrate(conn) == latest_version()
+    assert migrate(conn) == 0
+    assert schema_version(conn) == latest_version()
+
+
+def test_unique_entry_uuid(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "todayi.db"))
+    migrate(conn)
+    conn.execute("INSERT INTO entries (content, uuid) VALUES ('a', 'same')")
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute("INSERT INTO entries (content, uuid) VALUES ('b', 'same')")
@@ -0,0 +1,63 @@
+import sqlite3
+
+import pytest
+
+from todayi.backend.profiles import apply_profile, storage_profiles
+from todayi.backend.sqlite import SqliteBackend
+from todayi.backend.sqlite_core import SqliteCoreBackend
+from todayi.model.entry import Entry
+
+
+def _pragma(conn, pragma):
+    return conn.execute("PRAGMA {}".format(pragma)).fetchone()[0]
+
+
+def test_apply_profile_sets_pragmas(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "todayi.db"))
+    apply_profile(conn, "throughput")
+    assert _pragma(conn, "journal_mode") == "wal"
+    assert _pragma(conn, "synchronous") == 1
+    assert _pragma(conn, "cache_size") == storage_profiles["throughput"]["cache_size"]
+    assert _pragma(conn, "page_size") == 4096
+    conn.close()
+
+
+def test_apply_profile_keeps_page_size_of_existing_db(tmp_path):
+    db_path = str(tmp_path / "todayi.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA page_size = 8192")
+    conn.execute("CREATE TABLE t (x)")
+    conn.commit()
+    conn.close()
+    conn = sqlite3.connect(db_path)
+    apply_profile(conn, "durable")
+    assert _pragma(conn, "page_size") == 8192
+    assert _pragma(conn, "journal_mode") == "wal"
+    conn.close()
+
+
+def test_apply_profile_invalid():
+    conn = sqlite3.connect(":memory:")
+    with pytest.raises(KeyError):
+        apply_profile(conn, "xyz")
+
+
+@pytest.mark.parametrize("cls", [SqliteBackend, SqliteCoreBackend])
+@pytest.mark.parametrize("profile,synchronous", [("durable", 2), ("throughput", 1)])
+def test_backend_profile(tmp_path, cls, profile, synchronous):
+    backend = cls(str(tmp_path / "todayi.db"), storage_profile=profile)
+    backend.write_entry(Entry("did x"))
+    if cls is SqliteBackend:
+        conn = backend._session.connection().connection
+    else:
+        conn = backend._conn
+    assert _pragma(conn, "synchronous") == synchronous
+    assert _pragma(conn, "journal_mode") == "wal"
+    assert len(backend.read_entries()) == 1
+    backend.close()
+
+
+@pytest.mark.parametrize("cls", [SqliteBackend, SqliteCoreBackend])
+def test_backend_invalid_profile(tmp_path, cls):
+    with pytest.raises(KeyError):
+        cls(str(tmp_path / "todayi.db"), storage_profile="xyz")
@@ -0,0 +1,71 @@
+from datetime import datetime
+import json
+import sqlite3
+
+from todayi.backend.filter import EntryFilterSettings
+from todayi.backend.shards import export_shards, import_shards
+from todayi.backend.sqlite_core import SqliteCoreBackend
+from todayi.model.entry import Entry
+from todayi.model.tag import Tag
+
+
+def _contents(backend):
+    entries = backend.read_entries(EntryFilterSettings(order_by="created_at"))
+    return [(e.content, e.created_at.month, [t.name for t in e.tags]) for e in entries]
+
+
+def test_export_import_changed_shards(tmp_path):
+    shards = str(tmp_path / "journal")
+    a = SqliteCoreBackend(str(tmp_path / "a.db"))
+    a.write_entries(
+        [
+            Entry("Jan", uuid="jan", tags=[Tag("x")], created_at=datetime(2021, 1, 5)),
+            Entry("Feb", uuid="feb", tags=[Tag("y")], created_at=datetime(2021, 2, 5)),
+            Entry("Mar", uuid="mar", created_at=datetime(2021, 3, 5)),
+        ]
+    )
+    assert export_shards(a._conn, shards) == ["2021-01", "2021-02", "2021-03"]
+    assert export_shards(a._conn, shards) == []
+    line = (tmp_path / "journal" / "2021-01.jsonl").read_text()
+    assert json.loads(line)["tags"] == ["x"]
+
+    b = SqliteCoreBackend(str(tmp_path / "b.db"))
+    b.write_entry(Entry("Local only", created_at=datetime(2021, 4, 1)))
+    assert import_shards(b._conn, shards) == [
+        "2021-01",
+        "2021-02",
+        "2021-03",
+        "2021-04",
+    ]
+    assert _contents(b) == _contents(a)
+    assert import_shards(b._conn, shards) == []
+    assert export_shards(b._conn, shards) == []
+
+    # Edit, move, delete and add entries, touching only some months
+    conn = sqlite3.connect(str(tmp_path / "a.db"))
+    with conn:
+        conn.execute("UPDATE entries SET content = 'Jan!' WHERE uuid = 'jan'")
+        conn.execute(
+            "UPDATE entries SET created_at = '2021-05-05 00:00:00.000000' "
+            "WHERE uuid = 'feb'"
+        )
+    a.write_entry(Entry("Mar 2", tags=[Tag("x")], created_at=datetime(2021, 3, 6)))
+    assert export_shards(a._conn, shards) == [
+        "2021-01",
+        "2021-03",
+        "2021-05",
+        "2021-02",
+    ]
+    assert not (tmp_path / "journal" / "2021-02.jsonl").exists()
+    assert import_shards(b._conn, shards) == [
+        "2021-01",
+        "2021-02",
+        "2021-03",
+        "2021-05",
+    ]
+    assert _contents(b) == [
+        ("Jan!", 1, ["x"]),
+        ("Mar", 3, []),
+        ("Mar 2", 3, ["x"]),
+        ("Feb", 5, ["y"]),
+    ]
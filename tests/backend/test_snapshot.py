@@ -0,0 +1,39 @@
+import os
+import sqlite3
+
+import pytest
+
+from todayi.backend.snapshot import snapshot_file
+
+
+def test_snapshot_is_consistent_and_compact(tmp_path):
+    db_path = str(tmp_path / "todayi.db")
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute("CREATE TABLE t (v)")
+        conn.executemany(
+            "INSERT INTO t VALUES (?)", (("x" * 100,) for _ in range(10000))
+        )
+        conn.execute("DELETE FROM t WHERE rowid > 100")
+
+    # A write in progress is neither blocked nor included
+    writer = sqlite3.connect(db_path, isolation_level=None)
+    writer.execute("BEGIN IMMEDIATE")
+    writer.execute("INSERT INTO t VALUES ('uncommitted')")
+    with snapshot_file(db_path) as snapshot_path:
+        writer.execute("COMMIT")
+        snapshot = sqlite3.connect(snapshot_path)
+        assert snapshot.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 100
+        assert snapshot.execute("PRAGMA freelist_count").fetchone()[0] == 0
+        snapshot.close()
+        assert os.path.getsize(snapshot_path) < os.path.getsize(db_path) / 10
+    assert not os.path.exists(snapshot_path)
+    assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 101
+
+
+def test_snapshot_of_missing_db(tmp_path):
+    db_path = str(tmp_path / "todayi.db")
+    with pytest.raises(FileNotFoundError):
+        with snapshot_file(db_path):
+            pass
+    assert not os.path.exists(db_path)
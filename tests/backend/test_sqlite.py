@@ -1,10 +1,33 @@
 from datetime import datetime, timedelta
 
+import pytest
+from sqlalchemy import event
+
 from todayi.backend.sqlite import SqliteBackend, SqliteEntry, SqliteTag
+from todayi.backend.sqlite_core import SqliteCoreBackend
 from todayi.backend.filter import EntryFilterSettings
+from todayi.model.entry import Entry
 from todayi.model.tag import Tag
 
 
+"""
+Both sqlite backends share a schema, and must behave the same
+through the `todayi.backend.base.Backend` interface.
+"""
+backends = [SqliteBackend, SqliteCoreBackend]
+
+
+@pytest.fixture(params=backends, ids=lambda cls: cls.__name__)
+def backend(request):
+    return request.param(":memory:")
+
+
+def _scalar(backend, sql):
+    if isinstance(backend, SqliteBackend):
+        return backend._session.execute(sql).scalar()
+    return backend._conn.execute(sql).fetchone()[0]
+
+
 def test_reconcile_tags():
     backend = SqliteBackend(":memory:")
     session = backend._session
@@ -106,12 +129,12 @@ def test_read_entries_datetime_filtering():
     entries = [
         SqliteEntry(
             content="Early entry",
-            uuid="r",
+            uuid="r1",
             created_at=datetime.now() - timedelta(days=5),
         ),
         SqliteEntry(
             content="Later entry",
-            uuid="r",
+            uuid="r2",
             created_at=datetime.now() - timedelta(days=1),
         ),
     ]
@@ -127,3 +150,419 @@ def test_read_entries_datetime_filtering():
     )
     assert len(late) == 1
     assert late[0].content == "Later entry"
+
+
+def test_reconcile_tags_core():
+    backend = SqliteCoreBackend(":memory:")
+    backend.write_entry(Entry("Entry", tags=[Tag("hello", uuid="abc")]))
+    reconciled = backend.reconcile_tags([Tag("hello", uuid="123"), Tag("abc", "234")])
+    assert [(t.name, t.uuid) for t in reconciled] == [("hello", "abc"), ("abc", "234")]
+
+
+def test_read_entries_filtering_core():
+    backend = SqliteCoreBackend(":memory:")
+    backend.write_entries(
+        [
+            Entry("Entry 1", tags=[Tag("a"), Tag("b")]),
+            Entry("Entry 2", tags=[Tag("c"), Tag("d")]),
+            Entry("Early entry", created_at=datetime.now() - timedelta(days=5)),
+        ]
+    )
+
+    def contents(**settings):
+        entries = backend.read_entries(EntryFilterSettings(**settings))
+        return sorted(e.content for e in entries)
+
+    assert contents(without_tags=[Tag("a"), Tag("b")]) == ["Early entry", "Entry 2"]
+    assert contents(with_tags=[Tag("c"), Tag("d")]) == ["Entry 2"]
+    assert contents(with_tags=[Tag("b")], without_tags=[Tag("a")]) == []
+    assert contents(content_contains="entry") == [
+        "Early entry",
+        "Entry 1",
+        "Entry 2",
+    ]
+    assert contents(content_equals="Entry 1") == ["Entry 1"]
+    assert contents(content_contains="entry", content_not_equals="Entry 2") == [
+        "Early entry",
+        "Entry 1",
+    ]
+    assert contents(before=datetime.now() - timedelta(days=4)) == ["Early entry"]
+    assert contents(after=datetime.now() - timedelta(days=2)) == ["Entry 1", "Entry 2"]
+
+
+@pytest.mark.parametrize("cls", backends)
+def test_write_entries_batches(cls):
+    backend = cls(":memory:")
+    created_at = datetime.now() - timedelta(days=3)
+    entries = (
+        Entry(
+            "Entry {}".format(i),
+            uuid="uuid{}".format(i),
+            tags=[Tag("a"), Tag("b{}".format(i % 2))],
+            created_at=created_at,
+        )
+        for i in range(5)
+    )
+    assert backend.write_entries(entries, batch_size=2) == 5
+    res = backend.read_entries(EntryFilterSettings())
+    assert len(res) == 5
+    assert all(e.created_at == created_at for e in res)
+    assert _scalar(backend, "SELECT COUNT(*) FROM tags") == 3
+    b1 = backend.read_entries(EntryFilterSettings(with_tags=[Tag("b1")]))
+    assert sorted(e.content for e in b1) == ["Entry 1", "Entry 3"]
+
+
+def _count_statements(backend):
+    statements = []
+    if isinstance(backend, SqliteBackend):
+        event.listen(
+            backend._engine,
+            "before_cursor_execute",
+            lambda conn, cursor, statement, *args: statements.append(statement),
+        )
+    else:
+        backend._conn.set_trace_callback(statements.append)
+    return statements
+
+
+def test_reconcile_tags_constant_statements():
+    backend = SqliteBackend(":memory:")
+    backend.reconcile_tags([Tag("existing")])
+    backend._invalidate_tag_cache()
+    statements = _count_statements(backend)
+    tags = [Tag("existing")] + [Tag("new{}".format(i)) for i in range(50)]
+    reconciled = backend.reconcile_tags(tags)
+    assert [t.name for t in reconciled] == [t.name for t in tags]
+    assert len([s for s in statements if "tags" in s]) == 3
+    assert backend._session.query(SqliteTag).count() == 51
+
+    del statements[:]
+    backend.reconcile_tags(tags)
+    assert len([s for s in statements if "tags" in s]) == 0
+
+
+@pytest.mark.parametrize("cls", backends)
+def test_tag_cache_bounded(cls):
+    backend = cls(":memory:")
+    backend._tag_cache_size = 2
+    backend.reconcile_tags([Tag("a"), Tag("b"), Tag("c")])
+    assert list(backend._tag_cache.keys()) == ["b", "c"]
+
+
+@pytest.mark.parametrize("cls", backends)
+def test_tag_filtering_single_statement_without_side_effects(cls):
+    backend = cls(":memory:")
+    backend.write_entries(
+        Entry("Entry {}".format(i), tags=[Tag("a"), Tag("b{}".format(i % 3))])
+        for i in range(30)
+    )
+    statements = _count_statements(backend)
+    res = backend.read_entries(
+        EntryFilterSettings(
+            with_tags=[Tag("a"), Tag("b1")],
+            without_tags=[Tag("b2"), Tag("missing")],
+        )
+    )
+    assert len(res) == 10
+    # One statement for matching entries, one to load their tags
+    assert len(statements) == 2
+    none = backend.read_entries(EntryFilterSettings(with_tags=[Tag("unknown")]))
+    assert len(none) == 0
+    assert _scalar(backend, "SELECT COUNT(*) FROM tags WHERE name = 'unknown'") == 0
+    assert _scalar(backend, "SELECT COUNT(*) FROM tags WHERE name = 'missing'") == 0
+
+
+@pytest.mark.parametrize("cls", backends)
+def test_read_entries_constant_statements(cls):
+    backend = cls(":memory:")
+    statements = _count_statements(backend)
+    statement_counts = []
+    for n in [10, 100, 1000]:
+        backend.write_entries(
+            Entry("Entry {}".format(i), tags=[Tag("n{}".format(n)), Tag("x")])
+            for i in range(n)
+        )
+        del statements[:]
+        entries = backend.read_entries(
+            EntryFilterSettings(with_tags=[Tag("n{}".format(n))])
+        )
+        assert len(entries) == n
+        assert all(isinstance(t, Tag) for e in entries for t in e.tags)
+        assert [t.name for t in entries[0].tags] == ["n{}".format(n), "x"]
+        statement_counts.append(len(statements))
+    assert statement_counts == [2, 2, 2]
+
+
+@pytest.mark.parametrize("cls", backends)
+def test_iter_entries_chunks(cls):
+    backend = cls(":memory:")
+    start = datetime.now() - timedelta(days=1)
+    backend.write_entries(
+        Entry(
+            "Entry {}".format(i),
+            tags=[Tag("t{}".format(i % 3))],
+            created_at=start - timedelta(minutes=i),
+        )
+        for i in range(25)
+    )
+    statements = _count_statements(backend)
+    entries = backend.iter_entries(EntryFilterSettings(), chunk_size=10)
+    first = next(entries)
+    assert first.content == "Entry 24"
+    assert [t.name for t in first.tags] == ["t0"]
+    rest = list(entries)
+    assert len(rest) == 24
+    assert all(a.created_at <= b.created_at for a, b in zip(rest, rest[1:]))
+    # One statement for entries, and one per chunk for tags
+    assert len(statements) == 4
+
+
+@pytest.mark.parametrize("cls", backends)
+def test_read_entries_order_limit_offset(cls):
+    backend = cls(":memory:")
+    start = datetime.now() - timedelta(days=1)
+    backend.write_entries(
+        Entry("Entry {}".format(i), created_at=start + timedelta(minutes=i))
+        for i in range(20)
+    )
+    statements = _count_statements(backend)
+    latest = backend.read_entries(
+        EntryFilterSettings(order_by="created_at", descending=True, limit=3, offset=1)
+    )
+    assert [e.content for e in latest] == ["Entry 18", "Entry 17", "Entry 16"]
+    assert "ORDER BY entries.created_at DESC" in statements[0]
+    assert "LIMIT" in statements[0]
+
+    oldest = list(backend.iter_entries(EntryFilterSettings(limit=2), chunk_size=1))
+    assert [e.content for e in oldest] == ["Entry 0", "Entry 1"]
+
+    with pytest.raises(KeyError):
+        backend.read_entries(EntryFilterSettings(order_by="uuid"))
+
+
+def _search_backend(cls):
+    backend = cls(":memory:")
+    backend.write_entries(
+        [
+            Entry("Fixed terraform state for gcp", uuid="1"),
+            Entry("Terraform terraform terraform", uuid="2"),
+            Entry("Reviewed gcp billing", uuid="3"),
+            Entry("Wrote terraforming notes", uuid="4"),
+        ]
+    )
+    return backend
+
+
+def _search(backend, search, mode="word"):
+    entries = backend.read_entries(EntryFilterSettings(search=search, search_mode=mode))
+    return [e.uuid for e in entries]
+
+
+@pytest.mark.parametrize("cls", backends)
+def test_search_full_text(cls):
+    backend = _search_backend(cls)
+    assert backend._has_fts is True
+    assert _search(backend, "terraform") == ["2", "1"]
+    assert _search(backend, "terraform gcp") == ["1"]
+    assert sorted(_search(backend, "terra", mode="prefix")) == ["1", "2", "4"]
+    assert _search(backend, "gcp billing", mode="phrase") == ["3"]
+    assert _search(backend, "billing gcp", mode="phrase") == []
+    assert _search(backend, 'gcp" OR "wrote') == []
+
+
+@pytest.mark.parametrize("cls", backends)
+def test_search_fallback_without_fts(cls):
+    backend = _search_backend(cls)
+    backend._has_fts = False
+    assert sorted(_search(backend, "terraform gcp")) == ["1"]
+    assert sorted(_search(backend, "terra", mode="prefix")) == ["1", "2", "4"]
+    assert _search(backend, "gcp billing", mode="phrase") == ["3"]
+
+
+@pytest.mark.parametrize("cls", backends)
+def test_content_contains_trigram(cls):
+    backend = _search_backend(cls)
+    assert backend._has_trigram is True
+    statements = _count_statements(backend)
+    entries = backend.read_entries(EntryFilterSettings(content_contains="RAFORM"))
+    assert sorted(e.uuid for e in entries) == ["1", "2", "4"]
+    assert "entries_trigram" in statements[0]
+    entries = backend.read_entries(EntryFilterSettings(content_not_contains="gcp"))
+    assert sorted(e.uuid for e in entries) == ["2", "4"]
+
+
+def test_write_entries_rolls_back_batch(backend):
+    with pytest.raises(Exception):
+        backend.write_entries(
+            [
+                Entry("Entry 1", uuid="same", tags=[Tag("new")]),
+                Entry("Entry 2", uuid="same"),
+            ]
+        )
+    assert _scalar(backend, "SELECT COUNT(*) FROM entries") == 0
+    assert _scalar(backend, "SELECT COUNT(*) FROM tags") == 0
+    backend.write_entry(Entry("Entry 3", tags=[Tag("new")]))
+    assert [t.name for t in backend.read_entries(EntryFilterSettings())[0].tags] == [
+        "new"
+    ]
+
+
+def test_aggregate(backend):
+    backend.write_entries(
+        [
+            Entry("a", tags=[Tag("x"), Tag("y")], created_at=datetime(2020, 12, 31)),
+            Entry("b", tags=[Tag("x")], created_at=datetime(2021, 1, 3, 23)),
+            Entry("c", created_at=datetime(2021, 1, 4)),
+            Entry("d", tags=[Tag("y"), Tag("z")], created_at=datetime(2021, 2, 1)),
+        ]
+    )
+    statements = _count_statements(backend)
+    assert backend.aggregate(group_by="tag") == [("x", 2), ("y", 2), ("z", 1)]
+    assert len(statements) == 1
+    assert backend.aggregate(group_by="day") == [
+        ("2020-12-31", 1),
+        ("2021-01-03", 1),
+        ("2021-01-04", 1),
+        ("2021-02-01", 1),
+    ]
+    # 2021-01-03 is a sunday, so falls within the last ISO week of 2020
+    assert backend.aggregate(group_by="week") == [
+        ("2020-W53", 2),
+        ("2021-W01", 1),
+        ("2021-W05", 1),
+    ]
+    assert backend.aggregate(group_by="month") == [
+        ("2020-12", 1),
+        ("2021-01", 2),
+        ("2021-02", 1),
+    ]
+    filtered = EntryFilterSettings(
+        after=datetime(2021, 1, 1), without_tags=[Tag("z")], limit=1
+    )
+    assert backend.aggregate(filtered, group_by="tag") == [("x", 1)]
+    with pytest.raises(KeyError):
+        backend.aggregate(group_by="year")
+
+
+def _execute(backend, sql):
+    if isinstance(backend, SqliteBackend):
+        backend._session.execute(sql)
+        backend._session.commit()
+    else:
+        with backend._conn:
+            backend._conn.execute(sql)
+
+
+def _seed_days(backend):
+    start = datetime(2020, 12, 1)
+    backend.write_entries(
+        Entry(
+            "Entry {}".format(i),
+            tags=[Tag("t{}".format(i % 3)), Tag("all")],
+            created_at=start + timedelta(hours=7 * i),
+        )
+        for i in range(300)
+    )
+
+
+def test_aggregate_reads_rollups(backend):
+    _seed_days(backend)
+    filters = [
+        EntryFilterSettings(),
+        EntryFilterSettings(after=datetime(2020, 12, 10)),
+        EntryFilterSettings(
+            after=datetime(2020, 12, 10, 5), before=datetime(2021, 1, 20, 13)
+        ),
+        EntryFilterSettings(before=datetime(2021, 1, 1), limit=2, offset=1),
+    ]
+    for entry_filter in filters:
+        for group_by in ["tag", "day", "week", "month"]:
+            statements = _count_statements(backend)
+            counts = backend.aggregate(entry_filter, group_by=group_by)
+            assert any("daily_" in s for s in statements)
+            assert counts == backend._aggregate_entries(entry_filter, group_by)
+            del statements[:]
+
+
+def test_rollups_follow_deletes_and_rebuild(backend):
+    _seed_days(backend)
+    _execute(backend, "DELETE FROM entries WHERE content LIKE 'Entry 1%'")
+    expected = backend._aggregate_entries(EntryFilterSettings(), "tag")
+    assert backend.aggregate(group_by="tag") == expected
+    assert _scalar(backend, "SELECT SUM(count) FROM daily_counts") == 189
+
+    _execute(backend, "UPDATE daily_tag_counts SET count = 99")
+    assert backend.aggregate(group_by="tag") != expected
+    backend.rebuild_rollups()
+    assert backend.aggregate(group_by="tag") == expected
+
+
+def test_backends_share_db(tmp_path):
+    db_path = str(tmp_path / "todayi.db")
+    created_at = datetime(2020, 12, 21, 12, 23, 1, 5)
+    SqliteBackend(db_path).write_entry(
+        Entry("From orm", tags=[Tag("a")], created_at=created_at)
+    )
+    core = SqliteCoreBackend(db_path)
+    core.write_entry(
+        Entry("From core", tags=[Tag("a")], created_at=created_at + timedelta(days=1))
+    )
+    for backend in [SqliteBackend(db_path), core]:
+        entries = backend.read_entries(
+            EntryFilterSettings(with_tags=[Tag("a")], order_by="created_at")
+        )
+        assert [e.content for e in entries] == ["From orm", "From core"]
+        assert entries[0].created_at == created_at
+        after = backend.read_entries(EntryFilterSettings(after=created_at))
+        assert len(after) == 2
+        assert _scalar(backend, "SELECT COUNT(*) FROM tags") == 1
+
+
+def test_merge(backend, tmp_path):
+    day = datetime(2020, 12, 21, 12)
+    backend.write_entries(
+        [
+            Entry("Shared, local", uuid="shared", tags=[Tag("a")], created_at=day),
+            Entry("Local", tags=[Tag("a"), Tag("b")], created_at=day),
+        ]
+    )
+    other_path = str(tmp_path / "other.db")
+    SqliteCoreBackend(other_path).write_entries(
+        [
+            Entry("Shared, other", uuid="shared", tags=[Tag("c")], created_at=day),
+            Entry("Other", tags=[Tag("b"), Tag("c")], created_at=day),
+            Entry("Other untagged", created_at=day + timedelta(days=1)),
+        ]
+    )
+
+    added = backend.merge(other_path)
+    assert added == {"tags": 1, "entries": 2, "tag_associations": 2}
+    entries = backend.read_entries(EntryFilterSettings(order_by="created_at"))
+    assert [(e.content, [t.name for t in e.tags]) for e in entries] == [
+        ("Shared, local", ["a"]),
+        ("Local", ["a", "b"]),
+        ("Other", ["b", "c"]),
+        ("Other untagged", []),
+    ]
+    assert backend.aggregate(group_by="day") == [("2020-12-21", 3), ("2020-12-22", 1)]
+    assert [
+        e.content for e in backend.read_entries(EntryFilterSettings(search="other"))
+    ]
+    assert backend.merge(other_path) == {"tags": 0, "entries": 0, "tag_associations": 0}
+
+
+def test_merge_with_entry_without_uuid(backend, tmp_path):
+    day = datetime(2020, 12, 21, 12)
+    backend.write_entry(Entry("Legacy", tags=[Tag("a")], created_at=day))
+    # Entries written before uuids were have none
+    _execute(backend, "UPDATE entries SET uuid = NULL")
+    assert _scalar(backend, "SELECT COUNT(*) FROM entries WHERE uuid IS NULL") == 1
+    other_path = str(tmp_path / "other.db")
+    SqliteCoreBackend(other_path).write_entries(
+        [Entry("Other", tags=[Tag("b")], created_at=day)]
+    )
+
+    added = backend.merge(other_path)
+    assert added == {"tags": 1, "entries": 1, "tag_associations": 1}
+    entries = backend.read_entries(EntryFilterSettings(order_by="created_at"))
+    assert [e.content for e in entries] == ["Legacy", "Other"]
@@ -0,0 +1,34 @@
+from datetime import datetime, timedelta
+
+from todayi.frontend.md import MarkdownFrontend
+from todayi.model.entry import Entry
+from todayi.model.tag import Tag
+
+
+def _entries():
+    start = datetime(2020, 12, 21, 9, 30)
+    return [
+        Entry(
+            "Entry {}".format(i),
+            tags=[Tag("t{}".format(i % 2))],
+            created_at=start + timedelta(hours=10 * i),
+        )
+        for i in range(6)
+    ]
+
+
+def test_show_streams_same_content_as_to_string(tmp_path):
+    for grouping in MarkdownFrontend.allowed_section_groupings.keys():
+        output_file = tmp_path / "{}.md".format(grouping)
+        frontend = MarkdownFrontend(str(output_file), section_grouping=grouping)
+        frontend.show(iter(_entries()))
+        assert output_file.read_text() == frontend.to_string(_entries())
+
+
+def test_show_groups_by_date(tmp_path):
+    output_file = tmp_path / "report.md"
+    MarkdownFrontend(str(output_file)).show(iter(_entries()))
+    content = output_file.read_text()
+    assert content.startswith("## 12-21-2020:\n- 09:30 - Entry 0 - Tags: t0")
+    assert content.count("## ") == 3
+    assert not content.endswith("\n")
@@ -0,0 +1,545 @@
+import base64
+import gzip
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import io
+import json
+import os
+from pathlib import Path
+import sqlite3
+import threading
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import storage
+from google.resumable_media import DataCorruption
+import pytest
+
+from todayi.backend.snapshot import write_snapshot
+from todayi.remote.compression import (
+    CompressingReader,
+    DecompressingWriter,
+    IncompleteStreamError,
+    zstandard,
+)
+from todayi.remote.gcs import CorruptDownloadError, GcsRemote
+
+
+class FakeBlob:
+    def __init__(self, bucket, name, chunk_size=None):
+        self._bucket = bucket
+        self.name = name
+        self.chunk_size = chunk_size
+        self.generation = None
+        self.md5_hash = None
+        self.content_encoding = None
+        self.metadata = None
+
+    def upload_from_filename(self, filename):
+        self._upload(Path(filename).read_bytes())
+
+    def upload_from_file(self, f, content_type=None):
+        # Reads chunks as resumable uploads do, until a short read
+        data = b""
+        while True:
+            chunk = f.read(self.chunk_size)
+            data += chunk
+            if len(chunk) < self.chunk_size:
+                break
+        self._upload(data)
+
+    def _upload(self, data):
+        self._bucket.uploads.append(self.name)
+        self._bucket.put(self.name, data, self.content_encoding, self.metadata)
+        self.generation, self.md5_hash = self._bucket.metadata(self.name)
+
+    def download_to_filename(self, filename):
+        with open(filename, "wb") as f:
+            self.download_to_file(f)
+
+    def download_to_file(self, f, raw_download=False):
+        self._bucket.downloads.append(self.name)
+        f.write(self._bucket.objects[self.name][1])
+
+
+class FakeBucket:
+    def __init__(self):
+        self.objects = {}
+        self.generation = 0
+        self.uploads = []
+        self.downloads = []
+        self.metadata_requests = 0
+
+    def put(self, name, data, content_encoding=None, metadata=None):
+        self.generation += 1
+        self.objects[name] = (self.generation, data, content_encoding, metadata)
+
+    def metadata(self, name):
+        generation, data = self.objects[name][:2]
+        md5 = base64.b64encode(hashlib.md5(data).digest()).decode("ascii")
+        return generation, md5
+
+    def blob(self, name, chunk_size=None):
+        return FakeBlob(self, name, chunk_size)
+
+    def get_blob(self, name):
+        self.metadata_requests += 1
+        if name not in self.objects:
+            return None
+        blob = FakeBlob(self, name)
+        blob.generation, blob.md5_hash = self.metadata(name)
+        blob.content_encoding, blob.metadata = self.objects[name][2:]
+        return blob
+
+    def rename_blob(self, blob, new_name):
+        self.objects[new_name] = self.objects.pop(blob.name)
+
+
+class FakeGcsHandler(BaseHTTPRequestHandler):
+    """
+    Serves the subset of the GCS JSON API used by `GcsRemote`:
+    object metadata, multipart and resumable uploads, media
+    downloads, copies and deletes.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        path, query = self._split()
+        if path[:3] == ["download", "storage", "v1"]:
+            self._download(self._name(path[3:]))
+        else:
+            self.server.metadata_requests += 1
+            self._send_object(self._name(path[2:]))
+
+    def do_POST(self):
+        path, query = self._split()
+        body = self._body()
+        if "copyTo" in path:
+            i = path.index("copyTo")
+            source = self.server.objects[self._name(path[2:i])]
+            self.server.put(self._name(path[i + 1 :]), *source[1:])
+            self._send_object(self._name(path[i + 1 :]))
+        elif query["uploadType"] == ["multipart"]:
+            self.server.uploads.append("multipart")
+            metadata, data = _multipart_parts(self.headers["Content-Type"], body)
+            self._put(metadata, data)
+        else:
+            upload_id = str(len(self.server.sessions))
+            self.server.sessions[upload_id] = (json.loads(body.decode("utf-8")), b"")
+            self.send_response(200)
+            self.send_header(
+                "Location",
+                "{}{}&upload_id={}".format(self.server.url, self.path, upload_id),
+            )
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+    def do_PUT(self):
+        _, query = self._split()
+        upload_id = query["upload_id"][0]
+        self.server.uploads.append("resumable")
+        metadata, data = self.server.sessions[upload_id]
+        data += self._body()
+        self.server.sessions[upload_id] = (metadata, data)
+        # Content-Range is "bytes a-b/*" until the final chunk,
+        # which gives the total size
+        total = self.headers["Content-Range"].rsplit("/", 1)[1]
+        if total != "*" and int(total) == len(data):
+            self._put(metadata, data)
+            return
+        self.send_response(308)
+        if len(data) > 0:
+            self.send_header("Range", "bytes=0-{}".format(len(data) - 1))
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_DELETE(self):
+        path, _ = self._split()
+        self.server.objects.pop(self._name(path[2:]))
+        self.send_response(204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _split(self):
+        url = urlsplit(self.path)
+        return url.path.strip("/").split("/"), parse_qs(url.query)
+
+    def _name(self, path):
+        # path is b/{bucket}/o/{name}, with name quoted
+        return unquote(path[3])
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def _put(self, metadata, data):
+        self.server.put(
+            metadata["name"],
+            data,
+            metadata.get("contentEncoding"),
+            metadata.get("metadata"),
+        )
+        self._send_object(metadata["name"])
+
+    def _send_object(self, name):
+        if name not in self.server.objects:
+            self._send(404, json.dumps({"error": {"code": 404}}).encode("utf-8"))
+            return
+        generation, data, content_encoding, metadata = self.server.objects[name]
+        resource = {
+            "kind": "storage#object",
+            "name": name,
+            "bucket": "bucket",
+            "generation": str(generation),
+            "metageneration": "1",
+            "size": str(len(data)),
+            "md5Hash": _md5(data),
+        }
+        if content_encoding is not None:
+            resource["contentEncoding"] = content_encoding
+        if metadata is not None:
+            resource["metadata"] = metadata
+        self._send(200, json.dumps(resource).encode("utf-8"))
+
+    def _download(self, name):
+        self.server.downloads.append(name)
+        _, data, content_encoding, _ = self.server.objects[name]
+        headers = {"x-goog-hash": "md5={}".format(_md5(data))}
+        if content_encoding is not None:
+            headers["Content-Encoding"] = content_encoding
+        served = self.server.served.pop(name, data)
+        self._send(200, served, "application/octet-stream", headers)
+
+    def _send(self, status, body, content_type="application/json", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeGcsServer(ThreadingHTTPServer):
+    """
+    Local GCS endpoint, storing objects of a single bucket in
+    memory. `served` overrides the bytes sent for the next
+    download of an object, as if the transfer was corrupted.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeGcsHandler)
+        self.objects = {}
+        self.generation = 0
+        self.sessions = {}
+        self.served = {}
+        self.uploads = []
+        self.downloads = []
+        self.metadata_requests = 0
+
+    def put(self, name, data, content_encoding=None, metadata=None):
+        self.generation += 1
+        self.objects[name] = (self.generation, data, content_encoding, metadata)
+
+    @property
+    def url(self):
+        return "http://{}:{}".format(*self.server_address)
+
+
+def _md5(data):
+    return base64.b64encode(hashlib.md5(data).digest()).decode("ascii")
+
+
+def _multipart_parts(content_type, body):
+    boundary = content_type.split("boundary=")[1].strip("'\"").encode("ascii")
+    parts = [
+        p.split(b"\r\n\r\n", 1)[1][: -len(b"\r\n")]
+        for p in body.split(b"--" + boundary)[1:-1]
+    ]
+    return json.loads(parts[0].decode("utf-8")), parts[1]
+
+
+"""
+Compressions tested against the local GCS endpoint
+"""
+codecs = [
+    "gzip",
+    pytest.param(
+        "zstd",
+        marks=pytest.mark.skipif(zstandard is None, reason="requires zstandard"),
+    ),
+]
+
+
+@pytest.fixture
+def gcs():
+    server = FakeGcsServer()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def _endpoint_remote(tmp_path, name, gcs, compression=None):
+    client = storage.Client(
+        project="todayi",
+        credentials=AnonymousCredentials(),
+        client_options={"api_endpoint": gcs.url},
+    )
+    return _remote(tmp_path, name, client.bucket("bucket"), compression)
+
+
+def _remote(tmp_path, name, bucket, compression=None):
+    remote = GcsRemote(str(tmp_path / name), "todayi.db", "gs://bucket/", compression)
+    remote._bucket = bucket
+    return remote
+
+
+def _write_db(db_path, *values):
+    conn = sqlite3.connect(str(db_path))
+    with conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS t (v)")
+        conn.execute("DELETE FROM t")
+        conn.executemany("INSERT INTO t VALUES (?)", ((v,) for v in values))
+    conn.close()
+
+
+def _values(db_path):
+    conn = sqlite3.connect(str(db_path))
+    values = [r[0] for r in conn.execute("SELECT v FROM t")]
+    conn.close()
+    return values
+
+
+def _snapshot_bytes(tmp_path, *values):
+    _write_db(tmp_path / "source.db", *values)
+    write_snapshot(str(tmp_path / "source.db"), str(tmp_path / "snapshot.db"))
+    return (tmp_path / "snapshot.db").read_bytes()
+
+
+def test_push_pull_skip_when_unchanged(tmp_path):
+    bucket = FakeBucket()
+    a = _remote(tmp_path, "a.db", bucket)
+    b = _remote(tmp_path, "b.db", bucket)
+    _write_db(tmp_path / "a.db", "one")
+
+    a.push()
+    a.push()
+    assert bucket.uploads == ["todayi.db"]
+    b.pull()
+    b.pull()
+    assert bucket.downloads == ["todayi.db"]
+    assert _values(tmp_path / "b.db") == ["one"]
+
+    # Each sync costs a single metadata request, while nothing changed
+    requests = bucket.metadata_requests
+    a.pull()
+    b.push()
+    assert bucket.metadata_requests == requests + 2
+    assert len(bucket.uploads) == 1 and len(bucket.downloads) == 1
+
+    _write_db(tmp_path / "b.db", "two")
+    b.push()
+    a.pull()
+    assert _values(tmp_path / "a.db") == ["two"]
+    assert len(bucket.uploads) == 2 and len(bucket.downloads) == 2
+
+
+def test_skip_matching_content_without_state(tmp_path):
+    bucket = FakeBucket()
+    bucket.put("todayi.db", _snapshot_bytes(tmp_path, "same"))
+    (tmp_path / "a.db").write_bytes(bucket.objects["todayi.db"][1])
+    a = _remote(tmp_path, "a.db", bucket)
+    a.pull()
+    a.push(backup=True)
+    assert bucket.uploads == [] and bucket.downloads == []
+    assert list(bucket.objects) == ["todayi.db"]
+
+
+def test_push_backup_renames_changed_blob(tmp_path):
+    bucket = FakeBucket()
+    bucket.put("todayi.db", _snapshot_bytes(tmp_path, "old"))
+    _write_db(tmp_path / "a.db", "new")
+    _remote(tmp_path, "a.db", bucket).push(backup=True)
+    assert len(bucket.objects) == 2
+    (tmp_path / "pushed.db").write_bytes(bucket.objects["todayi.db"][1])
+    assert _values(tmp_path / "pushed.db") == ["new"]
+
+
+def test_compressing_reader():
+    data = bytes(range(256)) * 4096
+    reader = CompressingReader(io.BytesIO(data), "gzip", chunk_size=1000)
+    chunks = [reader.read(4096)]
+    while len(chunks[-1]) == 4096:
+        assert reader.tell() == 4096 * len(chunks)
+        chunks.append(reader.read(4096))
+    assert gzip.decompress(b"".join(chunks)) == data
+
+
+def test_compressed_push_pull(tmp_path):
+    bucket = FakeBucket()
+    values = ["todayi {}".format(i) for i in range(20000)]
+    _write_db(tmp_path / "a.db", *values)
+    a = _remote(tmp_path, "a.db", bucket, "gzip")
+    a._upload_chunk_size = 256 * 1024
+    b = _remote(tmp_path, "b.db", bucket)
+
+    a.push()
+    a.push()
+    _, stored, content_encoding, _ = bucket.objects["todayi.db"]
+    size = (tmp_path / "a.db").stat().st_size
+    assert content_encoding == "gzip" and len(stored) < size / 2
+    assert len(gzip.decompress(stored)) == size
+    assert len(bucket.uploads) == 1
+
+    b.pull()
+    b.pull()
+    assert _values(tmp_path / "b.db") == values
+    assert len(bucket.downloads) == 1
+
+    # Uncompressed dbs pushed before compression was set are still pulled
+    _write_db(tmp_path / "b.db", "uncompressed")
+    b.push()
+    a.pull()
+    assert _values(tmp_path / "a.db") == ["uncompressed"]
+
+
+def test_truncated_or_corrupt_blob_rejected(tmp_path):
+    bucket = FakeBucket()
+    _write_db(tmp_path / "a.db", *("todayi {}".format(i) for i in range(2000)))
+    _remote(tmp_path, "a.db", bucket, "gzip").push()
+    _write_db(tmp_path / "b.db", "local")
+    b = _remote(tmp_path, "b.db", bucket)
+    generation, data, content_encoding, metadata = bucket.objects["todayi.db"]
+
+    bucket.put("todayi.db", data[: len(data) // 2], content_encoding, metadata)
+    with pytest.raises(IncompleteStreamError):
+        b.pull()
+    assert _values(tmp_path / "b.db") == ["local"]
+
+    other = dict(metadata, **{GcsRemote._md5_metadata_key: "not the md5"})
+    bucket.put("todayi.db", data, content_encoding, other)
+    with pytest.raises(CorruptDownloadError):
+        b.pull()
+    assert _values(tmp_path / "b.db") == ["local"]
+    assert [p.name for p in tmp_path.iterdir() if "pull" in p.name] == []
+
+
+def test_endpoint_push_pull(tmp_path, gcs):
+    a = _endpoint_remote(tmp_path, "a.db", gcs)
+    b = _endpoint_remote(tmp_path, "b.db", gcs)
+    _write_db(tmp_path / "a.db", "one")
+
+    a.push()
+    a.push()
+    assert gcs.uploads == ["multipart"]
+    b.pull()
+    b.pull()
+    assert gcs.downloads == ["todayi.db"]
+    assert _values(tmp_path / "b.db") == ["one"]
+    generation = gcs.objects["todayi.db"][0]
+    assert a._load_state()["generation"] == generation
+    assert b._load_state()["generation"] == generation
+
+    requests = gcs.metadata_requests
+    a.pull()
+    b.push()
+    assert gcs.metadata_requests == requests + 2
+    assert len(gcs.uploads) == 1 and len(gcs.downloads) == 1
+
+    _write_db(tmp_path / "b.db", "two")
+    b.push(backup=True)
+    a.pull()
+    assert _values(tmp_path / "a.db") == ["two"]
+    assert len(gcs.objects) == 2
+    (backup_name,) = set(gcs.objects) - {"todayi.db"}
+    (tmp_path / "backup.db").write_bytes(gcs.objects[backup_name][1])
+    assert _values(tmp_path / "backup.db") == ["one"]
+
+
+def test_endpoint_resumable_upload(tmp_path, gcs):
+    # Random values, so that the db still spans several chunks compressed
+    values = [os.urandom(64).hex() for _ in range(10000)]
+    _write_db(tmp_path / "a.db", *values)
+    a = _endpoint_remote(tmp_path, "a.db", gcs, "gzip")
+    a._upload_chunk_size = 256 * 1024
+    b = _endpoint_remote(tmp_path, "b.db", gcs)
+
+    a.push()
+    _, stored, content_encoding, metadata = gcs.objects["todayi.db"]
+    assert content_encoding == "gzip"
+    assert metadata == {GcsRemote._md5_metadata_key: a._load_state()["md5"]}
+    assert a._load_state()["generation"] == gcs.objects["todayi.db"][0]
+    # Unknown size, so the last chunk is always a short one
+    chunks = len(stored) // a._upload_chunk_size + 1
+    assert chunks > 2 and gcs.uploads == ["resumable"] * chunks
+    assert len(gzip.decompress(stored)) == (tmp_path / "a.db").stat().st_size
+
+    b.pull()
+    assert _values(tmp_path / "b.db") == values
+
+
+def _decompress(data, compression):
+    f = io.BytesIO()
+    writer = DecompressingWriter(f, compression)
+    writer.write(data)
+    writer.close()
+    return f.getvalue()
+
+
+@pytest.mark.parametrize("compression", codecs)
+def test_endpoint_compressed_push_pull(tmp_path, gcs, compression):
+    values = [os.urandom(64).hex() for _ in range(10000)]
+    _write_db(tmp_path / "a.db", *values)
+    a = _endpoint_remote(tmp_path, "a.db", gcs, compression)
+    a._upload_chunk_size = 256 * 1024
+    b = _endpoint_remote(tmp_path, "b.db", gcs)
+
+    a.push()
+    a.push()
+    _, stored, content_encoding, _ = gcs.objects["todayi.db"]
+    size = (tmp_path / "a.db").stat().st_size
+    assert content_encoding == compression and len(stored) < size
+    assert len(_decompress(stored, compression)) == size
+    assert len(gcs.uploads) > 1 and set(gcs.uploads) == {"resumable"}
+
+    b.pull()
+    b.pull()
+    assert _values(tmp_path / "b.db") == values
+    assert gcs.downloads == ["todayi.db"]
+    assert b._load_state()["md5"] == a._load_state()["md5"]
+
+
+@pytest.mark.parametrize("compression", codecs)
+def test_endpoint_truncated_or_corrupt_rejected(tmp_path, gcs, compression):
+    _write_db(tmp_path / "a.db", *("todayi {}".format(i) for i in range(2000)))
+    _endpoint_remote(tmp_path, "a.db", gcs, compression).push()
+    _write_db(tmp_path / "b.db", "local")
+    b = _endpoint_remote(tmp_path, "b.db", gcs)
+    _, data, content_encoding, metadata = gcs.objects["todayi.db"]
+
+    # Cut short in transit, so the body does not match its hash
+    gcs.served["todayi.db"] = data[: len(data) // 2]
+    with pytest.raises(DataCorruption):
+        b.pull()
+    assert _values(tmp_path / "b.db") == ["local"]
+
+    # Stored truncated, with a matching hash
+    gcs.put("todayi.db", data[: len(data) // 2], content_encoding, metadata)
+    with pytest.raises(IncompleteStreamError):
+        b.pull()
+    assert _values(tmp_path / "b.db") == ["local"]
+
+    other = dict(metadata, **{GcsRemote._md5_metadata_key: "not the md5"})
+    gcs.put("todayi.db", data, content_encoding, other)
+    with pytest.raises(CorruptDownloadError):
+        b.pull()
+    assert _values(tmp_path / "b.db") == ["local"]
+    assert [p.name for p in tmp_path.iterdir() if "pull" in p.name] == []
@@ -0,0 +1,237 @@
+import json
+import sqlite3
+
+from todayi import config
+from todayi.backend.filter import EntryFilterSettings
+from todayi.backend.sqlite import SqliteBackend
+from todayi.backend.sqlite_core import SqliteCoreBackend
+from todayi.cli import run
+from todayi.controller import Controller
+from todayi.model.entry import Entry
+from todayi.model.tag import Tag
+from todayi.remote.gcs_delta import GcsDeltaRemote
+
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self._bucket = bucket
+        self.name = name
+
+    def upload_from_file(self, f, rewind=False, content_type=None):
+        if rewind is True:
+            f.seek(0)
+        self._bucket.objects[self.name] = f.read()
+
+    def download_to_file(self, f):
+        self._bucket.downloads.append(self.name)
+        f.write(self._bucket.objects[self.name])
+
+
+class FakeBucket:
+    def __init__(self):
+        self.objects = {}
+        self.downloads = []
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+    def list_blobs(self, prefix=""):
+        return [FakeBlob(self, n) for n in self.objects if n.startswith(prefix)]
+
+    def delete_blobs(self, blobs, on_error=None):
+        for blob in blobs:
+            self.objects.pop(blob.name, None)
+
+
+def _device(tmp_path, name, bucket, backend_class=SqliteCoreBackend):
+    db_path = str(tmp_path / "{}.db".format(name))
+    backend = backend_class(db_path)
+    remote = GcsDeltaRemote(db_path, "todayi.db", "bucket")
+    remote._bucket = bucket
+    return backend, remote
+
+
+def _contents(backend):
+    entries = backend.read_entries(EntryFilterSettings(order_by="created_at"))
+    return [(e.content, [t.name for t in e.tags]) for e in entries]
+
+
+def test_push_pull_only_changes(tmp_path):
+    bucket = FakeBucket()
+    a, remote_a = _device(tmp_path, "a", bucket)
+    b, remote_b = _device(tmp_path, "b", bucket, SqliteBackend)
+
+    a.write_entries([Entry("One", tags=[Tag("x")]), Entry("Two", tags=[Tag("y")])])
+    remote_a.push()
+    assert len(bucket.objects) == 1
+
+    b.write_entry(Entry("Three", tags=[Tag("x"), Tag("z")]))
+    remote_b.push()
+    assert len(bucket.objects) == 2
+    assert bucket.downloads == list(bucket.objects)[:1]
+
+    remote_a.pull()
+    expected = [("One", ["x"]), ("Two", ["y"]), ("Three", ["x", "z"])]
+    assert _contents(a) == expected
+    assert _contents(b) == expected
+
+    # Pulled changes are not pushed back, and seen segments not downloaded again
+    del bucket.downloads[:]
+    remote_a.push()
+    remote_a.pull()
+    assert len(bucket.objects) == 2
+    assert bucket.downloads == []
+
+    conn = sqlite3.connect(str(tmp_path / "a.db"))
+    with conn:
+        conn.execute("DELETE FROM entries WHERE content = 'Two'")
+        conn.execute("UPDATE entries SET content = 'Uno' WHERE content = 'One'")
+    remote_a.push()
+    remote_b.pull()
+    assert _contents(b) == [("Uno", ["x"]), ("Three", ["x", "z"])]
+    assert len(bucket.downloads) == 1
+
+
+def test_pull_keeps_unpushed_local_changes(tmp_path):
+    bucket = FakeBucket()
+    a, remote_a = _device(tmp_path, "a", bucket)
+    b, remote_b = _device(tmp_path, "b", bucket)
+    a.write_entry(Entry("Shared", uuid="shared"))
+    remote_a.push()
+    remote_b.pull()
+
+    conn_a = sqlite3.connect(str(tmp_path / "a.db"))
+    with conn_a:
+        conn_a.execute("UPDATE entries SET content = 'From a'")
+    conn_b = sqlite3.connect(str(tmp_path / "b.db"))
+    with conn_b:
+        conn_b.execute("UPDATE entries SET content = 'From b'")
+    remote_a.push()
+    remote_b.pull()
+    assert _contents(b) == [("From b", [])]
+    remote_b.push()
+    remote_a.pull()
+    assert _contents(a) == [("From b", [])]
+
+
+def test_pull_with_local_entry_without_uuid(tmp_path):
+    bucket = FakeBucket()
+    a, remote_a = _device(tmp_path, "a", bucket)
+    b, remote_b = _device(tmp_path, "b", bucket)
+    # Entries written before uuids were have none
+    b.write_entry(Entry("Legacy"))
+    conn_b = sqlite3.connect(str(tmp_path / "b.db"))
+    with conn_b:
+        conn_b.execute("UPDATE entries SET uuid = NULL")
+    a.write_entry(Entry("From a", tags=[Tag("x")]))
+    remote_a.push()
+    remote_b.pull()
+    assert sorted(_contents(b)) == [("From a", ["x"]), ("Legacy", [])]
+
+
+def test_compaction(tmp_path):
+    bucket = FakeBucket()
+    a, remote_a = _device(tmp_path, "a", bucket)
+    remote_a._compact_after = 3
+    for i in range(5):
+        a.write_entry(Entry("Entry {}".format(i), tags=[Tag("t{}".format(i % 2))]))
+        remote_a.push()
+    assert len(bucket.objects) <= 3
+    assert any("snapshot" in name for name in bucket.objects)
+
+    c, remote_c = _device(tmp_path, "c", bucket)
+    remote_c.pull()
+    assert _contents(c) == _contents(a)
+
+
+def test_compaction_keeps_entries_of_other_devices(tmp_path):
+    bucket = FakeBucket()
+    a, remote_a = _device(tmp_path, "a", bucket)
+    b, remote_b = _device(tmp_path, "b", bucket)
+    d, remote_d = _device(tmp_path, "d", bucket)
+    a.write_entry(Entry("From a", tags=[Tag("x")]))
+    a.write_entry(Entry("Deleted on a"))
+    remote_a.push()
+    remote_b.pull()
+    remote_d.pull()
+    conn = sqlite3.connect(str(tmp_path / "a.db"))
+    with conn:
+        conn.execute("DELETE FROM entries WHERE content = 'Deleted on a'")
+    remote_a.push()
+    b.write_entry(Entry("From b"))
+
+    remote_b.compact()
+    assert len(bucket.objects) == 1
+    assert any("snapshot" in name for name in bucket.objects)
+
+    expected = [("From a", ["x"]), ("From b", [])]
+    c, remote_c = _device(tmp_path, "c", bucket)
+    remote_c.pull()
+    assert _contents(c) == expected
+
+    # Deletions pulled by b are kept in its snapshot, so devices
+    # that had not pulled them yet still apply them
+    remote_d.pull()
+    assert _contents(d) == expected
+    remote_a.pull()
+    assert _contents(a) == expected
+
+
+def test_compaction_skipped_with_unseen_segments(tmp_path):
+    bucket = FakeBucket()
+    a, remote_a = _device(tmp_path, "a", bucket)
+    b, remote_b = _device(tmp_path, "b", bucket)
+    b.write_entry(Entry("From b"))
+    remote_b.push()
+    a.write_entry(Entry("From a"))
+    remote_a.push()
+
+    # b has not pulled the segment of a, which sorts before its snapshot
+    conn = remote_b._connect()
+    try:
+        assert remote_b._compact(conn) is False
+    finally:
+        conn.close()
+    assert not any("snapshot" in name for name in bucket.objects)
+
+    remote_b.compact()
+    c, remote_c = _device(tmp_path, "c", bucket)
+    remote_c.pull()
+    assert sorted(_contents(c)) == [("From a", []), ("From b", [])]
+
+
+def test_cli_merge_pulls(tmp_path, monkeypatch, capsys):
+    bucket = FakeBucket()
+    a, remote_a = _device(tmp_path, "a", bucket)
+    b, remote_b = _device(tmp_path, "b", bucket)
+    config_path = tmp_path / "todayi.config"
+    config_path.write_text(
+        json.dumps(
+            {
+                "backend": "sqlite_core",
+                "backend_dir": str(tmp_path),
+                "backend_filename": "b.db",
+                "remote": "gcs_delta",
+            }
+        )
+    )
+    monkeypatch.setattr(config, "_config", config.Config(str(config_path)))
+    controller = Controller()
+    controller._cached_remote = remote_b
+
+    a.write_entry(Entry("From a"))
+    remote_a.push()
+    run(["remote", "pull", "--merge"], controller=controller)
+    assert _contents(b) == [("From a", [])]
+
+    b.write_entry(Entry("From b"))
+    a.write_entry(Entry("From a again"))
+    remote_a.push()
+    run(["remote", "push", "--merge"], controller=controller)
+    remote_a.pull()
+    assert sorted(_contents(a)) == [
+        ("From a", []),
+        ("From a again", []),
+        ("From b", []),
+    ]
+    assert "Merged" not in capsys.readouterr().out
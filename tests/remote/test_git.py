@@ -0,0 +1,141 @@
+from datetime import datetime
+import json
+import sqlite3
+import subprocess
+
+import pytest
+
+from todayi import config
+from todayi.backend.filter import EntryFilterSettings
+from todayi.backend.sqlite_core import SqliteCoreBackend
+from todayi.cli import run
+from todayi.controller import Controller
+from todayi.model.entry import Entry
+from todayi.remote.git import GitRemote
+
+
+def _git(cwd, *args):
+    return subprocess.run(
+        ["git", *args], cwd=str(cwd), capture_output=True, check=True
+    ).stdout
+
+
+def _git_identity(monkeypatch):
+    for var in ["GIT_AUTHOR", "GIT_COMMITTER"]:
+        monkeypatch.setenv(var + "_NAME", "todayi")
+        monkeypatch.setenv(var + "_EMAIL", "todayi@example.com")
+
+
+def test_push_commits_db_snapshot(tmp_path, monkeypatch):
+    _git_identity(monkeypatch)
+    origin, backend = tmp_path / "origin.git", tmp_path / "backend"
+    backend.mkdir()
+    _git(tmp_path, "init", "-q", "--bare", str(origin))
+    _git(backend, "init", "-q", "-b", "master")
+    (backend / "notes.txt").write_text("notes")
+    conn = sqlite3.connect(str(backend / "todayi.db"))
+    with conn:
+        conn.execute("CREATE TABLE t (v)")
+        conn.executemany(
+            "INSERT INTO t VALUES (?)", (("x" * 100,) for _ in range(5000))
+        )
+        conn.execute("DELETE FROM t WHERE rowid > 1")
+    # Uncommitted writes are neither blocked nor pushed
+    writer = sqlite3.connect(str(backend / "todayi.db"), isolation_level=None)
+    writer.execute("BEGIN IMMEDIATE")
+    writer.execute("INSERT INTO t VALUES ('uncommitted')")
+
+    GitRemote(str(backend), str(origin), "todayi.db").push()
+    writer.execute("COMMIT")
+
+    assert _git(origin, "ls-tree", "--name-only", "master").split() == [
+        b"notes.txt",
+        b"todayi.db",
+    ]
+    (tmp_path / "pushed.db").write_bytes(_git(origin, "show", "master:todayi.db"))
+    pushed = sqlite3.connect(str(tmp_path / "pushed.db"))
+    assert pushed.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 1
+    assert pushed.execute("PRAGMA freelist_count").fetchone()[0] == 0
+
+    clone = tmp_path / "clone"
+    clone.mkdir()
+    _git(clone, "init", "-q", "-b", "master")
+    remote = GitRemote(str(clone), str(origin), "todayi.db")
+    assert remote.fetch(str(tmp_path / "fetched.db")) is True
+    fetched = sqlite3.connect(str(tmp_path / "fetched.db"))
+    assert fetched.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 1
+
+
+def test_journal_files_neither_committed_nor_stashed(tmp_path, monkeypatch):
+    _git_identity(monkeypatch)
+    origin, backend = tmp_path / "origin.git", tmp_path / "backend"
+    backend.mkdir()
+    _git(tmp_path, "init", "-q", "--bare", str(origin))
+    _git(backend, "init", "-q", "-b", "master")
+    SqliteCoreBackend(str(backend / "todayi.db")).close()
+    journal_files = ["todayi.db.journal.jsonl", "todayi.db.journal.jsonl.lock"]
+    for name in journal_files:
+        (backend / name).write_text("")
+
+    remote = GitRemote(str(backend), str(origin), "todayi.db")
+    remote.push()
+    assert _git(origin, "ls-tree", "--name-only", "master").split() == [b"todayi.db"]
+    remote.pull()
+    assert all((backend / name).exists() for name in journal_files)
+
+
+def test_jsonl_format_push_pull(tmp_path, monkeypatch):
+    _git_identity(monkeypatch)
+    origin = tmp_path / "origin.git"
+    _git(tmp_path, "init", "-q", "--bare", str(origin))
+    devices = []
+    for name in ["a", "b"]:
+        backend_dir = tmp_path / name
+        backend_dir.mkdir()
+        _git(backend_dir, "init", "-q", "-b", "master")
+        backend = SqliteCoreBackend(str(backend_dir / "todayi.db"))
+        remote = GitRemote(str(backend_dir), str(origin), "todayi.db", "jsonl")
+        devices.append((backend, remote))
+    (a, remote_a), (b, remote_b) = devices
+
+    a.write_entry(Entry("Jan", created_at=datetime(2021, 1, 5)))
+    a.write_entry(Entry("Feb", created_at=datetime(2021, 2, 5)))
+    remote_a.push()
+    assert _git(origin, "ls-tree", "-r", "--name-only", "master").split() == [
+        b"journal/2021-01.jsonl",
+        b"journal/2021-02.jsonl",
+    ]
+
+    remote_b.pull()
+    entries = b.read_entries(EntryFilterSettings(order_by="created_at"))
+    assert [e.content for e in entries] == ["Jan", "Feb"]
+    assert (tmp_path / "b" / "todayi.db").exists()
+
+    b.write_entry(Entry("Feb 2", created_at=datetime(2021, 2, 6)))
+    remote_b.push()
+    changed = _git(origin, "diff", "--name-only", "master~1", "master").split()
+    assert changed == [b"journal/2021-02.jsonl"]
+    remote_a.pull()
+    assert len(a.read_entries(EntryFilterSettings())) == 3
+
+
+def test_jsonl_format_cli_merge_not_supported(tmp_path, monkeypatch):
+    backend_dir = tmp_path / "backend"
+    backend_dir.mkdir()
+    _git(backend_dir, "init", "-q", "-b", "master")
+    config_path = tmp_path / "todayi.config"
+    config_path.write_text(
+        json.dumps(
+            {
+                "backend": "sqlite_core",
+                "backend_dir": str(backend_dir),
+                "remote": "git",
+                "git_remote_uri": str(tmp_path / "origin.git"),
+                "git_format": "jsonl",
+            }
+        )
+    )
+    monkeypatch.setattr(config, "_config", config.Config(str(config_path)))
+    for option in ["pull", "push"]:
+        with pytest.raises(TypeError, match="Merging is not supported by GitRemote"):
+            run(["remote", option, "--merge"], controller=Controller())
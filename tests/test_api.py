@@ -0,0 +1,254 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import gc
+import http.client
+import json
+import socket
+import struct
+import threading
+import time
+
+import pytest
+
+from todayi import api as api_module
+from todayi.api import ApiServer
+from todayi.backend.sqlite import SqliteBackend
+from todayi.backend.sqlite_core import SqliteCoreBackend
+from todayi.model.entry import Entry
+from todayi.model.tag import Tag
+
+
+@pytest.fixture(params=[SqliteBackend, SqliteCoreBackend])
+def api(tmp_path, request):
+    db_path = str(tmp_path / "todayi.db")
+    backend = request.param(db_path)
+    with _Serving(ApiServer(lambda: request.param(db_path), workers=2)) as serving:
+        yield backend, serving.port
+    assert serving.errors == []
+    backend.close()
+
+
+class _Serving:
+    """
+    Serves an api server from a thread, recording errors its loop
+    reports, ie exceptions never retrieved.
+    """
+
+    def __init__(self, server):
+        self.errors = []
+        self._started = threading.Event()
+        self._loop = asyncio.new_event_loop()
+        self._loop.set_exception_handler(lambda _, context: self.errors.append(context))
+        self._task = self._loop.create_task(
+            server.serve("127.0.0.1", 0, self._set_port)
+        )
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _set_port(self, names):
+        self.port = names[0][1]
+        self._started.set()
+
+    def _run(self):
+        try:
+            self._loop.run_until_complete(self._task)
+        except asyncio.CancelledError:
+            pass
+
+    def __enter__(self):
+        self._thread.start()
+        assert self._started.wait(5)
+        return self
+
+    def __exit__(self, *exc):
+        self._loop.call_soon_threadsafe(self._task.cancel)
+        self._thread.join(10)
+        assert not self._thread.is_alive()
+        gc.collect()
+        self._loop.close()
+
+
+def _request(port, method, path, body=None, headers={}):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    try:
+        conn.request(
+            method,
+            path,
+            body=None if body is None else json.dumps(body),
+            headers=headers,
+        )
+        response = conn.getresponse()
+        return response.status, response.getheader("Content-Type"), response.read()
+    finally:
+        conn.close()
+
+
+def _json(port, method, path, body=None):
+    status, _, content = _request(port, method, path, body)
+    return status, json.loads(content)
+
+
+def _json_headers(port, headers):
+    status, _, content = _request(port, "GET", "/counts", headers=headers)
+    return status, json.loads(content)
+
+
+def test_write_and_read_entries(api):
+    _, port = api
+    status, result = _json(
+        port, "POST", "/entries", {"content": "One", "tags": ["a", "b"]}
+    )
+    assert status == 201 and "uuid" in result
+    status, result = _json(
+        port,
+        "POST",
+        "/entries",
+        [
+            {"content": "Two", "tags": ["a"], "created_at": "2020-12-21T10:00:00"},
+            {"content": "Three", "created_at": "2020-12-22T10:00:00"},
+        ],
+    )
+    assert status == 201 and len(result["uuids"]) == 2
+
+    status, page = _json(port, "GET", "/entries?limit=2")
+    assert status == 200
+    assert [e["content"] for e in page["entries"]] == ["Two", "Three"]
+    assert page["next_offset"] == 2
+    _, page = _json(port, "GET", "/entries?limit=2&offset=2")
+    assert [e["content"] for e in page["entries"]] == ["One"]
+    assert page["entries"][0]["tags"] == ["a", "b"]
+    assert page["next_offset"] is None
+
+    _, page = _json(
+        port,
+        "GET",
+        "/entries?with_tags=a&after=12/01/2020&order_by=created_at&descending=true",
+    )
+    assert [e["content"] for e in page["entries"]] == ["One", "Two"]
+    _, page = _json(port, "GET", "/entries?content_contains=hre&before=2020-12-23")
+    assert [e["content"] for e in page["entries"]] == ["Three"]
+
+    status, counts = _json(port, "GET", "/counts?group_by=tag")
+    assert status == 200
+    assert counts["counts"] == [{"group": "a", "count": 2}, {"group": "b", "count": 1}]
+
+
+def test_stream_entries(api):
+    backend, port = api
+    backend.write_entries(
+        Entry("Entry {}".format(i), tags=[Tag("t{}".format(i % 3))])
+        for i in range(1234)
+    )
+    status, content_type, content = _request(port, "GET", "/entries?format=ndjson")
+    assert status == 200 and content_type == "application/x-ndjson"
+    lines = [json.loads(line) for line in content.decode("utf-8").splitlines()]
+    assert len(lines) == 1234
+    assert lines[0]["content"] == "Entry 0"
+
+    status, _, content = _request(
+        port,
+        "GET",
+        "/entries?with_tags=t1&limit=10",
+        headers={"Accept": "application/x-ndjson"},
+    )
+    assert len(content.splitlines()) == 10
+
+
+def test_concurrent_writes(api):
+    backend, port = api
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        statuses = list(
+            pool.map(
+                lambda i: _json(port, "POST", "/entries", {"content": str(i)})[0],
+                range(40),
+            )
+        )
+    assert statuses == [201] * 40
+    _, page = _json(port, "GET", "/entries?limit=100")
+    assert len(page["entries"]) == 40
+
+
+def test_errors(api):
+    _, port = api
+    assert _json(port, "GET", "/nope")[0] == 404
+    assert _json(port, "DELETE", "/entries")[0] == 405
+    assert _json(port, "GET", "/entries?order_by=nope")[0] == 400
+    assert _json(port, "GET", "/entries?order_by=nope&format=ndjson")[0] == 400
+    assert _json(port, "GET", "/entries?limit=5000")[0] == 400
+    assert _json(port, "GET", "/entries?after=yesterday")[0] == 400
+    assert _json(port, "GET", "/counts?group_by=year")[0] == 400
+    status, result = _json(port, "POST", "/entries", {"tags": ["a"]})
+    assert status == 400 and "missing content" in result["error"]
+
+
+def test_stream_entries_to_http_1_0_client(api):
+    backend, port = api
+    backend.write_entries(Entry("Entry {}".format(i)) for i in range(700))
+    with socket.create_connection(("127.0.0.1", port), timeout=10) as sock:
+        sock.sendall(b"GET /entries?format=ndjson HTTP/1.0\r\n\r\n")
+        data = b""
+        while True:
+            received = sock.recv(65536)
+            if received == b"":
+                break
+            data += received
+    head, _, content = data.partition(b"\r\n\r\n")
+    assert b"transfer-encoding" not in head.lower()
+    assert b"Connection: close" in head
+    lines = [json.loads(line) for line in content.decode("utf-8").splitlines()]
+    assert len(lines) == 700
+
+
+def test_shutdown_with_failing_close(tmp_path, monkeypatch):
+    monkeypatch.setattr(api_module, "_close_timeout", 1)
+    db_path = str(tmp_path / "todayi.db")
+
+    class FailingClose(SqliteCoreBackend):
+        def close(self):
+            super().close()
+            raise RuntimeError("close failed")
+
+    server = ApiServer(lambda: FailingClose(db_path), workers=2)
+    with _Serving(server) as serving:
+        assert _json(serving.port, "POST", "/entries", {"content": "One"})[0] == 201
+
+
+def test_stream_to_client_gone(tmp_path):
+    db_path = str(tmp_path / "todayi.db")
+    backend = SqliteCoreBackend(db_path)
+    backend.write_entries(Entry("Entry {}".format(i)) for i in range(2000))
+    backend.close()
+    gone = threading.Event()
+
+    class FailingRead(SqliteCoreBackend):
+        def iter_entries(self, *args, **kwargs):
+            # Reads another chunk once the client is gone, then fails
+            for i, entry in enumerate(super().iter_entries(*args, **kwargs)):
+                if i == api_module._stream_chunk_size:
+                    assert gone.wait(5)
+                if i == 2 * api_module._stream_chunk_size:
+                    raise RuntimeError("read failed")
+                yield entry
+
+    with _Serving(ApiServer(lambda: FailingRead(db_path), workers=1)) as serving:
+        sock = socket.create_connection(("127.0.0.1", serving.port), timeout=10)
+        sock.sendall(b"GET /entries?format=ndjson HTTP/1.1\r\n\r\n")
+        assert sock.recv(1024).startswith(b"HTTP/1.1 200")
+        # Resets the connection rather than closing it cleanly
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+        sock.close()
+        time.sleep(0.2)
+        gone.set()
+        # The only worker is released
+        assert _json(serving.port, "GET", "/counts")[0] == 200
+    assert serving.errors == []
+
+
+def test_request_head_too_large(api):
+    _, port = api
+    status, result = _json_headers(port, {"X-Large": "x" * 20000})
+    assert status == 431
+    status, result = _json_headers(
+        port, dict(("X-Header-{}".format(i), "x" * 100) for i in range(200))
+    )
+    assert status == 431
+    assert _json_headers(port, {"X-Small": "x" * 100})[0] == 200
@@ -0,0 +1,70 @@
+import json
+import os
+
+import pytest
+
+from todayi.config import Config, DEFAULT_CONFIG
+
+
+@pytest.fixture
+def config_path(tmp_path):
+    return tmp_path / "todayi.config"
+
+
+def test_writes_default_config_on_first_read(config_path):
+    config = Config(str(config_path), environ={})
+    assert not config_path.exists()
+    assert config.get("backend") == DEFAULT_CONFIG["backend"]
+    assert json.loads(config_path.read_text()) == DEFAULT_CONFIG
+
+
+def test_set_is_atomic_and_cached(config_path):
+    config = Config(str(config_path), environ={})
+    config.set("backend", "sqlite_core")
+    assert config.get("backend") == "sqlite_core"
+    assert json.loads(config_path.read_text())["backend"] == "sqlite_core"
+    assert [p.name for p in config_path.parent.iterdir()] == [config_path.name]
+
+
+def test_reads_file_only_when_changed(config_path):
+    config = Config(str(config_path), environ={})
+    config.set("remote", "git")
+    stat = config_path.stat()
+
+    config_path.write_text(json.dumps({**DEFAULT_CONFIG, "remote": "xyz"}))
+    os.utime(config_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert config.get("remote") == "git"
+
+    os.utime(config_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert config.get("remote") == "xyz"
+
+
+def test_environment_overrides(config_path):
+    config = Config(str(config_path), environ={"TODAYI_BACKEND_DIR": "/tmp/x"})
+    assert config.get("backend_dir") == "/tmp/x"
+    assert config.get("backend") == DEFAULT_CONFIG["backend"]
+
+
+def test_environment_config_path(config_path):
+    config = Config(environ={"TODAYI_CONFIG_PATH": str(config_path)})
+    config.set("gcs_bucket_name", "bucket")
+    assert json.loads(config_path.read_text())["gcs_bucket_name"] == "bucket"
+
+
+def test_invalid_key(config_path):
+    with pytest.raises(IndexError):
+        Config(str(config_path), environ={}).get("nope")
+
+
+def test_failed_write_removes_temp_file(config_path, monkeypatch):
+    config = Config(str(config_path), environ={})
+    config.set("backend", "sqlite_core")
+
+    def fail(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, "replace", fail)
+    with pytest.raises(OSError):
+        config.set("backend", "sqlite")
+    assert [p.name for p in config_path.parent.iterdir()] == [config_path.name]
+    assert json.loads(config_path.read_text())["backend"] == "sqlite_core"
@@ -0,0 +1,91 @@
+import json
+import os
+import socket
+import threading
+
+import pytest
+
+from todayi import config
+from todayi.daemon.client import forward, stop
+from todayi.daemon.server import DaemonServer
+
+
+@pytest.fixture
+def daemon(tmp_path, monkeypatch):
+    config_path = tmp_path / "todayi.config"
+    config_path.write_text(
+        json.dumps({"backend": "sqlite_core", "backend_dir": str(tmp_path / "todayi")})
+    )
+    monkeypatch.setattr(config, "_config", config.Config(str(config_path)))
+    path = str(tmp_path / "todayi.sock")
+    server = DaemonServer(path)
+    thread = threading.Thread(target=server.serve_until_stopped)
+    thread.start()
+    yield path
+    stop(path)
+    thread.join()
+    server.server_close()
+
+
+def test_forward_runs_commands_in_daemon(daemon, tmp_path, capsys):
+    assert forward(["Did", "a", "thing", "-t", "x"], daemon) == 0
+    assert forward(["show"], daemon) == 0
+    out = capsys.readouterr().out
+    assert "Did a thing" in out
+
+    # Replaced db files are not served from a stale connection
+    os.remove(str(tmp_path / "todayi" / "todayi.db"))
+    assert forward(["Other", "thing"], daemon) == 0
+    assert forward(["show"], daemon) == 0
+    out = capsys.readouterr().out
+    assert "Other thing" in out and "Did a thing" not in out
+
+
+def test_forward_reports_errors(daemon, capsys):
+    assert forward(["config", "get", "missing_key"], daemon) == 1
+    assert "IndexError" in capsys.readouterr().err
+    assert forward(["show", "-n", "not a number"], daemon) == 2
+
+
+def test_forward_falls_back_without_daemon(tmp_path):
+    path = str(tmp_path / "todayi.sock")
+    assert forward(["Did a thing"], path) is None
+
+    # Stale socket left by a daemon that did not clean up
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+    assert forward(["Did a thing"], path) is None
+    assert stop(path) is False
+
+
+def test_stdin_imports_run_in_process(daemon):
+    assert forward(["import", "-", "-f", "jsonl"], daemon) is None
+    assert forward(["daemon"], daemon) is None
+
+
+def test_replaced_controller_backend_closed(tmp_path, monkeypatch):
+    config_path = tmp_path / "todayi.config"
+    config_path.write_text(
+        json.dumps({"backend": "sqlite_core", "backend_dir": str(tmp_path / "todayi")})
+    )
+    monkeypatch.setattr(config, "_config", config.Config(str(config_path)))
+    server = DaemonServer(str(tmp_path / "todayi.sock"))
+    closed = []
+
+    def watch(backend):
+        close = backend.close
+        backend.close = lambda: closed.append(backend) or close()
+        return backend
+
+    first = watch(server.controller._backend)
+    assert server.controller._backend is first and closed == []
+
+    config.set("storage_profile", "throughput")
+    second = watch(server.controller._backend)
+    assert second is not first and closed == [first]
+
+    server.stopping = True
+    server.serve_until_stopped()
+    server.server_close()
+    assert closed == [first, second]
@@ -0,0 +1,34 @@
+from datetime import datetime
+from io import StringIO
+
+import pytest
+
+from todayi.importer import InvalidImportError, read_csv, read_jsonl
+
+
+def test_read_jsonl():
+    stream = StringIO(
+        '{"content": "Hello", "tags": ["a", "B"], "created_at": "2020-12-21T12:23"}\n'
+        "\n"
+        '{"content": "World", "tags": "c, d", "uuid": "abc"}\n'
+    )
+    entries = list(read_jsonl(stream))
+    assert len(entries) == 2
+    assert [t.name for t in entries[0].tags] == ["a", "b"]
+    assert entries[0].created_at == datetime(2020, 12, 21, 12, 23)
+    assert [t.name for t in entries[1].tags] == ["c", "d"]
+    assert entries[1].uuid == "abc"
+    assert entries[0].uuid != entries[1].uuid
+
+
+def test_read_jsonl_invalid():
+    with pytest.raises(InvalidImportError):
+        list(read_jsonl(StringIO('{"tags": ["a"]}\n')))
+
+
+def test_read_csv_report_format():
+    stream = StringIO('content,when,tags\nHello,2020-12-21,"a, b"\n')
+    entries = list(read_csv(stream))
+    assert entries[0].content == "Hello"
+    assert entries[0].created_at == datetime(2020, 12, 21)
+    assert [t.name for t in entries[0].tags] == ["a", "b"]
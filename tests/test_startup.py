@@ -0,0 +1,130 @@
+"""
+Regression tests for cli cold start. Heavy dependencies should
+only be imported by the commands that need them, so that time
+spent importing stays within a budget. The budget is loose, to
+catch regressions rather than noise. Import time is compared
+more closely by `benchmarks.startup`.
+"""
+
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+
+
+heavy_modules = [
+    "sqlalchemy",
+    "google.cloud.storage",
+    "requests",
+    "jinja2",
+    "prettytable",
+]
+
+
+"""
+Budget for time spent importing todayi modules, including
+everything they import, in ms. Eagerly importing the heavy
+dependencies takes longer, while lazy imports take a fraction.
+"""
+import_budget_ms = 500
+
+
+check_modules = """
+import sys
+{code}
+print(",".join(m for m in {modules} if m in sys.modules))
+"""
+
+
+def _run(code, home):
+    return subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            check_modules.format(code=code, modules=heavy_modules),
+        ],
+        env=dict(os.environ, HOME=str(home)),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def _todayi_import_ms(importtime_output):
+    """
+    Sums cumulative import time of top level todayi imports
+    reported by `python -X importtime`.
+    """
+    total_us = 0
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        if name.startswith(" todayi"):
+            total_us += int(cumulative)
+    return total_us / 1000
+
+
+def test_cli_import_is_lazy(tmp_path):
+    result = _run("import todayi.cli", tmp_path)
+    assert result.stdout.strip() == ""
+    assert _todayi_import_ms(result.stderr) < import_budget_ms
+
+
+def test_write_entry_startup(tmp_path):
+    backend_dir = tmp_path / "todayi"
+    (tmp_path / "todayi.config").write_text(
+        json.dumps({"backend": "sqlite_core", "backend_dir": str(backend_dir)})
+    )
+    result = _run(
+        "sys.argv = ['todayi', 'note', '-t', 'a']\n"
+        "from todayi.cli import run\n"
+        "run()",
+        tmp_path,
+    )
+    assert result.stdout.strip() == ""
+    assert _todayi_import_ms(result.stderr) < import_budget_ms
+    conn = sqlite3.connect(str(backend_dir / "todayi.db"))
+    assert conn.execute("SELECT content FROM entries").fetchall() == [("note",)]
+
+
+def test_journal_write_entry_startup(tmp_path):
+    backend_dir = tmp_path / "todayi"
+    (tmp_path / "todayi.config").write_text(
+        json.dumps(
+            {
+                "backend": "sqlite",
+                "backend_dir": str(backend_dir),
+                "write_mode": "journal",
+            }
+        )
+    )
+    result = _run(
+        "sys.argv = ['todayi', 'note', '-t', 'a']\n"
+        "from todayi.cli import run\n"
+        "run()",
+        tmp_path,
+    )
+    assert result.stdout.strip() == ""
+    assert _todayi_import_ms(result.stderr) < import_budget_ms
+    lines = (backend_dir / "todayi.db.journal.jsonl").read_text().splitlines()
+    assert [json.loads(line)["content"] for line in lines] == ["note"]
+    assert not (backend_dir / "todayi.db").exists()
+
+
+def test_direct_write_does_not_import_journal(tmp_path):
+    backend_dir = tmp_path / "todayi"
+    (tmp_path / "todayi.config").write_text(
+        json.dumps({"backend": "sqlite_core", "backend_dir": str(backend_dir)})
+    )
+    result = _run(
+        "sys.argv = ['todayi', 'note', '-t', 'a']\n"
+        "from todayi.cli import run\n"
+        "run()\n"
+        "assert 'todayi.backend.journal' not in sys.modules",
+        tmp_path,
+    )
+    assert result.stdout.strip() == ""
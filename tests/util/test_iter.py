@@ -1,4 +1,4 @@
-from todayi.util.iter import is_iterable
+from todayi.util.iter import chunked, is_iterable
 
 
 def test_is_iterable_list():
@@ -14,3 +14,8 @@ def test_is_iterable_str_not_allowed():
 def test_is_iterable_str():
     a = "abcdefg"
     assert is_iterable(a, allow_str=True) is True
+
+
+def test_chunked():
+    chunks = list(chunked(iter(range(5)), 2))
+    assert chunks == [[0, 1], [2, 3], [4]]
@@ -0,0 +1,603 @@
+"""
+Local HTTP/JSON API over the backend, for dashboards and other
+tools that query entries without shelling out to the cli.
+
+Requests are handled by asyncio, while backend calls run in a
+bounded pool of worker threads. Each worker opens its own backend
+the first time it is used, and reuses it, along with its
+connection, for every request it serves after that.
+
+Available endpoints:
+    - `POST /entries`: writes an entry given as
+      `{"content", "tags", "created_at", "uuid"}`, only `content`
+      being required, or a list of them
+    - `GET /entries`: reads entries, filtered by query parameters
+      named after `EntryFilterSettings` fields. Dates are ISO
+      formatted or `mm/dd/YYYY`, and tags comma separated. Pages
+      hold up to `limit` entries, 100 by default, and give the
+      offset of the next page, if any. With `format=ndjson`, or
+      when accepting `application/x-ndjson`, all matching entries
+      are streamed instead, one json object per line
+    - `GET /counts`: # of entries per `group_by`, ie `tag` or
+      `day`, filtered by the same query parameters as entries
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from datetime import datetime
+import json
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from todayi.backend.aggregate import group_bys
+from todayi.backend.base import Backend
+from todayi.backend.filter import EntryFilterSettings
+from todayi.backend.search import search_modes
+from todayi.importer import entry_from_dict, InvalidImportError
+from todayi.model.entry import Entry
+from todayi.model.tag import InvalidTagError, Tag
+
+
+"""
+# of entries per page, unless given a limit, and the max limit
+for pages. Streamed entries are not limited.
+"""
+default_page_size = 100
+max_page_size = 1000
+
+"""
+# of streamed entries read and written at a time, and # of such
+chunks buffered ahead of the client
+"""
+_stream_chunk_size = 500
+_stream_buffered_chunks = 4
+
+_max_body_size = 16 * 1024 * 1024
+
+_max_head_size = 16 * 1024
+
+"""
+Seconds workers wait for each other when closing their backends
+"""
+_close_timeout = 5
+
+_ndjson = "application/x-ndjson"
+
+_reasons = {
+    200: "OK",
+    201: "Created",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    411: "Length Required",
+    413: "Payload Too Large",
+    431: "Request Header Fields Too Large",
+    500: "Internal Server Error",
+}
+
+
+class ApiError(Exception):
+    """
+    Error to use for requests that cannot be served, answered
+    with its status and message.
+    """
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def _parse_datetime(s: str) -> datetime:
+    try:
+        return datetime.fromisoformat(s.strip())
+    except ValueError:
+        return datetime.strptime(s.strip(), "%m/%d/%Y")
+
+
+def _parse_tags(s: str) -> List[Tag]:
+    return [Tag(t.strip()) for t in s.split(",") if t.strip() != ""]
+
+
+def _parse_bool(s: str) -> bool:
+    if s.lower() not in ["true", "false", "1", "0"]:
+        raise ValueError("Expected true or false, got {}".format(s))
+    return s.lower() in ["true", "1"]
+
+
+def _parse_count(s: str) -> int:
+    count = int(s)
+    if count < 0:
+        raise ValueError("Expected a positive number, got {}".format(s))
+    return count
+
+
+def _parse_search_mode(s: str) -> str:
+    if s not in search_modes:
+        raise ValueError("Expected one of {}, got {}".format(search_modes, s))
+    return s
+
+
+"""
+Parsers of query parameters, for each `EntryFilterSettings` field
+"""
+_filter_params = {
+    "content_contains": str,
+    "content_equals": str,
+    "content_not_contains": str,
+    "content_not_equals": str,
+    "after": _parse_datetime,
+    "before": _parse_datetime,
+    "with_tags": _parse_tags,
+    "without_tags": _parse_tags,
+    "search": str,
+    "search_mode": _parse_search_mode,
+    "order_by": str,
+    "descending": _parse_bool,
+    "limit": _parse_count,
+    "offset": _parse_count,
+}
+
+
+def parse_filter(query: Dict[str, str]) -> EntryFilterSettings:
+    """
+    Parses query parameters into filter settings. Parameters that
+    are not filter settings are ignored.
+
+    :param query: query parameter name to value
+    :type query: Dict[str, str]
+    :return: EntryFilterSettings
+    """
+    settings = {}
+    for name, parse in _filter_params.items():
+        value = query.get(name)
+        if value is None:
+            continue
+        try:
+            settings[name] = parse(value)
+        except (ValueError, InvalidTagError) as e:
+            raise ApiError(400, "Invalid {}: {}".format(name, e))
+    return EntryFilterSettings(**settings)
+
+
+def entry_json(entry: Entry) -> Dict[str, Any]:
+    """
+    Converts entry to json, in the form accepted when writing
+    or importing entries.
+    """
+    return {
+        "uuid": entry.uuid,
+        "content": entry.content,
+        "created_at": None
+        if entry.created_at is None
+        else entry.created_at.isoformat(),
+        "tags": [t.name for t in entry.tags],
+    }
+
+
+def _json_line(value: Any) -> bytes:
+    return json.dumps(value, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+class _Request:
+    def __init__(self, method: str, target: str, version: str, headers, body):
+        url = urlsplit(target)
+        self.method = method
+        self.path = url.path.rstrip("/") or "/"
+        self.query = dict((k, v[-1]) for k, v in parse_qs(url.query).items())
+        self.version = version
+        self.headers = headers
+        self.body = body
+
+    @property
+    def keep_alive(self) -> bool:
+        connection = self.headers.get("connection", "").lower()
+        if self.version == "HTTP/1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
+    def json(self) -> Any:
+        try:
+            return json.loads(self.body)
+        except ValueError as e:
+            raise ApiError(400, "Invalid json body: {}".format(e))
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Optional[_Request]:
+    """
+    Reads a request off of a connection. Its request line and
+    headers may take up to `_max_head_size` bytes.
+
+    :return: Optional[_Request] or None once the client closed it
+    """
+    line = await _read_head_line(reader, _max_head_size)
+    if line.strip() == b"":
+        return None
+    try:
+        method, target, version = line.decode("latin-1").split()
+    except ValueError:
+        raise ApiError(400, "Invalid request line")
+    head_size = len(line)
+    headers = {}
+    while True:
+        line = await _read_head_line(reader, _max_head_size - head_size)
+        head_size += len(line)
+        if line in [b"\r\n", b"\n", b""]:
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    body = b""
+    if method in ["POST", "PUT"]:
+        if "content-length" not in headers:
+            raise ApiError(411, "Content-Length required")
+        try:
+            length = int(headers["content-length"])
+        except ValueError:
+            raise ApiError(400, "Invalid Content-Length")
+        if length > _max_body_size:
+            raise ApiError(413, "Body larger than {} bytes".format(_max_body_size))
+        body = await reader.readexactly(length)
+    return _Request(method, target, version, headers, body)
+
+
+async def _read_head_line(reader: asyncio.StreamReader, max_size: int) -> bytes:
+    try:
+        # Lines longer than the reader's limit raise ValueError
+        line = await reader.readline()
+    except ValueError:
+        line = None
+    if line is None or len(line) > max_size:
+        raise ApiError(
+            431, "Request line and headers larger than {} bytes".format(_max_head_size)
+        )
+    return line
+
+
+def _head(status: int, headers: List[Tuple[str, str]]) -> bytes:
+    lines = ["HTTP/1.1 {} {}".format(status, _reasons[status])]
+    lines.extend("{}: {}".format(k, v) for k, v in headers)
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+class ApiServer:
+    """
+    Serves the API over asyncio streams, running backend calls
+    in a bounded pool of threads, each with its own backend.
+
+    :param open_backend: opens a new backend, called once per worker
+    :type open_backend: Callable[[], Backend]
+    :param workers: max # of backend calls run at once
+    :type workers: int
+    :param prepare: optionally called with a worker's backend before
+                    each backend call, ie to compact journaled entries
+    :type prepare: Optional[Callable[[Backend], Any]]
+    """
+
+    def __init__(
+        self,
+        open_backend: Callable[[], Backend],
+        workers: int = 4,
+        prepare: Optional[Callable[[Backend], Any]] = None,
+    ):
+        self._open_backend = open_backend
+        self._workers = workers
+        self._prepare = prepare
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="todayi-api"
+        )
+
+    async def serve(self, host: str, port: int, started: Optional[Callable] = None):
+        """
+        Serves the API until cancelled.
+
+        :param host: host to bind to
+        :type host: str
+        :param port: port to bind to, or 0 for any free port
+        :type port: int
+        :param started: called with the server's socket names once
+                        it accepts connections
+        :type started: Callable
+        """
+        server = await asyncio.start_server(
+            self.handle_connection, host, port, limit=_max_head_size
+        )
+        try:
+            if started is not None:
+                started([s.getsockname() for s in server.sockets])
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self._close_backends()
+            self._executor.shutdown(wait=True)
+
+    async def handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        """
+        Serves requests sent over a connection, until the client
+        closes it or asks to.
+        """
+        try:
+            while True:
+                try:
+                    request = await _read_request(reader)
+                    if request is None:
+                        break
+                    keep_alive = await self._respond(request, writer)
+                except ApiError as e:
+                    self._write_json(writer, e.status, {"error": str(e)}, False)
+                    keep_alive = False
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    raise
+                except Exception as e:
+                    self._write_json(writer, 500, {"error": str(e)}, False)
+                    keep_alive = False
+                await writer.drain()
+                if keep_alive is False:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, request: _Request, writer: asyncio.StreamWriter) -> bool:
+        """
+        Routes and answers a request.
+
+        :return: bool whether or not the connection may be kept alive
+        """
+        routes = {
+            "/entries": {"GET": self._read_entries, "POST": self._write_entries},
+            "/counts": {"GET": self._count_entries},
+        }
+        methods = routes.get(request.path)
+        if methods is None:
+            raise ApiError(404, "No such endpoint: {}".format(request.path))
+        handler = methods.get(request.method)
+        if handler is None:
+            raise ApiError(405, "Allowed: {}".format(", ".join(methods)))
+        try:
+            return await handler(request, writer)
+        except (KeyError, ValueError, InvalidTagError, InvalidImportError) as e:
+            raise ApiError(400, str(e).strip("'"))
+
+    async def _run(self, fn: Callable, *args) -> Any:
+        """
+        Runs fn with the worker's backend in the thread pool.
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, self._with_backend, fn, args
+        )
+
+    async def _close_backends(self):
+        """
+        Closes the backend of each worker, from the worker itself,
+        as backends may only be closed by the thread that opened
+        them. Workers wait on a barrier, so each runs one close. The
+        barrier times out, so that a worker still busy, or a failed
+        close, cannot keep the others waiting.
+        """
+        barrier = threading.Barrier(self._workers, timeout=_close_timeout)
+
+        def close():
+            try:
+                backend = getattr(self._local, "backend", None)
+                if backend is not None:
+                    self._local.backend = None
+                    backend.close()
+            finally:
+                try:
+                    barrier.wait()
+                except threading.BrokenBarrierError:
+                    pass
+
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(
+            *(
+                loop.run_in_executor(self._executor, close)
+                for _ in range(self._workers)
+            ),
+            return_exceptions=True,
+        )
+
+    def _with_backend(self, fn: Callable, args: Tuple) -> Any:
+        backend = getattr(self._local, "backend", None)
+        if backend is None:
+            backend = self._local.backend = self._open_backend()
+        if self._prepare is not None:
+            self._prepare(backend)
+        return fn(backend, *args)
+
+    async def _write_entries(
+        self, request: _Request, writer: asyncio.StreamWriter
+    ) -> bool:
+        body = request.json()
+        records = body if isinstance(body, list) else [body]
+        if not all(isinstance(r, dict) for r in records):
+            raise ApiError(400, "Expected an entry object or a list of them")
+        entries = [entry_from_dict(r) for r in records]
+        await self._run(lambda backend: backend.write_entries(entries))
+        uuids = [e.uuid for e in entries]
+        result = {"uuids": uuids} if isinstance(body, list) else {"uuid": uuids[0]}
+        self._write_json(writer, 201, result, request.keep_alive)
+        return request.keep_alive
+
+    async def _read_entries(
+        self, request: _Request, writer: asyncio.StreamWriter
+    ) -> bool:
+        entry_filter = parse_filter(request.query)
+        if entry_filter.order_by is None and entry_filter.search is None:
+            # Pages are only consistent in a stable order
+            entry_filter = replace(entry_filter, order_by="created_at")
+        if request.query.get("format") == "ndjson" or _ndjson in request.headers.get(
+            "accept", ""
+        ):
+            return await self._stream_entries(entry_filter, request, writer)
+
+        offset = entry_filter.offset or 0
+        limit = default_page_size if entry_filter.limit is None else entry_filter.limit
+        if limit > max_page_size:
+            raise ApiError(400, "Max limit is {}".format(max_page_size))
+        # Reads an extra entry to know whether there is a next page
+        page_filter = replace(entry_filter, limit=limit + 1, offset=offset)
+        entries = await self._run(
+            lambda backend: [entry_json(e) for e in backend.read_entries(page_filter)]
+        )
+        page = {
+            "entries": entries[:limit],
+            "offset": offset,
+            "limit": limit,
+            "next_offset": offset + limit if len(entries) > limit else None,
+        }
+        self._write_json(writer, 200, page, request.keep_alive)
+        return request.keep_alive
+
+    async def _stream_entries(
+        self,
+        entry_filter: EntryFilterSettings,
+        request: _Request,
+        writer: asyncio.StreamWriter,
+    ) -> bool:
+        """
+        Streams entries as chunked NDJSON, or to HTTP/1.0 clients,
+        which do not know chunked encoding, as NDJSON ended by
+        closing the connection. A single worker reads
+        entries with `iter_entries`, so that they are read off of
+        one cursor, and hands chunks over through a bounded queue,
+        so that reading never gets far ahead of the client.
+        """
+        loop = asyncio.get_running_loop()
+        chunks: asyncio.Queue = asyncio.Queue(maxsize=_stream_buffered_chunks)
+        cancelled = threading.Event()
+
+        def put(chunk: Optional[bytes]):
+            asyncio.run_coroutine_threadsafe(chunks.put(chunk), loop).result()
+
+        def read(backend: Backend):
+            try:
+                lines = []
+                entries = backend.iter_entries(
+                    filter=entry_filter, chunk_size=_stream_chunk_size
+                )
+                for entry in entries:
+                    lines.append(_json_line(entry_json(entry)))
+                    if len(lines) == _stream_chunk_size:
+                        if cancelled.is_set():
+                            return
+                        put(b"".join(lines))
+                        lines = []
+                if len(lines) > 0:
+                    put(b"".join(lines))
+            finally:
+                put(None)
+
+        reading = asyncio.ensure_future(self._run(read))
+        chunk = b""
+        try:
+            chunk = await chunks.get()
+            if chunk is None:
+                # Nothing was sent yet, so errors can still be answered
+                await reading
+            chunked = request.version != "HTTP/1.0"
+            keep_alive = chunked and request.keep_alive
+            headers = [("Content-Type", _ndjson)]
+            if chunked is True:
+                headers.append(("Transfer-Encoding", "chunked"))
+            headers.append(("Connection", "keep-alive" if keep_alive else "close"))
+            writer.write(_head(200, headers))
+            while chunk is not None:
+                if chunked is True:
+                    writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                else:
+                    writer.write(chunk)
+                await writer.drain()
+                chunk = await chunks.get()
+        finally:
+            if chunk is not None:
+                # Client went away, so stop reading, unblock the reader,
+                # and wait for it to release its worker. A backend call
+                # cannot be cancelled once it runs, so it is awaited,
+                # along with any error it ended with
+                cancelled.set()
+                while chunk is not None:
+                    chunk = await chunks.get()
+                await asyncio.gather(reading, return_exceptions=True)
+        try:
+            await reading
+        except Exception:
+            # Closing the connection without ending the stream tells the
+            # client that it was cut short
+            return False
+        if chunked is True:
+            writer.write(b"0\r\n\r\n")
+        return keep_alive
+
+    async def _count_entries(
+        self, request: _Request, writer: asyncio.StreamWriter
+    ) -> bool:
+        entry_filter = parse_filter(request.query)
+        group_by = request.query.get("group_by", "tag")
+        if group_by not in group_bys:
+            raise ApiError(400, "Invalid group_by. Allowed: {}".format(group_bys))
+        counts = await self._run(
+            lambda backend: backend.aggregate(filter=entry_filter, group_by=group_by)
+        )
+        result = {
+            "group_by": group_by,
+            "counts": [{"group": g, "count": c} for g, c in counts],
+        }
+        self._write_json(writer, 200, result, request.keep_alive)
+        return request.keep_alive
+
+    def _write_json(
+        self, writer: asyncio.StreamWriter, status: int, value: Any, keep_alive: bool
+    ):
+        body = _json_line(value)
+        writer.write(
+            _head(
+                status,
+                [
+                    ("Content-Type", "application/json"),
+                    ("Content-Length", str(len(body))),
+                    ("Connection", "keep-alive" if keep_alive else "close"),
+                ],
+            )
+            + body
+        )
+
+
+def serve(
+    open_backend: Callable[[], Backend],
+    host: str = "127.0.0.1",
+    port: int = 8421,
+    workers: int = 4,
+    prepare: Optional[Callable[[Backend], Any]] = None,
+):
+    """
+    Serves the API until interrupted.
+
+    :param open_backend: opens a new backend, called once per worker
+    :type open_backend: Callable[[], Backend]
+    :param host: host to bind to
+    :type host: str
+    :param port: port to bind to
+    :type port: int
+    :param workers: max # of backend calls run at once
+    :type workers: int
+    :param prepare: optionally called with a worker's backend before
+                    each backend call
+    :type prepare: Optional[Callable[[Backend], Any]]
+    """
+
+    def started(names):
+        for name in names:
+            print("Serving on http://{}:{}".format(*name[:2]), flush=True)
+
+    try:
+        asyncio.run(
+            ApiServer(open_backend, workers, prepare).serve(host, port, started)
+        )
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,192 @@
+"""
+Module used to compile groupings of entries into sqlite
+expressions, so that counts are computed with `GROUP BY`
+rather than by reading entries. Aggregates over whole days
+are read from the daily rollup tables maintained by triggers,
+see `todayi.backend.migrations`.
+"""
+
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from todayi.backend.filter import EntryFilterSettings
+from todayi.backend.search import search_words
+
+
+"""
+Available groupings:
+    - tag: # of entries per tag, most used first
+    - day: # of entries per day, ie `2020-12-21`
+    - week: # of entries per ISO week, ie `2020-W52`
+    - month: # of entries per month, ie `2020-12`
+"""
+group_bys = ["tag", "day", "week", "month"]
+
+
+"""
+Thursday of the ISO week a datetime falls in. ISO weeks start
+on monday, and belong to the year their thursday falls in.
+"""
+_iso_thursday = "date({0}, '-3 days', 'weekday 4')"
+
+
+_period_expressions = {
+    "day": "date({0})",
+    "week": "strftime('%Y', {1}) || '-W' || "
+    "printf('%02d', (strftime('%j', {1}) - 1) / 7 + 1)",
+    "month": "strftime('%Y-%m', {0})",
+}
+
+
+def check_group_by(group_by: str):
+    if group_by not in group_bys:
+        raise KeyError("Invalid group by. Allowed: \n {}".format("\n".join(group_bys)))
+
+
+def period_expression(group_by: str, column: str = "entries.created_at") -> str:
+    """
+    Compiles a grouping by time period into a sqlite expression
+    labelling the period a datetime column falls in.
+
+    :param group_by: `day`, `week` or `month`
+    :type group_by: str
+    :param column: datetime column
+    :type column: str
+    :return: str
+    """
+    check_group_by(group_by)
+    if group_by not in _period_expressions:
+        raise KeyError("Not a time period: {}".format(group_by))
+    return _period_expressions[group_by].format(column, _iso_thursday.format(column))
+
+
+"""
+Sql selecting rollup counts per group, for days within
+`[:start, :end)`.
+"""
+_rollup_tag_counts = """
+    SELECT tags.name, counts.n FROM (
+        SELECT tag_id, SUM(count) AS n FROM daily_tag_counts
+        WHERE day >= :start AND day < :end
+        GROUP BY tag_id
+    ) AS counts
+    JOIN tags ON tags.id = counts.tag_id
+"""
+
+
+_rollup_period_counts = """
+    SELECT {}, SUM(daily_counts.count) FROM daily_counts
+    WHERE daily_counts.day >= :start AND daily_counts.day < :end
+    GROUP BY 1
+"""
+
+
+@dataclass
+class RollupPlan:
+    """
+    Splits an aggregate into whole days, read from rollups,
+    and the partial days at either end, read from entries.
+
+    :param start: first whole day, inclusive
+    :type start: str
+    :param end: last whole day, exclusive
+    :type end: str
+    :param partial_days: filters selecting entries on partial days
+    :type partial_days: List[EntryFilterSettings]
+    """
+
+    start: str
+    end: str
+    partial_days: List[EntryFilterSettings]
+
+
+def _midnight(d: date) -> datetime:
+    return datetime.combine(d, time.min)
+
+
+def rollup_plan(entry_filter: EntryFilterSettings) -> Optional[RollupPlan]:
+    """
+    Plans reading an aggregate from rollups. Only filters by
+    date can be answered from rollups.
+
+    :param entry_filter: settings for filtering
+    :type entry_filter: EntryFilterSettings
+    :return: RollupPlan, or None if rollups can not be used
+    """
+    unsupported = [
+        entry_filter.content_contains,
+        entry_filter.content_equals,
+        entry_filter.content_not_contains,
+        entry_filter.content_not_equals,
+        entry_filter.with_tags,
+        entry_filter.without_tags,
+    ]
+    if any(f is not None for f in unsupported):
+        return None
+    if entry_filter.search is not None and len(search_words(entry_filter.search)) > 0:
+        return None
+    after, before = entry_filter.after, entry_filter.before
+    start, end, partial_days = date.min, date.max, []
+    if after is not None:
+        start = after.date()
+        if after != _midnight(start):
+            start += timedelta(days=1)
+            partial_days.append(
+                EntryFilterSettings(
+                    after=after,
+                    before=_midnight(start) - timedelta(microseconds=1),
+                )
+            )
+    if before is not None:
+        end = before.date()
+        partial_days.append(EntryFilterSettings(after=_midnight(end), before=before))
+    if start >= end:
+        return None
+    return RollupPlan(start.isoformat(), end.isoformat(), partial_days)
+
+
+def rollup_sql(group_by: str) -> str:
+    """
+    Gets sql selecting rollup counts per group, with named
+    parameters `start` and `end`.
+
+    :param group_by: `tag`, `day`, `week` or `month`
+    :type group_by: str
+    :return: str
+    """
+    if group_by == "tag":
+        return _rollup_tag_counts
+    return _rollup_period_counts.format(period_expression(group_by, "daily_counts.day"))
+
+
+def merge_counts(
+    counts: Iterable[Iterable[Tuple[str, int]]],
+    group_by: str,
+    limit: Optional[int] = None,
+    offset: Optional[int] = None,
+) -> List[Tuple[str, int]]:
+    """
+    Sums counts per group, ordered as `Backend.aggregate` orders them.
+
+    :param counts: lists of group and # of entries
+    :type counts: Iterable[Iterable[Tuple[str, int]]]
+    :param group_by: `tag`, `day`, `week` or `month`
+    :type group_by: str
+    :param limit: max # of groups
+    :type limit: Optional[int]
+    :param offset: # of groups to skip
+    :type offset: Optional[int]
+    :return: List[Tuple[str, int]]
+    """
+    totals: Dict[str, int] = {}
+    for group_counts in counts:
+        for group, n in group_counts:
+            totals[group] = totals.get(group, 0) + n
+    if group_by == "tag":
+        merged = sorted(totals.items(), key=lambda c: (-c[1], c[0]))
+    else:
+        merged = sorted(totals.items())
+    offset = offset or 0
+    end = None if limit is None else offset + limit
+    return merged[offset:end]
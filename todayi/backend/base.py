@@ -1,6 +1,6 @@
 from abc import ABC, abstractmethod
 from datetime import datetime, timedelta
-from typing import List
+from typing import Dict, Iterable, Iterator, List, Tuple
 
 from todayi.backend.filter import EntryFilterSettings
 from todayi.model.entry import Entry
@@ -39,6 +39,23 @@ class Backend(ABC):
         """
         pass
 
+    @abstractmethod
+    def write_entries(self, entries: Iterable[Entry], batch_size: int = 1000) -> int:
+        """
+        Given an iterable of entries, write them to db in
+        batches. Each batch is written within a single
+        transaction, with tags for the whole batch reconciled
+        at once. The iterable is consumed lazily, so it may be
+        a generator over an arbitrarily large input.
+
+        :param entries: the entries to write
+        :type entries: Iterable[Entry]
+        :param batch_size: # of entries to write per transaction
+        :type batch_size: int
+        :return: int # of entries written
+        """
+        pass
+
     @abstractmethod
     def read_entries(
         self,
@@ -55,3 +72,75 @@ class Backend(ABC):
         :return:
         """
         pass
+
+    @abstractmethod
+    def iter_entries(
+        self,
+        filter: EntryFilterSettings = EntryFilterSettings(
+            after=datetime.now() - timedelta(days=2)
+        ),
+        chunk_size: int = 500,
+    ) -> Iterator[Entry]:
+        """
+        Lazily reads entries from backend with given filter
+        settings, ordered by creation time. Entries are fetched
+        `chunk_size` at a time, so memory use does not depend
+        on the # of matching entries.
+
+        :param filter: settings for filtering
+        :type filter: EntryFilterSettings
+        :param chunk_size: # of entries to fetch at a time
+        :type chunk_size: int
+        :return: Iterator[Entry]
+        """
+        pass
+
+    @abstractmethod
+    def aggregate(
+        self, filter: EntryFilterSettings = EntryFilterSettings(), group_by: str = "tag"
+    ) -> List[Tuple[str, int]]:
+        """
+        Counts entries matching filter settings per group, without
+        reading the entries themselves. Groups by tag are ordered
+        most used first, and groups by time period oldest first.
+        Limit and offset apply to groups.
+
+        :param filter: settings for filtering
+        :type filter: EntryFilterSettings
+        :param group_by: `tag`, `day`, `week` or `month`. see
+                         `todayi.backend.aggregate.group_bys`
+        :type group_by: str
+        :return: List[Tuple[str, int]] of group and # of entries
+        """
+        pass
+
+    @abstractmethod
+    def rebuild_rollups(self):
+        """
+        Recomputes rollups used by `Backend.aggregate` from
+        entries, ie if they were modified outside of the backend.
+        """
+        pass
+
+    @abstractmethod
+    def merge(self, file_path: str) -> Dict[str, int]:
+        """
+        Merges entries and tags of another db into the backend,
+        ie one pulled from a remote. Entries are matched by uuid,
+        and tags by name. Entries the backend already has are
+        left as they are.
+
+        :param file_path: path to db to merge from
+        :type file_path: str
+        :return: Dict[str, int] # of rows added, for `tags`,
+                 `entries` and `tag_associations`
+        """
+        pass
+
+    @abstractmethod
+    def close(self):
+        """
+        Closes connections held by the backend. Backends may only
+        be closed by the thread they were opened by.
+        """
+        pass
@@ -0,0 +1,335 @@
+"""
+Module used to read and apply changes to entries, as recorded
+in the `entry_changes` log by triggers. Used by remotes to sync
+only what changed, rather than whole db files. Like migrations,
+operates on a plain `sqlite3.Connection` so that it works with
+dbs written by either backend.
+
+Changes are exchanged as records, one per entry:
+    - `{"uuid", "content", "created_at", "tags": [names]}`
+    - `{"uuid", "deleted": true}` for deleted entries
+"""
+
+import sqlite3
+from typing import Any, Dict, Iterable, Iterator, Optional, Set, Tuple
+from uuid import uuid4
+
+from todayi.util.iter import chunked
+
+
+"""
+Selects changed entries, with their tag names separated by spaces,
+as tag names may not contain whitespace.
+"""
+_changed_entries = """
+    SELECT
+        entry_changes.uuid,
+        entry_changes.deleted,
+        entries.content,
+        entries.created_at,
+        (
+            SELECT group_concat(name, ' ') FROM (
+                SELECT tags.name FROM entries_tags_associations
+                JOIN tags ON tags.id = entries_tags_associations.tag_id
+                WHERE entries_tags_associations.entry_id = entries.id
+                ORDER BY entries_tags_associations.rowid
+            )
+        )
+    FROM entry_changes
+    LEFT JOIN entries ON entries.uuid = entry_changes.uuid
+    WHERE entry_changes.seq > ? AND entry_changes.seq <= ?
+    ORDER BY entry_changes.seq
+"""
+
+
+"""
+Selects every entry, then tombstones of deleted entries, in the
+same columns as `_changed_entries`. Entries pulled from a remote
+are not in the change log, so snapshots are read from entries.
+"""
+_snapshot_entries = """
+    SELECT
+        entries.uuid,
+        0,
+        entries.content,
+        entries.created_at,
+        (
+            SELECT group_concat(name, ' ') FROM (
+                SELECT tags.name FROM entries_tags_associations
+                JOIN tags ON tags.id = entries_tags_associations.tag_id
+                WHERE entries_tags_associations.entry_id = entries.id
+                ORDER BY entries_tags_associations.rowid
+            )
+        )
+    FROM entries
+    WHERE entries.uuid IS NOT NULL
+    UNION ALL
+    SELECT entry_changes.uuid, 1, NULL, NULL, NULL
+    FROM entry_changes
+    WHERE entry_changes.deleted = 1
+    AND entry_changes.uuid NOT IN (SELECT uuid FROM entries WHERE uuid IS NOT NULL)
+"""
+
+
+_random_uuid = """
+    lower(
+        hex(randomblob(4)) || '-' || hex(randomblob(2)) || '-'
+        || hex(randomblob(2)) || '-' || hex(randomblob(2)) || '-'
+        || hex(randomblob(6))
+    )
+"""
+
+
+"""
+Set based statements applying incoming records, loaded into
+temp tables, to entries and tags.
+"""
+_apply_incoming = [
+    """
+    DELETE FROM entries WHERE uuid IN (
+        SELECT uuid FROM temp.incoming WHERE deleted = 1
+    )
+    """,
+    # Tombstones of pulled deletions, at position 0 so that they
+    # are kept for snapshots but never pushed
+    """
+    INSERT INTO entry_changes (uuid, seq, deleted)
+    SELECT uuid, 0, 1 FROM temp.incoming WHERE deleted = 1
+    ON CONFLICT (uuid) DO UPDATE SET deleted = 1
+    """,
+    """
+    UPDATE entries SET
+        content = (
+            SELECT content FROM temp.incoming WHERE incoming.uuid = entries.uuid
+        ),
+        created_at = (
+            SELECT created_at FROM temp.incoming WHERE incoming.uuid = entries.uuid
+        )
+    WHERE uuid IN (SELECT uuid FROM temp.incoming WHERE deleted = 0)
+    """,
+    """
+    INSERT INTO entries (content, uuid, created_at)
+    SELECT content, uuid, created_at FROM temp.incoming
+    WHERE deleted = 0 AND NOT EXISTS (
+        SELECT 1 FROM entries WHERE entries.uuid = incoming.uuid
+    )
+    ORDER BY created_at
+    """,
+    """
+    INSERT OR IGNORE INTO tags (name, uuid, created_at)
+    SELECT DISTINCT name, {}, datetime('now', 'localtime') FROM temp.incoming_tags
+    """.format(
+        _random_uuid
+    ),
+    """
+    DELETE FROM entries_tags_associations WHERE entry_id IN (
+        SELECT entries.id FROM entries
+        JOIN temp.incoming ON incoming.uuid = entries.uuid
+    )
+    """,
+    """
+    INSERT INTO entries_tags_associations (entry_id, tag_id)
+    SELECT entries.id, tags.id FROM temp.incoming_tags
+    JOIN entries ON entries.uuid = incoming_tags.uuid
+    JOIN tags ON tags.name = incoming_tags.name
+    ORDER BY incoming_tags.n, incoming_tags.rowid
+    """,
+]
+
+
+def get_state(conn: sqlite3.Connection, key: str) -> Optional[str]:
+    row = conn.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+    return None if row is None else row[0]
+
+
+def set_state(conn: sqlite3.Connection, key: str, value: Optional[str]):
+    """
+    Sets sync state. Does not commit.
+    """
+    conn.execute(
+        "INSERT INTO sync_state (key, value) VALUES (?, ?) "
+        "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+        (key, value),
+    )
+
+
+def device_id(conn: sqlite3.Connection) -> str:
+    """
+    Gets id identifying this db among those synced with a remote,
+    creating it if it does not exist yet.
+
+    :param conn: connection to db
+    :type conn: sqlite3.Connection
+    :return: str
+    """
+    device = get_state(conn, "device")
+    if device is None:
+        device = uuid4().hex[:12]
+        with conn:
+            set_state(conn, "device", device)
+    return device
+
+
+def pushed_seq(conn: sqlite3.Connection) -> int:
+    """
+    Gets position in the change log up to which changes were pushed.
+    """
+    return int(get_state(conn, "pushed_seq") or 0)
+
+
+def pending_changes(conn: sqlite3.Connection) -> Tuple[int, Iterator[Dict[str, Any]]]:
+    """
+    Gets changes since they were last pushed.
+
+    :param conn: connection to db
+    :type conn: sqlite3.Connection
+    :return: Tuple[int, Iterator[Dict[str, Any]]] of position in
+             change log of last change, and change records
+    """
+    since = pushed_seq(conn)
+    row = conn.execute("SELECT MAX(seq) FROM entry_changes").fetchone()
+    until = since if row[0] is None else row[0]
+    return until, entry_records(conn.execute(_changed_entries, (since, until)))
+
+
+def snapshot_changes(conn: sqlite3.Connection) -> Iterator[Dict[str, Any]]:
+    """
+    Gets records of all entries, including those pulled from other
+    devices, as well as deleted entries, so that applying them
+    brings any db up to date with this one.
+
+    :param conn: connection to db
+    :type conn: sqlite3.Connection
+    :return: Iterator[Dict[str, Any]]
+    """
+    return entry_records(conn.execute(_snapshot_entries))
+
+
+def entry_records(rows: Iterable[Tuple]) -> Iterator[Dict[str, Any]]:
+    """
+    Converts rows of uuid, deleted, content, created_at and space
+    separated tag names into change records.
+    """
+    for uuid, deleted, content, created_at, tags in rows:
+        if deleted == 1 or content is None:
+            yield {"uuid": uuid, "deleted": True}
+        else:
+            yield {
+                "uuid": uuid,
+                "content": content,
+                "created_at": created_at,
+                "tags": [] if tags is None else tags.split(" "),
+            }
+
+
+def mark_pushed(conn: sqlite3.Connection, seq: int, segment: str):
+    """
+    Records that changes up to seq were pushed as segment.
+    """
+    with conn:
+        set_state(conn, "pushed_seq", str(seq))
+        _mark_seen(conn, segment)
+
+
+def mark_seen(conn: sqlite3.Connection, segment: str):
+    """
+    Records that segment does not need to be pulled.
+    """
+    with conn:
+        _mark_seen(conn, segment)
+
+
+def _mark_seen(conn: sqlite3.Connection, segment: str):
+    conn.execute("INSERT OR IGNORE INTO sync_segments (name) VALUES (?)", (segment,))
+
+
+def seen_segments(conn: sqlite3.Connection) -> Set[str]:
+    return set(r[0] for r in conn.execute("SELECT name FROM sync_segments"))
+
+
+def forget_segments(conn: sqlite3.Connection, segments: Iterable[str]):
+    """
+    Forgets segments, ie those that no longer exist in the remote.
+    """
+    with conn:
+        conn.executemany(
+            "DELETE FROM sync_segments WHERE name = ?", ((s,) for s in segments)
+        )
+
+
+def apply_changes(
+    conn: sqlite3.Connection,
+    records: Iterable[Dict[str, Any]],
+    segment: Optional[str] = None,
+    keep_local_changes: bool = True,
+) -> int:
+    """
+    Applies change records pulled from a remote within a single
+    transaction, and marks segment as seen. Later records for the
+    same entry win. By default, entries with local changes that
+    were not pushed yet are left as is, so that they win once
+    pushed. Applied changes are not recorded in the change log.
+
+    :param conn: connection to db
+    :type conn: sqlite3.Connection
+    :param records: change records
+    :type records: Iterable[Dict[str, Any]]
+    :param segment: name of segment records were read from, if any
+    :type segment: Optional[str]
+    :param keep_local_changes: whether or not to skip records for
+                               entries with changes not pushed yet
+    :type keep_local_changes: bool
+    :return: int # of records applied
+    """
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS incoming (n INTEGER, "
+            "uuid TEXT PRIMARY KEY, content TEXT, created_at TEXT, deleted INTEGER)"
+        )
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS incoming_tags (n, uuid, name)")
+        for batch in chunked(enumerate(records), 1000):
+            conn.executemany(
+                "INSERT OR REPLACE INTO temp.incoming VALUES (?, ?, ?, ?, ?)",
+                (
+                    (
+                        n,
+                        r["uuid"],
+                        r.get("content"),
+                        r.get("created_at"),
+                        int(r.get("deleted") is True),
+                    )
+                    for n, r in batch
+                ),
+            )
+            conn.executemany(
+                "INSERT INTO temp.incoming_tags VALUES (?, ?, ?)",
+                ((n, r["uuid"], name) for n, r in batch for name in r.get("tags", [])),
+            )
+        if keep_local_changes is True:
+            conn.execute(
+                "DELETE FROM temp.incoming WHERE uuid IN "
+                "(SELECT uuid FROM entry_changes WHERE seq > ?)",
+                (pushed_seq(conn),),
+            )
+        # Tags of records that were replaced by later records for
+        # the same entry, or skipped, are dropped
+        conn.execute(
+            "DELETE FROM temp.incoming_tags "
+            "WHERE n NOT IN (SELECT n FROM temp.incoming)"
+        )
+        applied = conn.execute("SELECT COUNT(*) FROM temp.incoming").fetchone()[0]
+        set_state(conn, "applying", "1")
+        for statement in _apply_incoming:
+            conn.execute(statement)
+        conn.execute("DELETE FROM sync_state WHERE key = 'applying'")
+        if segment is not None:
+            _mark_seen(conn, segment)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.execute("DROP TABLE IF EXISTS temp.incoming")
+        conn.execute("DROP TABLE IF EXISTS temp.incoming_tags")
+    return applied
@@ -0,0 +1,132 @@
+"""
+Module used to let several processes read and write a db at
+once, ie scripts logging entries at the same time. Dbs are kept
+in WAL mode by every storage profile, see `todayi.backend.profiles`,
+so that readers do not block writers nor the other way around,
+and connections wait for locks up to a busy timeout rather than
+failing at once. Transactions that still fail to get a lock, ie
+when sqlite gives up on waiting to avoid a deadlock, are retried
+with backoff. Like migrations, operates on a plain
+`sqlite3.Connection` so that it works with either backend.
+
+Files of dbs in WAL mode may not be replaced as is, as changes
+left in the `-wal` file would be applied to the new db. See
+`replace_db`.
+"""
+
+from functools import wraps
+import os
+import random
+import sqlite3
+import time
+from typing import Callable, Optional
+
+
+"""
+ms connections wait for locks held by other connections
+"""
+default_busy_timeout_ms = 5000
+
+
+"""
+# of attempts of transactions failing to get a lock, and delay
+before the first retry in seconds, doubled after each retry
+"""
+_retry_attempts = 5
+_retry_backoff = 0.05
+
+
+_side_file_suffixes = ["-wal", "-shm"]
+
+
+def is_locked(e: Exception) -> bool:
+    """
+    Whether or not an error is due to the db being locked by
+    another connection. Errors raised through SQLAlchemy wrap
+    the original error.
+    """
+    e = getattr(e, "orig", e)
+    return isinstance(e, sqlite3.OperationalError) and (
+        "locked" in str(e) or "busy" in str(e)
+    )
+
+
+def retry_when_locked(fn: Callable) -> Callable:
+    """
+    Decorates a function running a transaction, so that it is
+    retried with exponential backoff if the db is locked. The
+    function must roll back on failure.
+    """
+
+    @wraps(fn)
+    def retrying(*args, **kwargs):
+        for attempt in range(_retry_attempts):
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if attempt == _retry_attempts - 1 or not is_locked(e):
+                    raise e
+            # Jitter keeps writers that failed together from
+            # retrying together
+            time.sleep(_retry_backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+    return retrying
+
+
+@retry_when_locked
+def set_journal_mode(conn: sqlite3.Connection, mode: str = "wal"):
+    """
+    Switches the journal mode of a db, unless it already uses it.
+    The journal mode is kept by the db file, so this only writes
+    once. In memory dbs keep their own journal mode.
+
+    :param conn: connection to db
+    :type conn: sqlite3.Connection
+    :param mode: journal mode, ie `wal`
+    :type mode: str
+    """
+    current = conn.execute("PRAGMA journal_mode").fetchone()[0].lower()
+    if current not in [mode.lower(), "memory"]:
+        conn.execute("PRAGMA journal_mode = {}".format(mode))
+
+
+@retry_when_locked
+def checkpoint(db_path: str):
+    """
+    Moves changes in the `-wal` file of a db into the db file
+    itself, and truncates it, ie before copying the db file.
+
+    :param db_path: path to db
+    :type db_path: str
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        busy = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()[0]
+        if busy == 1:
+            raise sqlite3.OperationalError("database is busy, could not checkpoint")
+    finally:
+        conn.close()
+
+
+def replace_db(source_path: str, db_path: str, backup_path: Optional[str] = None):
+    """
+    Replaces a db file with another one, ie one pulled from a
+    remote. Changes left in the `-wal` file of the db are moved
+    into the db first, so that they are kept in the backup, and
+    never applied to the new db.
+
+    :param source_path: path to new db, moved to db_path
+    :type source_path: str
+    :param db_path: path to db to replace
+    :type db_path: str
+    :param backup_path: optional path to move the replaced db to
+    :type backup_path: Optional[str]
+    """
+    if os.path.exists(db_path):
+        checkpoint(db_path)
+        if backup_path is not None:
+            os.replace(db_path, backup_path)
+    os.replace(source_path, db_path)
+    for suffix in _side_file_suffixes:
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
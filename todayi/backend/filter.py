@@ -29,6 +29,18 @@ class EntryFilterSettings:
     :type with_tags: Optional[List[Tag]]
     :param without_tags: tags what entries shouldn't be associated w/
     :type without_tags: Optional[List[Tag]]
+    :param search: words to search entry content for
+    :type search: Optional[str]
+    :param search_mode: `word`, `prefix` or `phrase`
+    :type search_mode: str
+    :param order_by: field to order entries by, ie `created_at`
+    :type order_by: Optional[str]
+    :param descending: order entries in descending order
+    :type descending: bool
+    :param limit: max # of entries to return
+    :type limit: Optional[int]
+    :param offset: # of entries to skip
+    :type offset: Optional[int]
     """
 
     """
@@ -58,3 +70,22 @@ class EntryFilterSettings:
     """
     with_tags: Optional[List[Tag]] = None
     without_tags: Optional[List[Tag]] = None
+
+    """
+    Available full text search:
+        - entries matching words, word prefixes or a phrase.
+          Unless otherwise ordered, results are ranked by relevance.
+    """
+    search: Optional[str] = None
+    search_mode: str = "word"
+
+    """
+    Available ordering and paging:
+        - order by a field, ascending or descending
+        - limit to a max # of entries
+        - skip a # of entries
+    """
+    order_by: Optional[str] = None
+    descending: bool = False
+    limit: Optional[int] = None
+    offset: Optional[int] = None
@@ -0,0 +1,180 @@
+"""
+Module used to capture entries by appending them to a journal
+file next to the db, rather than writing them to the db itself,
+so that writing an entry costs a single small write and no db
+connection. Each entry is one json line, written with a single
+`write` to a file opened with `O_APPEND`, so lines written by
+several processes at once never interleave.
+
+Journaled entries are compacted into the db, in one transaction,
+before the db is next read. Compaction renames the journal
+first, so that entries captured meanwhile go to a new journal,
+then waits for writers still holding the renamed one. A renamed
+journal left behind by a compaction that did not finish is
+compacted again the next time. Its entries were either all
+written or not at all, and entry uuids are unique, so it is
+never written twice.
+
+Requires `fcntl`, so is only available on POSIX platforms.
+"""
+
+import json
+import os
+import sqlite3
+from typing import Any, Dict, List
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from todayi.backend.base import Backend
+from todayi.importer import entry_from_dict
+from todayi.model.entry import Entry
+
+
+_journal_suffix = ".journal.jsonl"
+
+_compacting_suffix = ".compacting"
+
+_lock_suffix = ".lock"
+
+
+def check_platform():
+    if fcntl is None:
+        raise ImportError("Journal write mode requires fcntl, missing on this platform")
+
+
+def journal_path(db_path: str) -> str:
+    """
+    Path of the journal of a db.
+
+    :param db_path: path to db
+    :type db_path: str
+    :return: str
+    """
+    return db_path + _journal_suffix
+
+
+def entry_record(entry: Entry) -> Dict[str, Any]:
+    """
+    Record of an entry as written to the journal. Readable by
+    `todayi.importer.entry_from_dict`.
+
+    :param entry: entry to record
+    :type entry: Entry
+    :return: Dict[str, Any]
+    """
+    return {
+        "uuid": entry.uuid,
+        "content": entry.content,
+        "created_at": entry.created_at.isoformat(),
+        "tags": [tag.name for tag in entry.tags],
+    }
+
+
+def append(path: str, entry: Entry, fsync: bool = True):
+    """
+    Appends an entry to a journal, creating it if needed.
+
+    :param path: path to journal
+    :type path: str
+    :param entry: entry to append
+    :type entry: Entry
+    :param fsync: whether or not to sync the journal to disk
+                  before returning, so the entry survives power loss
+    :type fsync: bool
+    """
+    check_platform()
+    line = (json.dumps(entry_record(entry)) + "\n").encode("utf-8")
+    while True:
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            # Compactions wait for writers holding the journal
+            fcntl.flock(fd, fcntl.LOCK_SH)
+            # The journal may have been renamed by a compaction
+            # since it was opened, in which case it is reopened
+            if _is_file_at(fd, path):
+                os.write(fd, line)
+                if fsync is True:
+                    os.fsync(fd)
+                return
+        finally:
+            os.close(fd)
+
+
+def has_pending(path: str) -> bool:
+    """
+    Whether or not a journal has entries left to compact.
+
+    :param path: path to journal
+    :type path: str
+    :return: bool
+    """
+    return os.path.exists(path) or os.path.exists(path + _compacting_suffix)
+
+
+def compact(path: str, backend: Backend) -> int:
+    """
+    Writes entries of a journal to a backend, within a single
+    transaction, then removes them from the journal. Only stats
+    the journal when there is nothing to compact.
+
+    :param path: path to journal
+    :type path: str
+    :param backend: backend to write entries to
+    :type backend: Backend
+    :return: int # of entries written
+    """
+    if not has_pending(path):
+        return 0
+    check_platform()
+    compacting = path + _compacting_suffix
+    lock_fd = os.open(path + _lock_suffix, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(lock_fd, fcntl.LOCK_EX)
+        count = 0
+        if os.path.exists(compacting):
+            count += _write_journal(compacting, backend, leftover=True)
+        try:
+            os.rename(path, compacting)
+        except FileNotFoundError:
+            return count
+        return count + _write_journal(compacting, backend)
+    finally:
+        os.close(lock_fd)
+
+
+def _is_file_at(fd: int, path: str) -> bool:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return False
+    fd_stat = os.fstat(fd)
+    return (stat.st_dev, stat.st_ino) == (fd_stat.st_dev, fd_stat.st_ino)
+
+
+def _read_entries(path: str) -> List[Entry]:
+    with open(path, "rb") as f:
+        # Waits for writers that opened the journal before it
+        # was renamed
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        data = f.read()
+    # A line without a newline was cut short by a crashed writer
+    lines = data.split(b"\n")[:-1]
+    return [entry_from_dict(json.loads(line)) for line in lines if line.strip()]
+
+
+def _write_journal(path: str, backend: Backend, leftover: bool = False) -> int:
+    entries = _read_entries(path)
+    if len(entries) > 0:
+        try:
+            backend.write_entries(entries, batch_size=len(entries))
+        except Exception as e:
+            # Already written by a compaction that did not finish
+            already_written = isinstance(getattr(e, "orig", e), sqlite3.IntegrityError)
+            if leftover is False or not already_written:
+                raise e
+            entries = []
+    os.remove(path)
+    return len(entries)
@@ -0,0 +1,202 @@
+"""
+Module used to merge another todayi db into a local one, ie a
+snapshot pulled from a remote, rather than overwriting it. The
+other db is attached, and its entries and tags are copied over
+with a few set based `INSERT ... SELECT` statements. Like
+migrations, operates on a plain `sqlite3.Connection` so that it
+works with dbs written by either backend.
+
+Entries are matched by uuid, and tags by name. Entries that
+exist in both dbs are left as they are locally. Entries of the
+other db without a uuid, written before uuids were, cannot be
+matched, so are not merged.
+"""
+
+import sqlite3
+from typing import Dict
+
+from todayi.backend.migrations import migrate
+
+
+"""
+Tables rows are merged into, as named in merge results.
+"""
+merged_tables = ["tags", "entries", "tag_associations"]
+
+
+"""
+Statements merging the attached `other` db into `main`, along
+with the name of the table they add rows to, if any. Entries
+new to `main` are numbered in `temp.merged_entries` first, and
+inserted with ids following `:max_entry_id`, so that their tag
+associations are mapped without looking entries up by uuid.
+"""
+_merge_statements = [
+    (
+        "tags",
+        """
+        INSERT INTO main.tags (name, uuid, created_at)
+        SELECT name, uuid, created_at FROM other.tags
+        WHERE name IS NOT NULL AND NOT EXISTS (
+            SELECT 1 FROM main.tags WHERE main.tags.name = other.tags.name
+        )
+        ORDER BY id
+        """,
+    ),
+    (
+        None,
+        """
+        CREATE TEMP TABLE merged_entries (
+            n INTEGER PRIMARY KEY,
+            other_id INTEGER NOT NULL UNIQUE
+        )
+        """,
+    ),
+    (
+        None,
+        """
+        INSERT INTO temp.merged_entries (other_id)
+        SELECT id FROM other.entries
+        WHERE uuid IS NOT NULL AND NOT EXISTS (
+            SELECT 1 FROM main.entries WHERE main.entries.uuid = other.entries.uuid
+        )
+        ORDER BY created_at, id
+        """,
+    ),
+    (
+        "entries",
+        """
+        INSERT INTO main.entries (id, content, uuid, created_at)
+        SELECT :max_entry_id + merged.n, content, uuid, created_at
+        FROM temp.merged_entries AS merged
+        JOIN other.entries ON other.entries.id = merged.other_id
+        ORDER BY merged.n
+        """,
+    ),
+    (
+        "tag_associations",
+        """
+        INSERT INTO main.entries_tags_associations (entry_id, tag_id)
+        SELECT :max_entry_id + merged.n, main_tags.id
+        FROM other.entries_tags_associations AS other_associations
+        JOIN temp.merged_entries AS merged
+            ON merged.other_id = other_associations.entry_id
+        JOIN other.tags AS other_tags
+            ON other_tags.id = other_associations.tag_id
+        JOIN main.tags AS main_tags
+            ON main_tags.name = other_tags.name
+        ORDER BY other_associations.rowid
+        """,
+    ),
+]
+
+
+"""
+Triggers maintaining derived tables row by row as entries and
+tag associations are inserted, mapped to set based statements
+maintaining the same tables for all merged rows at once. Merges
+suspend these triggers, which dominate the cost of large merges.
+"""
+_insert_triggers = {
+    "entries_fts_ai": """
+        INSERT INTO main.entries_fts (rowid, content)
+        SELECT id, content FROM main.entries WHERE id > :max_entry_id
+    """,
+    "entries_trigram_ai": """
+        INSERT INTO main.entries_trigram (rowid, content)
+        SELECT id, content FROM main.entries WHERE id > :max_entry_id
+    """,
+    "entries_rollup_ai": """
+        INSERT INTO main.daily_counts (day, count)
+        SELECT date(created_at), COUNT(*) FROM main.entries
+        WHERE id > :max_entry_id AND created_at IS NOT NULL
+        GROUP BY date(created_at)
+        ON CONFLICT (day) DO UPDATE SET count = count + excluded.count
+    """,
+    "entries_tags_associations_rollup_ai": """
+        INSERT INTO main.daily_tag_counts (day, tag_id, count)
+        SELECT date(entries.created_at), associations.tag_id, COUNT(*)
+        FROM main.entries_tags_associations AS associations
+        JOIN main.entries ON entries.id = associations.entry_id
+        WHERE associations.entry_id > :max_entry_id
+        AND entries.created_at IS NOT NULL
+        GROUP BY date(entries.created_at), associations.tag_id
+        ON CONFLICT (day, tag_id) DO UPDATE SET count = count + excluded.count
+    """,
+    "entry_changes_ai": """
+        INSERT INTO main.entry_changes (uuid, seq, deleted)
+        SELECT
+            uuid,
+            (SELECT COALESCE(MAX(seq), 0) FROM main.entry_changes)
+            + ROW_NUMBER() OVER (ORDER BY id),
+            0
+        FROM main.entries WHERE id > :max_entry_id AND uuid IS NOT NULL
+        ON CONFLICT (uuid) DO UPDATE SET seq = excluded.seq, deleted = 0
+    """,
+    "entry_changes_tags_ai": None,
+}
+
+
+"""
+Page cache size used while merging, in KiB as `PRAGMA cache_size`
+takes negative values, as merges insert into several indexes at
+random positions.
+"""
+_merge_cache_size = -64 * 1024
+
+
+def merge_db(conn: sqlite3.Connection, other_path: str) -> Dict[str, int]:
+    """
+    Merges entries and tags of another db into the one conn is
+    connected to, within a single transaction. The other db is
+    migrated first, so it may have been written by an older
+    version of todayi.
+
+    :param conn: connection to db to merge into
+    :type conn: sqlite3.Connection
+    :param other_path: path to db to merge from
+    :type other_path: str
+    :return: Dict[str, int] # of rows added, for `tags`,
+             `entries` and `tag_associations`
+    """
+    other = sqlite3.connect(other_path)
+    try:
+        migrate(other)
+    finally:
+        other.close()
+    conn.commit()
+    cache_size = conn.execute("PRAGMA main.cache_size").fetchone()[0]
+    conn.execute("PRAGMA main.cache_size = {}".format(_merge_cache_size))
+    conn.execute("ATTACH DATABASE ? AS other", (other_path,))
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        params = {
+            "max_entry_id": conn.execute(
+                "SELECT COALESCE(MAX(id), 0) FROM main.entries"
+            ).fetchone()[0]
+        }
+        triggers = conn.execute(
+            "SELECT name, sql FROM main.sqlite_master WHERE type = 'trigger' "
+            "AND name IN ({})".format(", ".join("?" for _ in _insert_triggers)),
+            list(_insert_triggers),
+        ).fetchall()
+        for name, _ in triggers:
+            conn.execute("DROP TRIGGER main.{}".format(name))
+        added = {}
+        for name, statement in _merge_statements:
+            rowcount = conn.execute(statement, params).rowcount
+            if name is not None:
+                added[name] = rowcount
+        for name, sql in triggers:
+            if _insert_triggers[name] is not None:
+                conn.execute(_insert_triggers[name], params)
+            conn.execute(sql)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.execute("DROP TABLE IF EXISTS temp.merged_entries")
+        conn.execute("DETACH DATABASE other")
+        conn.execute("PRAGMA main.cache_size = {}".format(cache_size))
+    return added
@@ -0,0 +1,441 @@
+"""
+Module used to version and upgrade the sqlite schema.
+The current schema version is kept in the `schema_version`
+table. Databases created before versioning was introduced
+have no such table, and are treated as version 0.
+
+Migrations operate on a plain `sqlite3.Connection`, so that
+they can be shared between backends regardless of how they
+talk to sqlite. A migration is either a list of statements,
+or a function taking the connection for migrations that
+depend on what the sqlite build supports.
+"""
+
+import sqlite3
+from typing import Callable, List, Union
+
+
+"""
+Tables as originally created by `todayi.backend.sqlite.SqliteBackend`.
+"""
+_baseline = [
+    """
+    CREATE TABLE IF NOT EXISTS tags (
+        id INTEGER NOT NULL,
+        name VARCHAR,
+        uuid VARCHAR,
+        created_at DATETIME,
+        PRIMARY KEY (id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS entries (
+        id INTEGER NOT NULL,
+        content VARCHAR,
+        uuid VARCHAR,
+        created_at DATETIME,
+        PRIMARY KEY (id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS entries_tags_associations (
+        entry_id INTEGER,
+        tag_id INTEGER,
+        FOREIGN KEY(entry_id) REFERENCES entries (id),
+        FOREIGN KEY(tag_id) REFERENCES tags (id)
+    )
+    """,
+]
+
+
+"""
+Version 1: indexes for date and tag filtering, as well as
+unique constraints on tag names and entry uuids. Duplicates
+that older versions could create are resolved first:
+    - duplicate tags are merged into the oldest tag w/ that name
+    - duplicate entry uuids are regenerated, except for the oldest
+    - duplicate entry/tag associations are dropped
+"""
+_add_indexes = [
+    """
+    UPDATE entries_tags_associations
+    SET tag_id = (
+        SELECT MIN(t.id) FROM tags t
+        WHERE t.name = (SELECT name FROM tags WHERE id = tag_id)
+    )
+    WHERE tag_id NOT IN (SELECT MIN(id) FROM tags GROUP BY name)
+    """,
+    "DELETE FROM tags WHERE id NOT IN (SELECT MIN(id) FROM tags GROUP BY name)",
+    """
+    DELETE FROM entries_tags_associations
+    WHERE rowid NOT IN (
+        SELECT MIN(rowid) FROM entries_tags_associations
+        GROUP BY entry_id, tag_id
+    )
+    """,
+    """
+    UPDATE entries
+    SET uuid = lower(
+        hex(randomblob(4)) || '-' || hex(randomblob(2)) || '-'
+        || hex(randomblob(2)) || '-' || hex(randomblob(2)) || '-'
+        || hex(randomblob(6))
+    )
+    WHERE id NOT IN (SELECT MIN(id) FROM entries GROUP BY uuid)
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_entries_created_at ON entries (created_at)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_entries_uuid ON entries (uuid)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_tags_name ON tags (name)",
+    """
+    CREATE UNIQUE INDEX IF NOT EXISTS ux_entries_tags_associations_tag_entry
+    ON entries_tags_associations (tag_id, entry_id)
+    """,
+]
+
+
+"""
+Version 2: index to load tags for a set of entries.
+"""
+_add_entry_tags_index = [
+    """
+    CREATE INDEX IF NOT EXISTS ix_entries_tags_associations_entry_tag
+    ON entries_tags_associations (entry_id, tag_id)
+    """,
+]
+
+
+"""
+Statements to create an fts5 index over entry content,
+kept in sync with `entries` using triggers.
+"""
+_full_text_index = [
+    """
+    CREATE VIRTUAL TABLE {table} USING fts5(
+        content, content='entries', content_rowid='id', tokenize='{tokenize}'
+    )
+    """,
+    """
+    CREATE TRIGGER {table}_ai AFTER INSERT ON entries BEGIN
+        INSERT INTO {table} (rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER {table}_ad AFTER DELETE ON entries BEGIN
+        INSERT INTO {table} ({table}, rowid, content)
+        VALUES ('delete', old.id, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER {table}_au AFTER UPDATE OF content ON entries BEGIN
+        INSERT INTO {table} ({table}, rowid, content)
+        VALUES ('delete', old.id, old.content);
+        INSERT INTO {table} (rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+    "INSERT INTO {table} ({table}) VALUES ('rebuild')",
+]
+
+
+def _add_full_text_search(conn: sqlite3.Connection):
+    """
+    Version 3: fts5 indexes over entry content. `entries_fts`
+    supports word, prefix and phrase search, and `entries_trigram`
+    supports substring search. Either is skipped if the sqlite
+    build does not support it, in which case backends fall back
+    to `LIKE` queries.
+    """
+    for table, tokenize in [
+        ("entries_fts", "unicode61"),
+        ("entries_trigram", "trigram"),
+    ]:
+        statements = [
+            statement.format(table=table, tokenize=tokenize)
+            for statement in _full_text_index
+        ]
+        try:
+            conn.execute(statements[0])
+        except sqlite3.OperationalError:
+            continue
+        for statement in statements[1:]:
+            conn.execute(statement)
+
+
+"""
+Version 4: # of entries per day, and per day and tag, kept up
+to date by triggers so that aggregates over long periods only
+read one row per day rather than every entry. Deleting an entry
+also deletes its tag associations.
+"""
+_add_daily_rollups = [
+    """
+    CREATE TABLE daily_counts (
+        day TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (day)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE daily_tag_counts (
+        day TEXT NOT NULL,
+        tag_id INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (day, tag_id)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TRIGGER entries_rollup_ai AFTER INSERT ON entries
+    WHEN new.created_at IS NOT NULL BEGIN
+        INSERT INTO daily_counts (day, count) VALUES (date(new.created_at), 1)
+        ON CONFLICT (day) DO UPDATE SET count = count + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER entries_rollup_bd BEFORE DELETE ON entries BEGIN
+        DELETE FROM entries_tags_associations WHERE entry_id = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER entries_rollup_ad AFTER DELETE ON entries
+    WHEN old.created_at IS NOT NULL BEGIN
+        UPDATE daily_counts SET count = count - 1
+        WHERE day = date(old.created_at);
+        DELETE FROM daily_counts WHERE day = date(old.created_at) AND count <= 0;
+    END
+    """,
+    """
+    CREATE TRIGGER entries_rollup_au AFTER UPDATE OF created_at ON entries
+    WHEN date(old.created_at) IS NOT date(new.created_at) BEGIN
+        UPDATE daily_counts SET count = count - 1
+        WHERE day = date(old.created_at);
+        DELETE FROM daily_counts WHERE day = date(old.created_at) AND count <= 0;
+        INSERT INTO daily_counts (day, count)
+        SELECT date(new.created_at), 1 WHERE new.created_at IS NOT NULL
+        ON CONFLICT (day) DO UPDATE SET count = count + 1;
+        UPDATE daily_tag_counts SET count = count - 1
+        WHERE day = date(old.created_at) AND tag_id IN (
+            SELECT tag_id FROM entries_tags_associations WHERE entry_id = new.id
+        );
+        DELETE FROM daily_tag_counts
+        WHERE day = date(old.created_at) AND count <= 0;
+        INSERT INTO daily_tag_counts (day, tag_id, count)
+        SELECT date(new.created_at), tag_id, 1 FROM entries_tags_associations
+        WHERE entry_id = new.id AND new.created_at IS NOT NULL
+        ON CONFLICT (day, tag_id) DO UPDATE SET count = count + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER entries_tags_associations_rollup_ai
+    AFTER INSERT ON entries_tags_associations BEGIN
+        INSERT INTO daily_tag_counts (day, tag_id, count)
+        SELECT date(created_at), new.tag_id, 1 FROM entries
+        WHERE id = new.entry_id AND created_at IS NOT NULL
+        ON CONFLICT (day, tag_id) DO UPDATE SET count = count + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER entries_tags_associations_rollup_ad
+    AFTER DELETE ON entries_tags_associations BEGIN
+        UPDATE daily_tag_counts SET count = count - 1
+        WHERE tag_id = old.tag_id
+        AND day = (SELECT date(created_at) FROM entries WHERE id = old.entry_id);
+        DELETE FROM daily_tag_counts
+        WHERE tag_id = old.tag_id AND count <= 0
+        AND day = (SELECT date(created_at) FROM entries WHERE id = old.entry_id);
+    END
+    """,
+    """
+    CREATE TRIGGER entries_tags_associations_rollup_au
+    AFTER UPDATE ON entries_tags_associations BEGIN
+        UPDATE daily_tag_counts SET count = count - 1
+        WHERE tag_id = old.tag_id
+        AND day = (SELECT date(created_at) FROM entries WHERE id = old.entry_id);
+        DELETE FROM daily_tag_counts
+        WHERE tag_id = old.tag_id AND count <= 0
+        AND day = (SELECT date(created_at) FROM entries WHERE id = old.entry_id);
+        INSERT INTO daily_tag_counts (day, tag_id, count)
+        SELECT date(created_at), new.tag_id, 1 FROM entries
+        WHERE id = new.entry_id AND created_at IS NOT NULL
+        ON CONFLICT (day, tag_id) DO UPDATE SET count = count + 1;
+    END
+    """,
+]
+
+
+"""
+Statements to recompute daily rollups from entries.
+"""
+rebuild_daily_rollups = [
+    "DELETE FROM daily_counts",
+    "DELETE FROM daily_tag_counts",
+    """
+    INSERT INTO daily_counts (day, count)
+    SELECT date(created_at), COUNT(*) FROM entries
+    WHERE created_at IS NOT NULL
+    GROUP BY date(created_at)
+    """,
+    """
+    INSERT INTO daily_tag_counts (day, tag_id, count)
+    SELECT date(entries.created_at), entries_tags_associations.tag_id, COUNT(*)
+    FROM entries_tags_associations
+    JOIN entries ON entries.id = entries_tags_associations.entry_id
+    WHERE entries.created_at IS NOT NULL
+    GROUP BY date(entries.created_at), entries_tags_associations.tag_id
+    """,
+]
+
+
+"""
+Statement recording that an entry changed, used within triggers.
+Each entry has a single row, moved to the end of the log with
+every change. Changes applied from a remote, while the
+`applying` sync state is set, are not recorded.
+"""
+_record_change = """
+    INSERT INTO entry_changes (uuid, seq, deleted)
+    SELECT {uuid}, COALESCE((SELECT MAX(seq) FROM entry_changes), 0) + 1, {deleted}
+    WHERE {uuid} IS NOT NULL AND {condition}
+    AND NOT EXISTS (SELECT 1 FROM sync_state WHERE key = 'applying')
+    ON CONFLICT (uuid) DO UPDATE SET seq = excluded.seq, deleted = excluded.deleted;
+"""
+
+
+def _change(uuid: str, deleted: int = 0, condition: str = "1") -> str:
+    return _record_change.format(uuid=uuid, deleted=deleted, condition=condition)
+
+
+"""
+Version 5: log of changed entries keyed by uuid, so remotes can
+sync only what changed since they last synced, along with local
+sync state. Existing entries are logged as changed.
+"""
+_add_change_log = [
+    """
+    CREATE TABLE entry_changes (
+        uuid TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        deleted INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (uuid)
+    )
+    """,
+    "CREATE INDEX ix_entry_changes_seq ON entry_changes (seq)",
+    """
+    CREATE TABLE sync_state (
+        key TEXT NOT NULL,
+        value TEXT,
+        PRIMARY KEY (key)
+    )
+    """,
+    "CREATE TABLE sync_segments (name TEXT NOT NULL, PRIMARY KEY (name))",
+    "CREATE TRIGGER entry_changes_ai AFTER INSERT ON entries BEGIN {} END".format(
+        _change("new.uuid")
+    ),
+    """
+    CREATE TRIGGER entry_changes_au AFTER UPDATE OF content, created_at, uuid
+    ON entries BEGIN {} {} END
+    """.format(
+        _change("new.uuid"),
+        _change("old.uuid", deleted=1, condition="old.uuid IS NOT new.uuid"),
+    ),
+    "CREATE TRIGGER entry_changes_ad AFTER DELETE ON entries BEGIN {} END".format(
+        _change("old.uuid", deleted=1)
+    ),
+    """
+    CREATE TRIGGER entry_changes_tags_ai AFTER INSERT ON entries_tags_associations
+    BEGIN {} END
+    """.format(
+        _change("(SELECT uuid FROM entries WHERE id = new.entry_id)")
+    ),
+    """
+    CREATE TRIGGER entry_changes_tags_ad AFTER DELETE ON entries_tags_associations
+    BEGIN {} END
+    """.format(
+        _change("(SELECT uuid FROM entries WHERE id = old.entry_id)")
+    ),
+    """
+    INSERT INTO entry_changes (uuid, seq, deleted)
+    SELECT uuid, id, 0 FROM entries WHERE uuid IS NOT NULL
+    """,
+]
+
+
+def has_table(conn: sqlite3.Connection, name: str) -> bool:
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+    ).fetchone()
+    return row is not None
+
+
+"""
+Ordered list of migrations. Migration `i` upgrades the
+schema to version `i + 1`. Only ever append to this list.
+"""
+migrations: List[Union[List[str], Callable[[sqlite3.Connection], None]]] = [
+    _add_indexes,
+    _add_entry_tags_index,
+    _add_full_text_search,
+    _add_daily_rollups + rebuild_daily_rollups,
+    _add_change_log,
+]
+
+
+def latest_version() -> int:
+    return len(migrations)
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    """
+    Gets the current schema version of the db.
+
+    :param conn: connection to db
+    :type conn: sqlite3.Connection
+    :return: int
+    """
+    if not has_table(conn, "schema_version"):
+        return 0
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return 0 if row[0] is None else row[0]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """
+    Upgrades the db to the latest schema version. All
+    pending migrations run within a single transaction, so
+    a failed upgrade leaves the db untouched. Dbs that are
+    already up to date are only read from.
+
+    :param conn: connection to db
+    :type conn: sqlite3.Connection
+    :return: int # of migrations applied
+    """
+    if schema_version(conn) >= latest_version():
+        return 0
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        # Re-check now that the write lock is held, in case
+        # another process migrated the db in the meantime.
+        version = schema_version(conn)
+        if version == 0:
+            for statement in _baseline:
+                conn.execute(statement)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS schema_version "
+                "(version INTEGER NOT NULL)"
+            )
+        for migration in migrations[version:]:
+            if callable(migration):
+                migration(conn)
+                continue
+            for statement in migration:
+                conn.execute(statement)
+        conn.execute("DELETE FROM schema_version")
+        conn.execute(
+            "INSERT INTO schema_version (version) VALUES (?)", (latest_version(),)
+        )
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        raise MigrationError("Could not migrate db schema: {}".format(e)) from e
+    return max(latest_version() - version, 0)
+
+
+class MigrationError(Exception):
+    pass
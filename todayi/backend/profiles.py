@@ -0,0 +1,76 @@
+"""
+Module used to tune how sqlite stores dbs, with named profiles
+of pragmas set on every connection. Profiles are chosen with the
+`storage_profile` config key. Like migrations, operates on a
+plain `sqlite3.Connection` so that it works with either backend.
+
+`page_size` only applies to new dbs, as dbs in WAL mode may not
+change their page size. `journal_mode` is kept by the db file,
+and other pragmas only last as long as the connection.
+"""
+
+import sqlite3
+from typing import Any, Dict
+
+from todayi.backend.concurrency import set_journal_mode
+
+
+"""
+Available storage profiles:
+    - durable: for laptops. Every commit is synced to disk before
+      it returns, so entries survive power loss
+    - throughput: for bulk imports and report servers. Commits are
+      only synced at checkpoints, so the last commits may be lost
+      on power loss, though the db is never corrupted. Reads are
+      served from a larger cache and memory mapped pages. Temp
+      tables and indices are left in files, as keeping them in
+      memory made grouping by tag slower
+"""
+storage_profiles: Dict[str, Dict[str, Any]] = {
+    "durable": {
+        "page_size": 4096,
+        "journal_mode": "wal",
+        "synchronous": "full",
+        "cache_size": -8 * 1024,
+        "mmap_size": 0,
+        "temp_store": "default",
+    },
+    "throughput": {
+        "page_size": 4096,
+        "journal_mode": "wal",
+        "synchronous": "normal",
+        "cache_size": -64 * 1024,
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "default",
+    },
+}
+
+default_storage_profile = "durable"
+
+
+def check_profile(name: str):
+    if name not in storage_profiles:
+        raise KeyError(
+            "Invalid storage profile. Allowed: \n {}".format(
+                "\n".join(storage_profiles)
+            )
+        )
+
+
+def apply_profile(conn: sqlite3.Connection, name: str = default_storage_profile):
+    """
+    Sets pragmas of a storage profile on a connection. Should be
+    called before anything else is run with the connection.
+
+    :param conn: connection to db
+    :type conn: sqlite3.Connection
+    :param name: name of profile, one of `storage_profiles`
+    :type name: str
+    """
+    check_profile(name)
+    profile = storage_profiles[name]
+    if conn.execute("PRAGMA page_count").fetchone()[0] == 0:
+        conn.execute("PRAGMA page_size = {:d}".format(profile["page_size"]))
+    set_journal_mode(conn, profile["journal_mode"])
+    for pragma in ["synchronous", "cache_size", "mmap_size", "temp_store"]:
+        conn.execute("PRAGMA {} = {}".format(pragma, profile[pragma]))
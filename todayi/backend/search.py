@@ -0,0 +1,90 @@
+"""
+Module used to compile full text searches into sqlite
+fts5 query syntax, or into `LIKE` patterns for sqlite
+builds without fts5.
+"""
+
+from typing import List
+
+
+"""
+Available search modes:
+    - word: entries containing every word
+    - prefix: entries containing words starting with every word
+    - phrase: entries containing the words in the given order
+"""
+search_modes = ["word", "prefix", "phrase"]
+
+
+def _check_mode(mode: str):
+    if mode not in search_modes:
+        raise KeyError(
+            "Invalid search mode. Allowed: \n {}".format("\n".join(search_modes))
+        )
+
+
+def _quote(s: str) -> str:
+    return '"{}"'.format(s.replace('"', '""'))
+
+
+def search_words(search: str) -> List[str]:
+    return search.split()
+
+
+def match_expression(search: str, mode: str = "word") -> str:
+    """
+    Compiles a search into an fts5 `MATCH` expression. Words
+    are always quoted, so fts5 operators within the search
+    are matched literally.
+
+    :param search: words to search for
+    :type search: str
+    :param mode: one of `search_modes`
+    :type mode: str
+    :return: str
+    """
+    _check_mode(mode)
+    words = search_words(search)
+    if mode == "phrase":
+        return _quote(" ".join(words))
+    suffix = "*" if mode == "prefix" else ""
+    return " ".join(_quote(w) + suffix for w in words)
+
+
+def substring_expression(pattern: str) -> str:
+    """
+    Compiles a substring into an fts5 `MATCH` expression
+    for a trigram index.
+
+    :param pattern: substring to search for
+    :type pattern: str
+    :return: str
+    """
+    return _quote(pattern)
+
+
+def can_use_trigram(pattern: str) -> bool:
+    """
+    Trigram indexes can only match substrings of at least 3
+    characters. `LIKE` wildcards within the pattern are kept
+    on the `LIKE` path so their meaning is preserved.
+    """
+    return len(pattern) >= 3 and "%" not in pattern and "_" not in pattern
+
+
+def like_patterns(search: str, mode: str = "word") -> List[str]:
+    """
+    Compiles a search into `LIKE` patterns that entries
+    must all match, for when fts5 is unavailable.
+
+    :param search: words to search for
+    :type search: str
+    :param mode: one of `search_modes`
+    :type mode: str
+    :return: List[str]
+    """
+    _check_mode(mode)
+    words = search_words(search)
+    if mode == "phrase":
+        return ["%{}%".format(" ".join(words))]
+    return ["%{}%".format(w) for w in words]
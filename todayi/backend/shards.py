@@ -0,0 +1,224 @@
+"""
+Module used to export entries to text shards, and to update a
+db from them, so that entries can be kept in a git repository
+as text rather than as a binary db. Each shard holds the entries
+created within a month, one json record per line ordered by
+creation time, as `<directory>/<yyyy-mm>.jsonl`. Entries without
+a creation time are kept in `undated.jsonl`.
+
+Only shards of months that changed are rewritten or applied,
+going by a fingerprint of each month's entries in the change
+log and the hash of each shard, as recorded after the last sync.
+Like migrations, operates on a plain `sqlite3.Connection` so
+that it works with dbs written by either backend.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+import sqlite3
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from todayi.backend import changes
+
+
+_shard_suffix = ".jsonl"
+
+_undated = "undated"
+
+_state_key = "shards"
+
+
+"""
+# of entries, and the max and sum of their positions in the change
+log, per month. Any change to the entries of a month changes them.
+"""
+_month_fingerprints = """
+    SELECT
+        COALESCE(substr(entries.created_at, 1, 7), '{}') AS month,
+        COUNT(*),
+        COALESCE(MAX(entry_changes.seq), 0),
+        COALESCE(SUM(entry_changes.seq), 0)
+    FROM entries
+    LEFT JOIN entry_changes ON entry_changes.uuid = entries.uuid
+    GROUP BY month
+""".format(
+    _undated
+)
+
+
+"""
+Selects entries of a month as change records, with their tag
+names separated by spaces.
+"""
+_month_entries = """
+    SELECT
+        entries.uuid,
+        0,
+        entries.content,
+        entries.created_at,
+        (
+            SELECT group_concat(name, ' ') FROM (
+                SELECT tags.name FROM entries_tags_associations
+                JOIN tags ON tags.id = entries_tags_associations.tag_id
+                WHERE entries_tags_associations.entry_id = entries.id
+                ORDER BY entries_tags_associations.rowid
+            )
+        )
+    FROM entries
+    WHERE {}
+    ORDER BY entries.created_at, entries.uuid
+"""
+
+
+def _month_condition(month: str) -> Tuple[str, Tuple]:
+    if month == _undated:
+        return "entries.created_at IS NULL", ()
+    # Datetimes within the month sort after `yyyy-mm` and before `yyyy-mm~`
+    return "entries.created_at >= ? AND entries.created_at < ?", (month, month + "~")
+
+
+def _month_records(conn: sqlite3.Connection, month: str) -> Iterator[Dict[str, Any]]:
+    condition, params = _month_condition(month)
+    return changes.entry_records(conn.execute(_month_entries.format(condition), params))
+
+
+def _month_uuids(conn: sqlite3.Connection, month: str) -> List[str]:
+    condition, params = _month_condition(month)
+    return [
+        r[0]
+        for r in conn.execute(
+            "SELECT uuid FROM entries WHERE {}".format(condition), params
+        )
+    ]
+
+
+def _fingerprints(conn: sqlite3.Connection) -> Dict[str, List[int]]:
+    return {r[0]: list(r[1:]) for r in conn.execute(_month_fingerprints)}
+
+
+def _load_state(conn: sqlite3.Connection) -> Dict[str, Dict[str, Any]]:
+    return json.loads(changes.get_state(conn, _state_key) or "{}")
+
+
+def _save_state(conn: sqlite3.Connection, state: Dict[str, Dict[str, Any]]):
+    with conn:
+        changes.set_state(conn, _state_key, json.dumps(state, sort_keys=True))
+
+
+def _shard_path(directory: str, month: str) -> Path:
+    return Path(directory, month + _shard_suffix)
+
+
+def _shard_months(directory: str) -> List[str]:
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        name[: -len(_shard_suffix)]
+        for name in os.listdir(directory)
+        if name.endswith(_shard_suffix)
+    )
+
+
+def _hash(content: bytes) -> str:
+    return hashlib.sha1(content).hexdigest()
+
+
+def _shard_content(records: Iterator[Dict[str, Any]]) -> bytes:
+    return "".join(
+        json.dumps(record, ensure_ascii=False) + "\n" for record in records
+    ).encode("utf-8")
+
+
+def export_shards(conn: sqlite3.Connection, directory: str) -> List[str]:
+    """
+    Writes shards of months whose entries changed since the last
+    sync, and removes shards of months without entries.
+
+    :param conn: connection to db
+    :type conn: sqlite3.Connection
+    :param directory: directory to write shards to
+    :type directory: str
+    :return: List[str] months whose shards were written or removed
+    """
+    os.makedirs(directory, exist_ok=True)
+    state = _load_state(conn)
+    fingerprints = _fingerprints(conn)
+    changed = []
+    for month, fingerprint in sorted(fingerprints.items()):
+        shard_path = _shard_path(directory, month)
+        synced = state.get(month, {})
+        if synced.get("fingerprint") == fingerprint and shard_path.exists():
+            continue
+        content = _shard_content(_month_records(conn, month))
+        tmp_path = shard_path.with_suffix(".tmp")
+        tmp_path.write_bytes(content)
+        os.replace(str(tmp_path), str(shard_path))
+        state[month] = {"fingerprint": fingerprint, "hash": _hash(content)}
+        changed.append(month)
+    for month in _shard_months(directory):
+        if month not in fingerprints:
+            _shard_path(directory, month).unlink()
+            state.pop(month, None)
+            changed.append(month)
+    _save_state(conn, state)
+    return changed
+
+
+def import_shards(conn: sqlite3.Connection, directory: str) -> List[str]:
+    """
+    Updates db to match shards, ie after pulling them. Only months
+    whose shard or entries changed since the last sync are applied,
+    in a single transaction. Entries of applied months that are not
+    in any applied shard are deleted, so local changes are discarded.
+
+    :param conn: connection to db
+    :type conn: sqlite3.Connection
+    :param directory: directory to read shards from
+    :type directory: str
+    :return: List[str] months applied
+    """
+    state = _load_state(conn)
+    fingerprints = _fingerprints(conn)
+    contents: Dict[str, Optional[bytes]] = {}
+    for month in _shard_months(directory):
+        content = _shard_path(directory, month).read_bytes()
+        synced = state.get(month, {})
+        if synced.get("hash") != _hash(content) or synced.get(
+            "fingerprint"
+        ) != fingerprints.get(month):
+            contents[month] = content
+    for month in fingerprints:
+        if month not in contents and not _shard_path(directory, month).exists():
+            contents[month] = None
+    if len(contents) == 0:
+        return []
+
+    records = [
+        json.loads(line)
+        for content in contents.values()
+        if content is not None
+        for line in content.decode("utf-8").splitlines()
+        if line.strip() != ""
+    ]
+    kept = set(r["uuid"] for r in records)
+    deleted = [
+        {"uuid": uuid, "deleted": True}
+        for month in contents
+        for uuid in _month_uuids(conn, month)
+        if uuid not in kept
+    ]
+    changes.apply_changes(conn, deleted + records, keep_local_changes=False)
+
+    fingerprints = _fingerprints(conn)
+    for month, content in contents.items():
+        if content is None:
+            state.pop(month, None)
+        else:
+            state[month] = {
+                "fingerprint": fingerprints.get(month),
+                "hash": _hash(content),
+            }
+    _save_state(conn, state)
+    return sorted(contents)
@@ -0,0 +1,71 @@
+"""
+Module used to take consistent snapshots of a live sqlite db,
+ie for remotes to push. Copying the db file as is may tear, if
+written to while copied. Snapshots are instead read within a
+single read transaction, so writers are not blocked in WAL mode,
+and only briefly while committing otherwise. Snapshots are
+written compacted, without free pages.
+"""
+
+from contextlib import contextmanager
+import os
+from pathlib import Path
+import sqlite3
+import tempfile
+from typing import Iterator
+
+
+"""
+`VACUUM INTO` was added in sqlite 3.27. Older versions fall
+back to the online backup api, which copies free pages as well.
+"""
+_vacuum_into = sqlite3.sqlite_version_info >= (3, 27, 0)
+
+
+def write_snapshot(db_path: str, target_path: str):
+    """
+    Writes a consistent snapshot of db to a new file.
+
+    :param db_path: path to db
+    :type db_path: str
+    :param target_path: path to write snapshot to, must not exist
+    :type target_path: str
+    """
+    if not os.path.exists(db_path):
+        raise FileNotFoundError("No db to snapshot at {}".format(db_path))
+    # Read only, so that a db removed meanwhile is not created empty
+    conn = sqlite3.connect(
+        "{}?mode=ro".format(Path(db_path).absolute().as_uri()), uri=True
+    )
+    try:
+        if _vacuum_into is True:
+            conn.execute("VACUUM INTO ?", (target_path,))
+        else:
+            target = sqlite3.connect(target_path)
+            try:
+                conn.backup(target)
+            finally:
+                target.close()
+    finally:
+        conn.close()
+
+
+@contextmanager
+def snapshot_file(db_path: str) -> Iterator[str]:
+    """
+    Writes a consistent snapshot of db to a temp file, which is
+    removed once the context exits.
+
+    :param db_path: path to db
+    :type db_path: str
+    :return: Iterator[str] path to snapshot
+    """
+    directory = tempfile.mkdtemp(prefix="todayi-snapshot-")
+    target_path = os.path.join(directory, os.path.basename(db_path))
+    try:
+        write_snapshot(db_path, target_path)
+        yield target_path
+    finally:
+        if os.path.exists(target_path):
+            os.remove(target_path)
+        os.rmdir(directory)
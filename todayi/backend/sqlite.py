@@ -1,23 +1,59 @@
 from datetime import datetime, timedelta
-from typing import List
+from collections import defaultdict
+from dataclasses import replace
+from typing import Dict, Iterable, Iterator, List, Tuple, Union
 
 from sqlalchemy import (
     create_engine,
+    event,
     Table,
     Column,
+    Float,
     Integer,
+    MetaData,
     String,
     DateTime,
     ForeignKey,
+    and_,
+    exists,
     func,
+    literal_column,
+    select,
 )
-from sqlalchemy.orm import relationship, sessionmaker
+from sqlalchemy.orm import Query, relationship, sessionmaker
+from sqlalchemy.pool import SingletonThreadPool
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.sql.expression import Alias
 
-from todayi.backend.base import Backend
+from todayi.backend.aggregate import (
+    check_group_by,
+    merge_counts,
+    period_expression,
+    rollup_plan,
+    rollup_sql,
+)
+from todayi.backend.concurrency import (
+    default_busy_timeout_ms,
+    retry_when_locked,
+)
 from todayi.backend.filter import EntryFilterSettings
+from todayi.backend.merge import merge_db
+from todayi.backend.migrations import has_table, migrate, rebuild_daily_rollups
+from todayi.backend.profiles import (
+    apply_profile,
+    check_profile,
+    default_storage_profile,
+)
+from todayi.backend.search import (
+    can_use_trigram,
+    like_patterns,
+    match_expression,
+    substring_expression,
+)
+from todayi.backend.sqlite_base import BaseSqliteBackend, unique_names
 from todayi.model.entry import Entry
 from todayi.model.tag import Tag
+from todayi.util.iter import chunked
 
 
 Base = declarative_base()
@@ -31,12 +67,32 @@ association_table = Table(
 )
 
 
+"""
+Full text indexes, created by migrations when supported
+by the sqlite build. Not part of `Base.metadata`, as they
+are virtual tables.
+"""
+full_text_table = Table(
+    "entries_fts",
+    MetaData(),
+    Column("rowid", Integer),
+    Column("rank", Float),
+)
+
+
+trigram_table = Table("entries_trigram", MetaData(), Column("rowid", Integer))
+
+
+def _match(table: Table, expression: str):
+    return literal_column(table.name).op("MATCH")(expression)
+
+
 class SqliteTag(Base):
     __tablename__ = "tags"
     id = Column(Integer, primary_key=True)
     name = Column(String)
     uuid = Column(String)
-    created_at = Column(DateTime, default=datetime.now())
+    created_at = Column(DateTime, default=datetime.now)
     entries = relationship(
         "SqliteEntry", secondary=association_table, back_populates="tags"
     )
@@ -47,20 +103,67 @@ class SqliteEntry(Base):
     id = Column(Integer, primary_key=True)
     content = Column(String)
     uuid = Column(String)
-    created_at = Column(DateTime, default=datetime.now())
+    created_at = Column(DateTime, default=datetime.now)
     tags = relationship(
         "SqliteTag", secondary=association_table, back_populates="entries"
     )
 
 
-class SqliteBackend(Backend):
+def _has_any_tag(names: List[str]):
+    """
+    Correlated `EXISTS` clause matching entries associated
+    with any of the tags with given names. Only correlated to
+    entries, so it may be used in queries also joining tags.
+
+    :param names: tag names
+    :type names: List[str]
+    """
+    return (
+        exists()
+        .where(
+            and_(
+                association_table.c.entry_id == SqliteEntry.id,
+                association_table.c.tag_id == SqliteTag.id,
+                SqliteTag.name.in_(names),
+            )
+        )
+        .correlate(SqliteEntry)
+    )
+
+
+def _to_entry(row, tags: Dict[int, List[Tag]]) -> Entry:
+    return Entry(
+        content=row.content,
+        uuid=row.uuid,
+        tags=tags.get(row.id, []),
+        created_at=row.created_at,
+    )
+
+
+class SqliteBackend(BaseSqliteBackend):
 
     _session = None
 
-    def __init__(self, path_to_db: str):
-        self._init_sqlite(path_to_db)
+    _orderable_columns = {
+        "created_at": SqliteEntry.created_at,
+        "content": SqliteEntry.content,
+    }
+
+    _has_fts = False
+
+    _has_trigram = False
+
+    def __init__(
+        self,
+        path_to_db: str,
+        busy_timeout_ms: int = default_busy_timeout_ms,
+        storage_profile: str = default_storage_profile,
+    ):
+        super().__init__()
+        self._init_sqlite(path_to_db, busy_timeout_ms, storage_profile)
         self._session = self._create_session()
 
+    @retry_when_locked
     def reconcile_tags(self, tags: List[Tag]) -> List[Tag]:
         """
         Given a list of tags, resolve such that
@@ -77,20 +180,14 @@ class SqliteBackend(Backend):
         :type tags: List[Tag]
         :return: List[Tag] reconciled with backend
         """
-        reconciled_db_tags = self._reconcile_tags(tags)
-        return [Tag(name=t.name, uuid=t.uuid) for t in reconciled_db_tags]
-
-    def write_entry(self, entry: Entry):
-        """
-        Given an entry, write to db.
-        """
-        tags = entry.tags
-        reconciled_db_tags = self._reconcile_tags(tags)
-        dbentry = SqliteEntry(
-            content=entry.content, uuid=entry.uuid, tags=reconciled_db_tags
-        )
-        self._session.add(dbentry)
-        self._session.commit()
+        try:
+            reconciled = self._reconcile_tags(tags)
+            self._session.commit()
+        except Exception as e:
+            self._session.rollback()
+            self._invalidate_tag_cache()
+            raise e
+        return [Tag(name=t.name, uuid=reconciled[t.name][1]) for t in tags]
 
     def read_entries(
         self,
@@ -106,102 +203,353 @@ class SqliteBackend(Backend):
         :type filter: EntryFilterSettings
         :return: List[Entry]
         """
-        dbentries = self._read_entries(filter)
-        return [
-            Entry(content=e.content, uuid=e.uuid, tags=e.tags, created_at=e.created_at)
-            for e in dbentries
+        query = self._filter_query(self._entry_columns_query(), filter)
+        query = self._page_query(query, filter)
+        rows = query.all()
+        if len(rows) == 0:
+            return []
+        tags = self._load_tags(query.with_entities(SqliteEntry.id).subquery())
+        return [_to_entry(row, tags) for row in rows]
+
+    def iter_entries(
+        self,
+        filter: EntryFilterSettings = EntryFilterSettings(
+            after=datetime.now() - timedelta(days=2)
+        ),
+        chunk_size: int = 500,
+    ) -> Iterator[Entry]:
+        """
+        Lazily reads entries from backend with given filter
+        settings, by default ordered by creation time. Rows are stepped
+        through with the db cursor `chunk_size` at a time, and
+        tags are loaded with one query per chunk.
+
+        :param filter: settings for filtering
+        :type filter: EntryFilterSettings
+        :param chunk_size: # of entries to fetch at a time
+        :type chunk_size: int
+        :return: Iterator[Entry]
+        """
+        chunk_size = min(chunk_size, self._max_variables)
+        if filter.order_by is None and not self._is_searching(filter):
+            filter = replace(filter, order_by="created_at")
+        query = self._filter_query(self._entry_columns_query(), filter)
+        query = self._page_query(query, filter)
+        for rows in chunked(query.yield_per(chunk_size), chunk_size):
+            tags = self._load_tags([row.id for row in rows])
+            for row in rows:
+                yield _to_entry(row, tags)
+
+    def aggregate(
+        self, filter: EntryFilterSettings = EntryFilterSettings(), group_by: str = "tag"
+    ) -> List[Tuple[str, int]]:
+        """
+        Counts entries matching filter settings per group. Filters
+        by date only are answered from daily rollups, reading
+        entries only for partial days at either end of the range.
+        Otherwise counts with a single `GROUP BY` over entries.
+
+        :param filter: settings for filtering
+        :type filter: EntryFilterSettings
+        :param group_by: `tag`, `day`, `week` or `month`
+        :type group_by: str
+        :return: List[Tuple[str, int]] of group and # of entries
+        """
+        check_group_by(group_by)
+        plan = rollup_plan(filter)
+        if plan is None:
+            return self._aggregate_entries(filter, group_by)
+        rollup = self._session.execute(
+            rollup_sql(group_by), {"start": plan.start, "end": plan.end}
+        )
+        counts = [rollup.fetchall()] + [
+            self._aggregate_entries(f, group_by) for f in plan.partial_days
         ]
+        return merge_counts(counts, group_by, filter.limit, filter.offset)
+
+    def rebuild_rollups(self):
+        """
+        Recomputes daily rollups from entries.
+        """
+        try:
+            for statement in rebuild_daily_rollups:
+                self._session.execute(statement)
+            self._session.commit()
+        except Exception as e:
+            self._session.rollback()
+            raise e
+
+    def merge(self, file_path: str) -> Dict[str, int]:
+        """
+        Merges entries and tags of another db into the backend.
+        See `todayi.backend.merge.merge_db`.
+        """
+        self._session.commit()
+        connection = self._engine.raw_connection()
+        try:
+            added = merge_db(connection.connection, file_path)
+        finally:
+            connection.close()
+        self._session.expire_all()
+        return added
+
+    def close(self):
+        """
+        Closes the session, and with it its connection.
+        """
+        self._session.close()
+        self._engine.dispose()
+
+    def _aggregate_entries(
+        self, entry_filter: EntryFilterSettings, group_by: str
+    ) -> List[Tuple[str, int]]:
+        """
+        Counts entries matching filter settings per group with a
+        single `GROUP BY` statement over entries.
+
+        :param entry_filter: settings for filtering
+        :type entry_filter: EntryFilterSettings
+        :param group_by: `tag`, `day`, `week` or `month`
+        :type group_by: str
+        :return: List[Tuple[str, int]] of group and # of entries
+        """
+        count = func.count(SqliteEntry.id)
+        if group_by == "tag":
+            group = SqliteTag.name
+            order = [count.desc(), group]
+        else:
+            group = literal_column(period_expression(group_by))
+            order = [group]
+        query = self._session.query(group, count).select_from(SqliteEntry)
+        query = self._filter_query(query, entry_filter)
+        if group_by == "tag":
+            query = query.join(
+                association_table, association_table.c.entry_id == SqliteEntry.id
+            ).join(SqliteTag, SqliteTag.id == association_table.c.tag_id)
+        query = query.group_by(group).order_by(*order)
+        if entry_filter.limit is not None:
+            query = query.limit(entry_filter.limit)
+        if entry_filter.offset is not None:
+            query = query.offset(entry_filter.offset)
+        return [(key, n) for key, n in query]
 
     def _create_session(self):
         return self.SqliteSession()
 
-    def _init_sqlite(self, path_to_db: str):
-        engine = create_engine("sqlite:///{}".format(path_to_db))
-        Base.metadata.create_all(engine)
+    def _init_sqlite(self, path_to_db: str, busy_timeout_ms: int, storage_profile: str):
+        check_profile(storage_profile)
+        engine = create_engine(
+            "sqlite:///{}".format(path_to_db),
+            connect_args={"timeout": busy_timeout_ms / 1000},
+            # Keeps the connection open between transactions. Once the
+            # last connection to a db in WAL mode closes, it checkpoints
+            poolclass=SingletonThreadPool,
+        )
+        event.listen(
+            engine,
+            "connect",
+            lambda dbapi_connection, _: apply_profile(
+                dbapi_connection, storage_profile
+            ),
+        )
+        connection = engine.raw_connection()
+        try:
+            migrate(connection.connection)
+            self._has_fts = has_table(connection.connection, "entries_fts")
+            self._has_trigram = has_table(connection.connection, "entries_trigram")
+        finally:
+            connection.close()
+        self._engine = engine
         Session = sessionmaker(bind=engine)
         self.SqliteSession = Session
 
-    def _reconcile_tags(self, tags: List[Tag]) -> List[SqliteTag]:
+    @retry_when_locked
+    def _write_batch(self, entries: List[Entry]):
         """
-        Given list of tags, reconcile those tags with db. If
-        tag does not exist, add to db. If it does, return tag
-        from db.
+        Writes a batch of entries within a single transaction.
+        Tags are reconciled once for the whole batch, and
+        associations are inserted in a single statement.
 
-        :param tags: user created tags to resolve with backend
-        :type tags: List[Tag]
-        :return: List[SqliteTag]
+        :param entries: entries to write
+        :type entries: List[Entry]
+        """
+        try:
+            unique_tags = {}
+            for entry in entries:
+                for tag in entry.tags:
+                    unique_tags.setdefault(tag.name, tag)
+            tag_ids = self._reconcile_tags(list(unique_tags.values()))
+            dbentries = [
+                SqliteEntry(
+                    content=entry.content,
+                    uuid=entry.uuid,
+                    created_at=entry.created_at,
+                )
+                for entry in entries
+            ]
+            self._session.add_all(dbentries)
+            self._session.flush()
+            associations = [
+                {"entry_id": dbentry.id, "tag_id": tag_ids[name][0]}
+                for entry, dbentry in zip(entries, dbentries)
+                for name in unique_names(entry.tags)
+            ]
+            if len(associations) > 0:
+                self._session.execute(association_table.insert(), associations)
+            self._session.commit()
+        except Exception as e:
+            self._session.rollback()
+            self._invalidate_tag_cache()
+            raise e
+
+    def _select_tag_rows(self, names: List[str]) -> Iterable[Tuple[int, str, str]]:
+        return self._session.query(SqliteTag.id, SqliteTag.name, SqliteTag.uuid).filter(
+            SqliteTag.name.in_(names)
+        )
+
+    def _insert_tags(self, tags: List[Tag]):
+        created_at = datetime.now()
+        self._session.execute(
+            SqliteTag.__table__.insert().prefix_with("OR IGNORE"),
+            [{"name": t.name, "uuid": t.uuid, "created_at": created_at} for t in tags],
+        )
+
+    def _entry_columns_query(self) -> Query:
+        """
+        Query over entry columns, rather than ORM objects, so
+        that rows are not added to the session's identity map
+        and relationships are never lazily loaded.
+
+        :return: Query
         """
-        result = []
-        for tag in tags:
-            dbtag = self._session.query(SqliteTag).filter_by(name=tag.name).first()
-            if dbtag is None:
-                dbtag = SqliteTag(name=tag.name, uuid=tag.uuid)
-                self._session.add(dbtag)
-                self._session.commit()
-            result.append(dbtag)
-        return result
+        return self._session.query(
+            SqliteEntry.id,
+            SqliteEntry.content,
+            SqliteEntry.uuid,
+            SqliteEntry.created_at,
+        )
+
+    def _load_tags(self, entry_ids: Union[Alias, List[int]]) -> Dict[int, List[Tag]]:
+        """
+        Loads tags for all given entries in a single statement.
+
+        :param entry_ids: subquery selecting entry ids, or list of ids
+        :type entry_ids: Union[Alias, List[int]]
+        :return: Dict[int, List[Tag]] of entry id to its tags
+        """
+        query = self._session.query(
+            association_table.c.entry_id, SqliteTag.name, SqliteTag.uuid
+        )
+        query = query.join(SqliteTag, SqliteTag.id == association_table.c.tag_id)
+        query = query.filter(association_table.c.entry_id.in_(entry_ids))
+        query = query.order_by(literal_column("entries_tags_associations.rowid"))
+        tags = defaultdict(list)
+        for entry_id, name, uuid in query:
+            tags[entry_id].append(Tag(name=name, uuid=uuid))
+        return tags
 
-    def _read_entries(self, entry_filter: EntryFilterSettings) -> List[SqliteEntry]:
+    def _filter_query(self, query: Query, entry_filter: EntryFilterSettings) -> Query:
         """
-        Given filtering settings for entries, return
-        matching records from sqlite
+        Applies filtering settings to a query over entries.
+        All filtering, including by tags, is compiled into
+        the query itself so that it runs as a single statement.
 
+        :param query: query selecting from entries
+        :type query: Query
         :param entry_filter: settings for filtering
         :type entry_filter: EntryFilterSettings
-        :return: List[SqliteEntry]
+        :return: Query
         """
-        query = self._session.query(SqliteEntry)
-
         # Content filtering
         if entry_filter.content_contains is not None:
-            query = query.filter(
-                SqliteEntry.content.like("%{}%".format(entry_filter.content_contains))
-            )
+            query = query.filter(self._contains(entry_filter.content_contains))
         if entry_filter.content_equals is not None:
-            query = query.filter_by(content=entry_filter.content_equals)
+            query = query.filter(SqliteEntry.content == entry_filter.content_equals)
         if entry_filter.content_not_contains:
-            query = query.filter(
-                SqliteEntry.content.notlike(
-                    "%{}%".format(entry_filter.content_not_contains)
-                )
-            )
+            query = query.filter(~self._contains(entry_filter.content_not_contains))
         if entry_filter.content_not_equals is not None:
             query = query.filter(
                 SqliteEntry.content.isnot(entry_filter.content_not_equals)
             )
 
+        # Full text search. Falls back to `LIKE` queries when
+        # this sqlite build does not support fts5.
+        if self._is_searching(entry_filter):
+            search, mode = entry_filter.search, entry_filter.search_mode
+            if self._has_fts is True:
+                query = query.join(
+                    full_text_table, full_text_table.c.rowid == SqliteEntry.id
+                )
+                query = query.filter(
+                    _match(full_text_table, match_expression(search, mode))
+                )
+            else:
+                for pattern in like_patterns(search, mode):
+                    query = query.filter(SqliteEntry.content.like(pattern))
+
         # Date filtering
         if entry_filter.after is not None:
             query = query.filter(SqliteEntry.created_at >= entry_filter.after)
         if entry_filter.before is not None:
             query = query.filter(SqliteEntry.created_at <= entry_filter.before)
 
-        def matching_entries_to_tags(rt: List[SqliteTag]) -> List[int]:
-            """
-            Get matching entry id's that contain all of the tags
-
-            :see: https://stackoverflow.com/questions/3267609
-            """
-            subquery = self._session.query(SqliteEntry.id)
-            subquery = subquery.join(association_table)
-            subquery = subquery.join(SqliteTag)
-            subquery = subquery.filter(SqliteTag.id.in_(r.id for r in resolved_tags))
-            subquery = subquery.group_by(SqliteEntry.id)
-            subquery = subquery.having(func.count(SqliteTag.id) == len(resolved_tags))
-            return [e.id for e in subquery.all()]
-
+        # Tag filtering. Tags are matched by name, so tags that
+        # do not exist yet simply match nothing.
         if entry_filter.with_tags is not None:
-            resolved_tags = self._reconcile_tags(entry_filter.with_tags)
-            query = query.filter(
-                SqliteEntry.id.in_(matching_entries_to_tags(resolved_tags))
-            )
+            for name in unique_names(entry_filter.with_tags):
+                query = query.filter(_has_any_tag([name]))
         if entry_filter.without_tags is not None:
-            resolved_tags = self._reconcile_tags(entry_filter.without_tags)
-            subquery = self._session.query(association_table.c.entry_id)
-            subquery = subquery.filter(
-                association_table.c.tag_id.in_(r.id for r in resolved_tags)
-            )
-            bad_entry_ids = [e.entry_id for e in subquery.all()]
-            query = query.filter(SqliteEntry.id.notin_(bad_entry_ids))
+            names = unique_names(entry_filter.without_tags)
+            if len(names) > 0:
+                query = query.filter(~_has_any_tag(names))
+
+        return query
+
+    def _page_query(self, query: Query, entry_filter: EntryFilterSettings) -> Query:
+        """
+        Applies ordering, limit and offset settings to a query
+        over entries. Ordering by entry id breaks ties, so that
+        paging is stable and the `created_at` index can be used.
 
-        return query.all()
+        :param query: query selecting from entries
+        :type query: Query
+        :param entry_filter: settings for ordering and paging
+        :type entry_filter: EntryFilterSettings
+        :return: Query
+        """
+        if entry_filter.order_by is None and self._is_searching(entry_filter):
+            if self._has_fts is True:
+                query = query.order_by(full_text_table.c.rank, SqliteEntry.id)
+        elif entry_filter.order_by is not None:
+            column = self._orderable_columns.get(entry_filter.order_by)
+            if column is None:
+                raise KeyError(
+                    "Invalid order by field. Allowed: \n {}".format(
+                        "\n".join(self._orderable_columns.keys())
+                    )
+                )
+            columns = [column, SqliteEntry.id]
+            if entry_filter.descending is True:
+                columns = [c.desc() for c in columns]
+            query = query.order_by(*columns)
+        if entry_filter.limit is not None:
+            query = query.limit(entry_filter.limit)
+        if entry_filter.offset is not None:
+            query = query.offset(entry_filter.offset)
+        return query
+
+    def _contains(self, pattern: str):
+        """
+        Clause matching entries with content containing pattern.
+        Uses the trigram index when available.
+
+        :param pattern: substring to match
+        :type pattern: str
+        """
+        if self._has_trigram is True and can_use_trigram(pattern):
+            return SqliteEntry.id.in_(
+                select([trigram_table.c.rowid]).where(
+                    _match(trigram_table, substring_expression(pattern))
+                )
+            )
+        return SqliteEntry.content.like("%{}%".format(pattern))
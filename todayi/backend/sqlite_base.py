@@ -0,0 +1,174 @@
+"""
+Module with logic shared by the sqlite backends,
+`todayi.backend.sqlite.SqliteBackend` and
+`todayi.backend.sqlite_core.SqliteCoreBackend`. Both share a
+schema, and only differ in how they issue statements, so tag
+reconciliation, the tag cache and batching are implemented once
+here, over a few statements each backend implements.
+"""
+
+from abc import abstractmethod
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Tuple
+
+from todayi.backend.base import Backend
+from todayi.backend.filter import EntryFilterSettings
+from todayi.backend.search import search_words
+from todayi.model.entry import Entry
+from todayi.model.tag import Tag
+from todayi.util.iter import chunked
+
+
+def unique_names(tags: Iterable[Tag]) -> List[str]:
+    """
+    Names of tags, without duplicates, in order.
+
+    :param tags: tags to name
+    :type tags: Iterable[Tag]
+    :return: List[str]
+    """
+    return list(dict.fromkeys(t.name for t in tags))
+
+
+class BaseSqliteBackend(Backend):
+    """
+    Base of the sqlite backends. Subclasses write batches of
+    entries, and select and insert tags.
+    """
+
+    """
+    Max # of tag names to keep in the name -> (id, uuid) cache
+    """
+    _tag_cache_size = 1024
+
+    """
+    Max # of bound parameters to use within a single `IN` clause.
+    Older sqlite builds are limited to 999 per statement.
+    """
+    _max_variables = 500
+
+    def __init__(self):
+        self._tag_cache = OrderedDict()
+
+    def write_entry(self, entry: Entry):
+        """
+        Given an entry, write to db.
+        """
+        self.write_entries([entry])
+
+    def write_entries(self, entries: Iterable[Entry], batch_size: int = 1000) -> int:
+        """
+        Given an iterable of entries, write them to db in
+        batches, committing once per batch.
+
+        :param entries: the entries to write
+        :type entries: Iterable[Entry]
+        :param batch_size: # of entries to write per transaction
+        :type batch_size: int
+        :return: int # of entries written
+        """
+        written = 0
+        for batch in chunked(entries, batch_size):
+            self._write_batch(batch)
+            written += len(batch)
+        return written
+
+    @abstractmethod
+    def _write_batch(self, entries: List[Entry]):
+        """
+        Writes a batch of entries within a single transaction.
+        Tags are reconciled once for the whole batch.
+
+        :param entries: entries to write
+        :type entries: List[Entry]
+        """
+        pass
+
+    @abstractmethod
+    def _select_tag_rows(self, names: List[str]) -> Iterable[Tuple[int, str, str]]:
+        """
+        Selects existing tags by name, with a single statement.
+
+        :param names: tag names to select, at most `_max_variables`
+        :type names: List[str]
+        :return: Iterable[Tuple[int, str, str]] of tag id, name and uuid
+        """
+        pass
+
+    @abstractmethod
+    def _insert_tags(self, tags: List[Tag]):
+        """
+        Inserts tags in a single statement, ignoring tags that
+        exist already, ie inserted by another process since they
+        were selected. Tags are not committed here.
+
+        :param tags: tags to insert
+        :type tags: List[Tag]
+        """
+        pass
+
+    def _reconcile_tags(self, tags: List[Tag]) -> Dict[str, Tuple[int, str]]:
+        """
+        Given list of tags, reconcile those tags with db. Tags
+        are resolved from the tag cache where possible, then
+        with a single `IN` query. Tags that do not exist yet
+        are inserted in a single statement. Note that new tags
+        are not committed here.
+
+        :param tags: user created tags to resolve with backend
+        :type tags: List[Tag]
+        :return: Dict[str, Tuple[int, str]] of tag name to (id, uuid)
+        """
+        resolved = {}
+        uncached = {}
+        for tag in tags:
+            cached = self._tag_cache.get(tag.name)
+            if cached is not None:
+                self._tag_cache.move_to_end(tag.name)
+                resolved[tag.name] = cached
+            else:
+                uncached.setdefault(tag.name, tag)
+        if len(uncached) > 0:
+            found = self._select_tags(uncached.keys())
+            missing = [t for name, t in uncached.items() if name not in found]
+            if len(missing) > 0:
+                self._insert_tags(missing)
+                found.update(self._select_tags(t.name for t in missing))
+            for name, row in found.items():
+                self._cache_tag(name, row)
+            resolved.update(found)
+        return resolved
+
+    def _select_tags(self, names: Iterable[str]) -> Dict[str, Tuple[int, str]]:
+        """
+        Selects existing tags by name, chunked to stay under
+        sqlite's bound variable limit.
+
+        :param names: tag names to select
+        :type names: Iterable[str]
+        :return: Dict[str, Tuple[int, str]] of tag name to (id, uuid)
+        """
+        result = {}
+        for chunk in chunked(names, self._max_variables):
+            for tag_id, name, uuid in self._select_tag_rows(chunk):
+                result[name] = (tag_id, uuid)
+        return result
+
+    def _cache_tag(self, name: str, row: Tuple[int, str]):
+        self._tag_cache[name] = row
+        self._tag_cache.move_to_end(name)
+        while len(self._tag_cache) > self._tag_cache_size:
+            self._tag_cache.popitem(last=False)
+
+    def _invalidate_tag_cache(self):
+        """
+        Clears the tag cache. Should be called whenever tags
+        written by this backend may not have been persisted.
+        """
+        self._tag_cache.clear()
+
+    def _is_searching(self, entry_filter: EntryFilterSettings) -> bool:
+        return (
+            entry_filter.search is not None
+            and len(search_words(entry_filter.search)) > 0
+        )
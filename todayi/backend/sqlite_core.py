@@ -0,0 +1,483 @@
+"""
+Sqlite backend built directly on the stdlib `sqlite3` module,
+rather than the SQLAlchemy ORM. Shares its on-disk schema and
+migrations with `todayi.backend.sqlite.SqliteBackend`, so either
+may be used to open the same db. Avoids importing SQLAlchemy and
+building ORM metadata, which dominates the cost of short lived
+processes such as writing a single entry from the cli.
+"""
+
+from collections import defaultdict
+from dataclasses import replace
+from datetime import datetime, timedelta
+import sqlite3
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from todayi.backend.aggregate import (
+    check_group_by,
+    merge_counts,
+    period_expression,
+    rollup_plan,
+    rollup_sql,
+)
+from todayi.backend.concurrency import (
+    default_busy_timeout_ms,
+    retry_when_locked,
+)
+from todayi.backend.filter import EntryFilterSettings
+from todayi.backend.merge import merge_db
+from todayi.backend.migrations import has_table, migrate, rebuild_daily_rollups
+from todayi.backend.profiles import apply_profile, default_storage_profile
+from todayi.backend.search import (
+    can_use_trigram,
+    like_patterns,
+    match_expression,
+    substring_expression,
+)
+from todayi.backend.sqlite_base import BaseSqliteBackend, unique_names
+from todayi.model.entry import Entry
+from todayi.model.tag import Tag
+
+
+"""
+Same format SQLAlchemy uses to store `DateTime` columns in sqlite,
+so that values written by either backend compare correctly.
+"""
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+def to_db_datetime(d: datetime) -> str:
+    return d.strftime(DATETIME_FORMAT)
+
+
+def from_db_datetime(s: Optional[str]) -> Optional[datetime]:
+    return None if s is None else datetime.fromisoformat(s)
+
+
+def _placeholders(n: int) -> str:
+    return ", ".join(["?"] * n)
+
+
+_has_any_tag = """
+    EXISTS (
+        SELECT 1 FROM entries_tags_associations
+        JOIN tags ON tags.id = entries_tags_associations.tag_id
+        WHERE entries_tags_associations.entry_id = entries.id
+        AND tags.name IN ({})
+    )
+"""
+
+
+class SqliteCoreBackend(BaseSqliteBackend):
+    """
+    :param path_to_db: path to sqlite db file, or `:memory:`
+    :type path_to_db: str
+    :param busy_timeout_ms: ms to wait for locks held by other connections
+    :type busy_timeout_ms: int
+    :param storage_profile: name of pragmas to connect with, see
+                            `todayi.backend.profiles.storage_profiles`
+    :type storage_profile: str
+    """
+
+    _orderable_columns = {
+        "created_at": "entries.created_at",
+        "content": "entries.content",
+    }
+
+    _entry_columns = "entries.id, entries.content, entries.uuid, entries.created_at"
+
+    def __init__(
+        self,
+        path_to_db: str,
+        busy_timeout_ms: int = default_busy_timeout_ms,
+        storage_profile: str = default_storage_profile,
+    ):
+        super().__init__()
+        self._conn = sqlite3.connect(path_to_db, timeout=busy_timeout_ms / 1000)
+        apply_profile(self._conn, storage_profile)
+        migrate(self._conn)
+        self._has_fts = has_table(self._conn, "entries_fts")
+        self._has_trigram = has_table(self._conn, "entries_trigram")
+
+    @retry_when_locked
+    def reconcile_tags(self, tags: List[Tag]) -> List[Tag]:
+        """
+        Given a list of tags, resolve such that
+        the following occurs. For each tag in
+        tags, find whether or not that tag already
+        exists in the backend.
+            - If already exists, swap the tag in the
+              input list with the one preexisting
+              within the backend
+            - If does not exist, write the new tags
+              to the backend
+
+        :param tags: user created tags to resolve with backend
+        :type tags: List[Tag]
+        :return: List[Tag] reconciled with backend
+        """
+        try:
+            with self._conn:
+                reconciled = self._reconcile_tags(tags)
+        except Exception as e:
+            self._invalidate_tag_cache()
+            raise e
+        return [Tag(name=t.name, uuid=reconciled[t.name][1]) for t in tags]
+
+    def read_entries(
+        self,
+        filter: EntryFilterSettings = EntryFilterSettings(
+            after=datetime.now() - timedelta(days=2)
+        ),
+    ) -> List[Entry]:
+        """
+        Reads entries from backend with given filter settings.
+        By default reads entries for past 48 hrs.
+
+        :param filter:
+        :type filter: EntryFilterSettings
+        :return: List[Entry]
+        """
+        sql, params = self._entries_sql(filter)
+        rows = self._conn.execute(sql, params).fetchall()
+        if len(rows) == 0:
+            return []
+        tags = self._load_tags("SELECT id FROM ({})".format(sql), params)
+        return [_to_entry(row, tags) for row in rows]
+
+    def iter_entries(
+        self,
+        filter: EntryFilterSettings = EntryFilterSettings(
+            after=datetime.now() - timedelta(days=2)
+        ),
+        chunk_size: int = 500,
+    ) -> Iterator[Entry]:
+        """
+        Lazily reads entries from backend with given filter
+        settings, by default ordered by creation time. Rows are
+        fetched from the cursor `chunk_size` at a time, and
+        tags are loaded with one query per chunk.
+
+        :param filter: settings for filtering
+        :type filter: EntryFilterSettings
+        :param chunk_size: # of entries to fetch at a time
+        :type chunk_size: int
+        :return: Iterator[Entry]
+        """
+        chunk_size = min(chunk_size, self._max_variables)
+        if filter.order_by is None and not self._is_searching(filter):
+            filter = replace(filter, order_by="created_at")
+        sql, params = self._entries_sql(filter)
+        cursor = self._conn.execute(sql, params)
+        try:
+            rows = cursor.fetchmany(chunk_size)
+            while len(rows) > 0:
+                ids = [row[0] for row in rows]
+                tags = self._load_tags(_placeholders(len(ids)), ids)
+                for row in rows:
+                    yield _to_entry(row, tags)
+                rows = cursor.fetchmany(chunk_size)
+        finally:
+            cursor.close()
+
+    def aggregate(
+        self, filter: EntryFilterSettings = EntryFilterSettings(), group_by: str = "tag"
+    ) -> List[Tuple[str, int]]:
+        """
+        Counts entries matching filter settings per group, reading
+        from daily rollups when filtering by date only, mirroring
+        `SqliteBackend.aggregate`.
+
+        :param filter: settings for filtering
+        :type filter: EntryFilterSettings
+        :param group_by: `tag`, `day`, `week` or `month`
+        :type group_by: str
+        :return: List[Tuple[str, int]] of group and # of entries
+        """
+        check_group_by(group_by)
+        plan = rollup_plan(filter)
+        if plan is None:
+            return self._aggregate_entries(filter, group_by)
+        rollup = self._conn.execute(
+            rollup_sql(group_by), {"start": plan.start, "end": plan.end}
+        )
+        counts = [rollup.fetchall()] + [
+            self._aggregate_entries(f, group_by) for f in plan.partial_days
+        ]
+        return merge_counts(counts, group_by, filter.limit, filter.offset)
+
+    def rebuild_rollups(self):
+        """
+        Recomputes daily rollups from entries.
+        """
+        with self._conn:
+            for statement in rebuild_daily_rollups:
+                self._conn.execute(statement)
+
+    def merge(self, file_path: str) -> Dict[str, int]:
+        """
+        Merges entries and tags of another db into the backend.
+        See `todayi.backend.merge.merge_db`.
+        """
+        return merge_db(self._conn, file_path)
+
+    def close(self):
+        """
+        Closes the connection to db.
+        """
+        self._conn.close()
+
+    def _aggregate_entries(
+        self, entry_filter: EntryFilterSettings, group_by: str
+    ) -> List[Tuple[str, int]]:
+        """
+        Counts entries matching filter settings per group with a
+        single `GROUP BY` statement over entries, mirroring
+        `SqliteBackend._aggregate_entries`.
+
+        :param entry_filter: settings for filtering
+        :type entry_filter: EntryFilterSettings
+        :param group_by: `tag`, `day`, `week` or `month`
+        :type group_by: str
+        :return: List[Tuple[str, int]] of group and # of entries
+        """
+        joins, where, params = self._filter_sql(entry_filter)
+        if group_by == "tag":
+            group, order = "tags.name", "COUNT(*) DESC, tags.name"
+            joins += [
+                "JOIN entries_tags_associations "
+                "ON entries_tags_associations.entry_id = entries.id",
+                "JOIN tags ON tags.id = entries_tags_associations.tag_id",
+            ]
+        else:
+            group = order = period_expression(group_by)
+        sql = "SELECT {}, COUNT(*) FROM entries {}".format(group, " ".join(joins))
+        if len(where) > 0:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " GROUP BY {} ORDER BY {}".format(group, order)
+        if entry_filter.limit is not None or entry_filter.offset is not None:
+            sql += " LIMIT ? OFFSET ?"
+            limit = -1 if entry_filter.limit is None else entry_filter.limit
+            params += [limit, entry_filter.offset or 0]
+        return self._conn.execute(sql, params).fetchall()
+
+    @retry_when_locked
+    def _write_batch(self, entries: List[Entry]):
+        """
+        Writes a batch of entries within a single transaction.
+        Tags are reconciled once for the whole batch, and
+        associations are inserted with `executemany`.
+
+        :param entries: entries to write
+        :type entries: List[Entry]
+        """
+        try:
+            with self._conn:
+                unique_tags = {}
+                for entry in entries:
+                    for tag in entry.tags:
+                        unique_tags.setdefault(tag.name, tag)
+                tag_ids = self._reconcile_tags(list(unique_tags.values()))
+                cursor = self._conn.cursor()
+                associations = []
+                for entry in entries:
+                    cursor.execute(
+                        "INSERT INTO entries (content, uuid, created_at) "
+                        "VALUES (?, ?, ?)",
+                        (entry.content, entry.uuid, to_db_datetime(entry.created_at)),
+                    )
+                    associations.extend(
+                        (cursor.lastrowid, tag_ids[name][0])
+                        for name in unique_names(entry.tags)
+                    )
+                cursor.executemany(
+                    "INSERT INTO entries_tags_associations (entry_id, tag_id) "
+                    "VALUES (?, ?)",
+                    associations,
+                )
+        except Exception as e:
+            self._invalidate_tag_cache()
+            raise e
+
+    def _select_tag_rows(self, names: List[str]) -> Iterable[Tuple[int, str, str]]:
+        return self._conn.execute(
+            "SELECT id, name, uuid FROM tags WHERE name IN ({})".format(
+                _placeholders(len(names))
+            ),
+            names,
+        )
+
+    def _insert_tags(self, tags: List[Tag]):
+        created_at = to_db_datetime(datetime.now())
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO tags (name, uuid, created_at) VALUES (?, ?, ?)",
+            [(t.name, t.uuid, created_at) for t in tags],
+        )
+
+    def _load_tags(self, entry_ids_sql: str, params: List[Any]) -> Dict[int, List[Tag]]:
+        """
+        Loads tags for all given entries in a single statement.
+
+        :param entry_ids_sql: sql selecting entry ids, or placeholders for ids
+        :type entry_ids_sql: str
+        :param params: parameters to bind to `entry_ids_sql`
+        :type params: List[Any]
+        :return: Dict[int, List[Tag]] of entry id to its tags
+        """
+        rows = self._conn.execute(
+            """
+            SELECT entries_tags_associations.entry_id, tags.name, tags.uuid
+            FROM entries_tags_associations
+            JOIN tags ON tags.id = entries_tags_associations.tag_id
+            WHERE entries_tags_associations.entry_id IN ({})
+            ORDER BY entries_tags_associations.rowid
+            """.format(
+                entry_ids_sql
+            ),
+            params,
+        )
+        tags = defaultdict(list)
+        for entry_id, name, uuid in rows:
+            tags[entry_id].append(Tag(name=name, uuid=uuid))
+        return tags
+
+    def _entries_sql(self, entry_filter: EntryFilterSettings) -> Tuple[str, List[Any]]:
+        """
+        Compiles filtering, ordering and paging settings into
+        a single statement selecting entries.
+
+        :param entry_filter: settings for filtering
+        :type entry_filter: EntryFilterSettings
+        :return: Tuple[str, List[Any]] of sql and its parameters
+        """
+        joins, where, params = self._filter_sql(entry_filter)
+        sql = "SELECT {} FROM entries {}".format(self._entry_columns, " ".join(joins))
+        if len(where) > 0:
+            sql += " WHERE " + " AND ".join(where)
+        page_sql, page_params = self._page_sql(entry_filter)
+        return sql + page_sql, params + page_params
+
+    def _filter_sql(
+        self, entry_filter: EntryFilterSettings
+    ) -> Tuple[List[str], List[str], List[Any]]:
+        """
+        Compiles filtering settings into joins and `WHERE` clauses
+        over entries, mirroring `SqliteBackend._filter_query`.
+
+        :param entry_filter: settings for filtering
+        :type entry_filter: EntryFilterSettings
+        :return: Tuple[List[str], List[str], List[Any]] of joins,
+                 clauses and their parameters
+        """
+        joins, where, params = [], [], []
+
+        # Content filtering
+        if entry_filter.content_contains is not None:
+            clause, clause_params = self._contains_sql(entry_filter.content_contains)
+            where.append(clause)
+            params.extend(clause_params)
+        if entry_filter.content_equals is not None:
+            where.append("entries.content = ?")
+            params.append(entry_filter.content_equals)
+        if entry_filter.content_not_contains:
+            clause, clause_params = self._contains_sql(
+                entry_filter.content_not_contains
+            )
+            where.append("NOT ({})".format(clause))
+            params.extend(clause_params)
+        if entry_filter.content_not_equals is not None:
+            where.append("entries.content IS NOT ?")
+            params.append(entry_filter.content_not_equals)
+
+        # Full text search. Falls back to `LIKE` queries when
+        # this sqlite build does not support fts5.
+        if self._is_searching(entry_filter):
+            search, mode = entry_filter.search, entry_filter.search_mode
+            if self._has_fts is True:
+                joins.append("JOIN entries_fts ON entries_fts.rowid = entries.id")
+                where.append("entries_fts MATCH ?")
+                params.append(match_expression(search, mode))
+            else:
+                for pattern in like_patterns(search, mode):
+                    where.append("entries.content LIKE ?")
+                    params.append(pattern)
+
+        # Date filtering
+        if entry_filter.after is not None:
+            where.append("entries.created_at >= ?")
+            params.append(to_db_datetime(entry_filter.after))
+        if entry_filter.before is not None:
+            where.append("entries.created_at <= ?")
+            params.append(to_db_datetime(entry_filter.before))
+
+        # Tag filtering. Tags are matched by name, so tags that
+        # do not exist yet simply match nothing.
+        if entry_filter.with_tags is not None:
+            for name in unique_names(entry_filter.with_tags):
+                where.append(_has_any_tag.format("?"))
+                params.append(name)
+        if entry_filter.without_tags is not None:
+            names = unique_names(entry_filter.without_tags)
+            if len(names) > 0:
+                where.append(
+                    "NOT {}".format(_has_any_tag.format(_placeholders(len(names))))
+                )
+                params.extend(names)
+
+        return joins, where, params
+
+    def _page_sql(self, entry_filter: EntryFilterSettings) -> Tuple[str, List[Any]]:
+        """
+        Compiles ordering, limit and offset settings, mirroring
+        `SqliteBackend._page_query`.
+
+        :param entry_filter: settings for ordering and paging
+        :type entry_filter: EntryFilterSettings
+        :return: Tuple[str, List[Any]] of sql and its parameters
+        """
+        sql, params = "", []
+        if entry_filter.order_by is None and self._is_searching(entry_filter):
+            if self._has_fts is True:
+                sql += " ORDER BY entries_fts.rank, entries.id"
+        elif entry_filter.order_by is not None:
+            column = self._orderable_columns.get(entry_filter.order_by)
+            if column is None:
+                raise KeyError(
+                    "Invalid order by field. Allowed: \n {}".format(
+                        "\n".join(self._orderable_columns.keys())
+                    )
+                )
+            direction = " DESC" if entry_filter.descending is True else ""
+            sql += " ORDER BY {0}{1}, entries.id{1}".format(column, direction)
+        if entry_filter.limit is not None or entry_filter.offset is not None:
+            sql += " LIMIT ? OFFSET ?"
+            limit = -1 if entry_filter.limit is None else entry_filter.limit
+            params.extend([limit, entry_filter.offset or 0])
+        return sql, params
+
+    def _contains_sql(self, pattern: str) -> Tuple[str, List[Any]]:
+        """
+        Clause matching entries with content containing pattern.
+        Uses the trigram index when available.
+
+        :param pattern: substring to match
+        :type pattern: str
+        :return: Tuple[str, List[Any]] of sql and its parameters
+        """
+        if self._has_trigram is True and can_use_trigram(pattern):
+            return (
+                "entries.id IN (SELECT rowid FROM entries_trigram "
+                "WHERE entries_trigram MATCH ?)",
+                [substring_expression(pattern)],
+            )
+        return "entries.content LIKE ?", ["%{}%".format(pattern)]
+
+
+def _to_entry(row: Tuple[int, str, str, str], tags: Dict[int, List[Tag]]) -> Entry:
+    entry_id, content, uuid, created_at = row
+    return Entry(
+        content=content,
+        uuid=uuid,
+        tags=tags.get(entry_id, []),
+        created_at=from_db_datetime(created_at),
+    )
@@ -1,9 +1,11 @@
 import argparse
 import sys
+from typing import List, Optional, TYPE_CHECKING
 
-from todayi.config import DEFAULT_CONFIG as default_config
-from todayi.controller import Controller
-from todayi.util.iter import is_iterable
+from todayi.daemon.client import forward, stop as stop_daemon
+
+if TYPE_CHECKING:
+    from todayi.controller import Controller
 
 
 description = """
@@ -18,12 +20,12 @@ Will produce an entry in your record with the date it was created,
 """
 
 
-def set_default_subparser(self, name):
+def set_default_subparser(self, name, args):
     """
-    Set default subparser
+    Set default subparser, by inserting it into args
     """
     subparser_found = False
-    for arg in sys.argv[1:]:
+    for arg in args:
         if arg in ["-h", "--help"]:  # global help if no subparser
             break
     else:
@@ -31,16 +33,41 @@ def set_default_subparser(self, name):
             if not isinstance(x, argparse._SubParsersAction):
                 continue
             for sp_name in x._name_parser_map.keys():
-                if sp_name in sys.argv[1:]:
+                if sp_name in args:
                     subparser_found = True
         if not subparser_found:
             # insert default in last position before global positional
             # arguments, this implies no global options are specified after
             # first positional argument
-            sys.argv.insert(1, name)
+            args.insert(0, name)
+
 
+def run(argv: Optional[List[str]] = None, controller: Optional["Controller"] = None):
+    """
+    Runs a cli command. Unless given arguments, the command line is
+    forwarded to the daemon if it is running, and run in process
+    otherwise.
+
+    :param argv: command line arguments, without the program name
+    :type argv: Optional[List[str]]
+    :param controller: controller to run command with, ie a warm one
+    :type controller: Optional[Controller]
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+        status = forward(argv)
+        if status is not None:
+            if status != 0:
+                sys.exit(status)
+            return
+    argv = list(argv)
+
+    # Only imported once the command is known to run in process
+    from todayi.backend.aggregate import group_bys
+    from todayi.config import DEFAULT_CONFIG as default_config
+    from todayi.controller import Controller
+    from todayi.util.iter import is_iterable
 
-def run():
     filter_kwargs = Controller.filter_kwargs.keys()
 
     def add_filter_kwargs(sp):
@@ -102,13 +129,20 @@ def run():
 
     # Remote
     remote_parser = subparsers.add_parser("remote")
-    remote_parser.add_argument("option", nargs=1, help="Available: push, pull")
+    remote_parser.add_argument("option", nargs=1, help="Available: push, pull, compact")
     remote_parser.add_argument(
         "-B",
         "--backup",
         action="store_true",
         help="Backup changes so they won't overwrite anything",
     )
+    remote_parser.add_argument(
+        "-m",
+        "--merge",
+        action="store_true",
+        help="Merge remote entries into local ones rather than overwriting them. "
+        "Pushes merge before pushing",
+    )
 
     # Report
     valid_report_formats = [
@@ -144,10 +178,89 @@ def run():
         "show", help="Displays last several entries within terminal."
     )
     show_parser.add_argument(
-        "-n", "--number", help="Number of entries to show", default=10
+        "-n", "--number", help="Number of entries to show", type=int, default=10
+    )
+    show_parser.add_argument(
+        "--offset",
+        type=int,
+        default=0,
+        help="Number of most recent entries to skip",
     )
     add_filter_kwargs(show_parser)
 
+    # Search
+    search_parser = subparsers.add_parser(
+        "search", help="Full text search of entries, most relevant first."
+    )
+    search_parser.add_argument("search", nargs="+", help="Words to search for")
+    search_mode = search_parser.add_mutually_exclusive_group()
+    search_mode.add_argument(
+        "--prefix",
+        dest="search_mode",
+        action="store_const",
+        const="prefix",
+        help="Match words starting with each search word",
+    )
+    search_mode.add_argument(
+        "--phrase",
+        dest="search_mode",
+        action="store_const",
+        const="phrase",
+        help="Match search words as an exact phrase",
+    )
+    search_parser.add_argument(
+        "-n", "--number", help="Number of entries to show", type=int, default=10
+    )
+    add_filter_kwargs(search_parser)
+
+    # Stats
+    stats_parser = subparsers.add_parser(
+        "stats", help="Displays # of entries per tag, day, week or month."
+    )
+    stats_parser.add_argument(
+        "-g",
+        "--group-by",
+        dest="group_by",
+        choices=group_bys,
+        default="tag",
+        help="What to count entries by. Weeks are ISO weeks, ie `2020-W52`",
+    )
+    stats_parser.add_argument(
+        "-o",
+        "--output-file",
+        dest="output_file",
+        default=None,
+        help="Output csv to file path instead of showing a table",
+    )
+    stats_parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Recompute daily rollups from entries before showing stats",
+    )
+    add_filter_kwargs(stats_parser)
+
+    # Import
+    import_parser = subparsers.add_parser(
+        "import", help="Imports entries from a jsonl or csv file."
+    )
+    import_parser.add_argument(
+        "input_file", nargs=1, help="Path to file to import, or `-` for stdin"
+    )
+    import_parser.add_argument(
+        "-f",
+        "--format",
+        choices=["jsonl", "csv"],
+        default=None,
+        help="Input format. By default inferred from file extension.",
+    )
+    import_parser.add_argument(
+        "--batch-size",
+        dest="batch_size",
+        type=int,
+        default=1000,
+        help="Number of entries to write per transaction",
+    )
+
     # Config
     config_parser = subparsers.add_parser("config", help="Get and set config values")
     config_parser.add_argument("option", nargs=1, help="`get` or `set`")
@@ -158,6 +271,28 @@ def run():
     )
     config_parser.add_argument("value", nargs="?")
 
+    # Daemon
+    daemon_parser = subparsers.add_parser(
+        "daemon",
+        help="Keeps a warm backend resident, serving commands over a unix socket.",
+    )
+    daemon_parser.add_argument(
+        "--stop", action="store_true", help="Stop the running daemon"
+    )
+
+    # Serve
+    serve_parser = subparsers.add_parser(
+        "serve", help="Serves entries and counts as a local HTTP/JSON API."
+    )
+    serve_parser.add_argument("--host", default="127.0.0.1", help="Host to bind to")
+    serve_parser.add_argument("--port", type=int, default=8421, help="Port to bind to")
+    serve_parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Max number of backend calls run at once, each with its own connection",
+    )
+
     # Default
     default_parser = subparsers.add_parser(
         "default",
@@ -174,12 +309,23 @@ def run():
         default=[],
     )
 
-    parser.set_default_subparser("default")
-    args = parser.parse_args()
+    parser.set_default_subparser("default", argv)
+    args = parser.parse_args(argv)
 
     cmd = args.subcommand
 
-    controller = Controller()
+    if cmd == "daemon":
+        if args.stop is True:
+            if stop_daemon() is False:
+                print("Daemon is not running")
+        else:
+            from todayi.daemon.server import serve
+
+            serve()
+        return
+
+    if controller is None:
+        controller = Controller()
 
     if cmd == "default":
         content = args.content
@@ -190,8 +336,20 @@ def run():
 
     elif cmd == "show":
         display_max = args.number
+        offset = args.offset
         filter_kwargs = get_filter_kwargs(args)
-        controller.print_entries(display_max=display_max, **filter_kwargs)
+        controller.print_entries(
+            display_max=display_max, offset=offset, **filter_kwargs
+        )
+
+    elif cmd == "search":
+        search = " ".join(args.search)
+        mode = args.search_mode or "word"
+        display_max = args.number
+        filter_kwargs = get_filter_kwargs(args)
+        controller.search_entries(
+            search, mode=mode, display_max=display_max, **filter_kwargs
+        )
 
     elif cmd == "report":
         form = args.format[0]
@@ -204,6 +362,20 @@ def run():
         else:
             controller.file_report(form, ofile, **filter_kwargs)
 
+    elif cmd == "stats":
+        if args.rebuild is True:
+            controller.rebuild_stats()
+        filter_kwargs = get_filter_kwargs(args)
+        controller.print_stats(
+            group_by=args.group_by, output_file=args.output_file, **filter_kwargs
+        )
+
+    elif cmd == "import":
+        count = controller.import_entries(
+            args.input_file[0], format=args.format, batch_size=args.batch_size
+        )
+        print("Imported {} entries".format(count))
+
     elif cmd == "config":
         opt = args.option[0]
         key = args.config_name[0]
@@ -217,16 +389,39 @@ def run():
                 "Invalid option for config {}. Valid: [get, set]".format(args.option)
             )
 
+    elif cmd == "serve":
+        from todayi.api import serve
+
+        serve(
+            controller.open_backend,
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            prepare=controller.compact_journal,
+        )
+
     elif cmd == "remote":
         opt = args.option[0]
         backup = args.backup
+        if opt in ["push", "pull"] and args.merge is True:
+            added = controller.merge_remote()
+            if added is not None:
+                print(
+                    "Merged {entries} entries, {tags} tags and "
+                    "{tag_associations} tag associations".format(**added)
+                )
         if opt == "push":
             controller.push_remote(backup_remote=backup)
         elif opt == "pull":
-            controller.pull_remote(backup_local=backup)
+            if args.merge is False:
+                controller.pull_remote(backup_local=backup)
+        elif opt == "compact":
+            controller.compact_remote()
         else:
             raise TypeError(
-                "Invalid option for remote {}. Valid: [push, pull]".format(args.option)
+                "Invalid option for remote {}. Valid: [push, pull, compact]".format(
+                    args.option
+                )
             )
 
 
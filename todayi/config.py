@@ -3,50 +3,169 @@ Module used to interact with configuration file.
 By default, if configuration file does not exist
 the default config is written to a file at
 the specified CONFIG_PATH within users' home
-directory.
+directory, the first time config is read.
+
+Config values may be overridden with environment
+variables named after their key, ie `TODAYI_BACKEND_DIR`
+overrides `backend_dir`. The config file path itself
+may be overridden with `TODAYI_CONFIG_PATH`.
 """
 
 import json
-from typing import Any
+import os
+import tempfile
+from typing import Any, Dict, Mapping, Optional, Tuple
 
-from todayi.util.fs import path, file_text, write_file
+from todayi.util.fs import file_text, path
 
 
 CONFIG_PATH = "~/todayi.config"
 
 
+ENV_PREFIX = "TODAYI_"
+
+
 DEFAULT_CONFIG = {
     "backend": "sqlite",
     "backend_dir": "~/todayi/",
     "backend_filename": "todayi.db",
+    "busy_timeout_ms": 5000,
+    "storage_profile": "durable",
+    "write_mode": "direct",
+    "journal_fsync": "true",
     "remote": "gcs",
     "gcs_bucket_name": "",
+    "gcs_compression": "",
     "git_remote_uri": "",
+    "git_format": "db",
     "github_auth_token": "",
 }
 
 
-file_path = path(CONFIG_PATH)
-
-
 def _check_key(key):
     if key not in DEFAULT_CONFIG.keys():
         raise IndexError("Config: {} is not valid".format(key))
 
 
-def _read_config():
-    return json.loads(file_text(file_path))
-
-
-def _write_config(config):
-    return write_file(json.dumps(config), file_path)
+class Config:
+    """
+    Configuration loaded once per process. Lookups are served
+    from memory, and the file is only re-read when its mtime
+    or size changes, ie when edited by another process.
+    Writes are atomic, so concurrent readers never see a
+    partially written file.
+
+    :param file_path: path to config file
+    :type file_path: str
+    :param environ: environment to read overrides from
+    :type environ: Mapping[str, str]
+    """
 
+    def __init__(
+        self,
+        file_path: Optional[str] = None,
+        environ: Mapping[str, str] = os.environ,
+    ):
+        self._environ = environ
+        if file_path is None:
+            file_path = environ.get(ENV_PREFIX + "CONFIG_PATH", CONFIG_PATH)
+        self.file_path = path(file_path)
+        self._config = None
+        self._stamp = None
+
+    def get(self, key: str) -> Any:
+        """
+        Gets value of config from key
+
+        :param key: config key
+        :type key: str
+        :return: config value
+        """
+        _check_key(key)
+        override = self._environ.get(ENV_PREFIX + key.upper())
+        if override is not None:
+            return override
+        return self._load().get(key, DEFAULT_CONFIG.get(key))
+
+    def set(self, key: str, value: Any):
+        """
+        Sets key/value pair in config
+
+        :param key: config key
+        :type key: str
+        :param value: value to be set
+        :type value: Any
+        """
+        _check_key(key)
+        config = dict(self._load())
+        config[key] = value
+        self._write(config)
+
+    def _load(self) -> Dict[str, Any]:
+        """
+        Gets config, reading from file only if it changed since
+        it was last read. Writes the default config if the file
+        does not exist.
+
+        :return: Dict[str, Any]
+        """
+        stamp = self._file_stamp()
+        if stamp is None:
+            self._write(DEFAULT_CONFIG)
+        elif self._config is None or stamp != self._stamp:
+            self._config = json.loads(file_text(self.file_path))
+            self._stamp = stamp
+        return self._config
+
+    def _write(self, config: Dict[str, Any]):
+        """
+        Writes config to a temp file within the same directory,
+        then renames it over the config file.
+
+        :param config: config to write
+        :type config: Dict[str, Any]
+        """
+        directory = self.file_path.parent
+        directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(
+            dir=str(directory), prefix=".{}.".format(self.file_path.name)
+        )
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(json.dumps(config))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, str(self.file_path))
+        except Exception as e:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise e
+        self._config = dict(config)
+        self._stamp = self._file_stamp()
+
+    def _file_stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = self.file_path.stat()
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+
+_config = None
+
+
+def default_config() -> Config:
+    """
+    Gets the process wide config, creating it on first use.
 
-"""
-If config not present, write the default
-"""
-if not file_path.is_file():
-    _write_config(DEFAULT_CONFIG)
+    :return: Config
+    """
+    global _config
+    if _config is None:
+        _config = Config()
+    return _config
 
 
 def get(key: str) -> Any:
@@ -57,9 +176,7 @@ def get(key: str) -> Any:
     :type key: str
     :return: config value
     """
-    _check_key(key)
-    config = _read_config()
-    return config.get(key, DEFAULT_CONFIG.get(key))
+    return default_config().get(key)
 
 
 def set(key: str, value: Any):
@@ -71,10 +188,7 @@ def set(key: str, value: Any):
     :param value: value to be set
     :type value: Any
     """
-    _check_key(key)
-    config = _read_config()
-    config[key] = value
-    _write_config(config)
+    default_config().set(key, value)
 
 
 class MissingConfigError(Exception):
@@ -1,26 +1,26 @@
+from dataclasses import replace
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import List, Union
+import shutil
+import sys
+import tempfile
+from typing import Dict, List, Optional, Union
 
 from todayi.backend.base import Backend
 from todayi.backend.filter import EntryFilterSettings
-from todayi.backend.sqlite import SqliteBackend
+from todayi.backend.merge import merged_tables
 from todayi.config import (
     get as get_config,
     set as set_config,
     MissingConfigError,
     InvalidConfigError,
 )
-from todayi.frontend.terminal import TerminalFrontend
-from todayi.frontend.csv import CsvFrontend
-from todayi.frontend.gist import GistFrontend
-from todayi.frontend.md import MarkdownFrontend
+from todayi.importer import readers as entry_readers
 from todayi.model.entry import Entry
 from todayi.model.tag import Tag
 from todayi.remote.base import Remote
-from todayi.remote.gcs import GcsRemote
-from todayi.remote.git import GitRemote
 from todayi.util.fs import path
+from todayi.util.registry import Registry
 
 
 class Controller:
@@ -67,10 +67,39 @@ class Controller:
         "without_tags": parse_tags,
     }
 
-    _file_frontends = {
-        "csv": CsvFrontend,
-        "md": MarkdownFrontend,
-    }
+    """
+    Available implementations. Modules are only imported once
+    an implementation is used, so that ie writing an entry does
+    not pay for importing google-cloud-storage or jinja2.
+    """
+    _backends = Registry(
+        {
+            "sqlite": "todayi.backend.sqlite:SqliteBackend",
+            "sqlite_core": "todayi.backend.sqlite_core:SqliteCoreBackend",
+        }
+    )
+
+    _remotes = Registry(
+        {
+            "gcs": "todayi.remote.gcs:GcsRemote",
+            "gcs_delta": "todayi.remote.gcs_delta:GcsDeltaRemote",
+            "git": "todayi.remote.git:GitRemote",
+        }
+    )
+
+    _file_frontends = Registry(
+        {
+            "csv": "todayi.frontend.csv:CsvFrontend",
+            "md": "todayi.frontend.md:MarkdownFrontend",
+        }
+    )
+
+    _frontends = Registry(
+        {
+            "terminal": "todayi.frontend.terminal:TerminalFrontend",
+            "gist": "todayi.frontend.gist:GistFrontend",
+        }
+    )
 
     def __init__(self):
         self._cached_backend = None
@@ -92,7 +121,9 @@ class Controller:
     def write_entry(self, content: str, tags: List[str] = []):
         """
         Given users' input content and a list of tags,
-        write entry to backend.
+        write entry to backend. When `write_mode` is `journal`,
+        the entry is appended to the journal instead, and written
+        to the backend before it is next read.
 
         :param content: entry's content
         :type content: str
@@ -102,31 +133,162 @@ class Controller:
         """
         tags = [Tag(tag) for tag in tags]
         entry = Entry(content, tags=tags)
-        self._backend.write_entry(entry)
+        write_mode = get_config("write_mode")
+        if write_mode == "journal":
+            from todayi.backend.journal import append as append_to_journal
+
+            fsync = str(get_config("journal_fsync")).strip().lower() == "true"
+            append_to_journal(self._journal_path, entry, fsync=fsync)
+        elif write_mode == "direct":
+            self._backend.write_entry(entry)
+        else:
+            raise InvalidConfigError(
+                "Write mode: {} not supported. Valid: [direct, journal]".format(
+                    write_mode
+                )
+            )
 
-    def print_entries(self, display_max: int = 10, **kwargs):
+    def compact_journal(self, backend: Optional[Backend] = None) -> int:
+        """
+        Writes entries captured in the journal to the backend, so
+        that they are read along with other entries. Called before
+        anything reads the backend.
+
+        :param backend: backend to write to, by default the
+                        controller's own
+        :type backend: Optional[Backend]
+        :return: int # of entries written
+        """
+        # Imported here, as journaling is not available on all platforms
+        from todayi.backend.journal import (
+            compact as compact_into_backend,
+            has_pending as journal_has_pending,
+        )
+
+        journal = self._journal_path
+        if not journal_has_pending(journal):
+            return 0
+        return compact_into_backend(
+            journal, self._backend if backend is None else backend
+        )
+
+    def import_entries(
+        self, input_file: str, format: str = None, batch_size: int = 1000
+    ) -> int:
+        """
+        Streams entries from a jsonl or csv file into the backend,
+        writing them in batches.
+
+        :param input_file: path to file to import, or `-` for stdin
+        :type input_file: str
+        :param format: `jsonl` or `csv`. Inferred from the file
+                       extension when not given.
+        :type format: str
+        :param batch_size: # of entries to write per transaction
+        :type batch_size: int
+        :return: int # of entries imported
+        """
+        if format is None:
+            format = "jsonl" if input_file == "-" else path(input_file).suffix[1:]
+        reader = entry_readers.get(format)
+        if reader is None:
+            raise TypeError("Invalid import format: {}".format(format))
+        if input_file == "-":
+            return self._backend.write_entries(reader(sys.stdin), batch_size)
+        with open(str(path(input_file)), newline="") as stream:
+            return self._backend.write_entries(reader(stream), batch_size)
+
+    def print_entries(self, display_max: int = 10, offset: int = 0, **kwargs):
         """
         Prints entries to terminal. By default, limits to
         the previous 10 results and shows only results for
-        the last day.
+        the last day. Ordering and limits are applied by
+        the backend, so only displayed entries are read.
 
         Default kwargs:
         :param display_max: max # of results to show
         :type display_max: int
+        :param offset: # of most recent results to skip
+        :type offset: int
         :see: `Controller.filter_kwargs` for more display options
         """
-        after = kwargs["after"]
+        after = kwargs.get("after")
         kwargs["after"] = datetime.now() - timedelta(days=1) if after is None else after
-        filter_settings = self._parse_filter_kwargs(kwargs)
-        entries = self._backend.read_entries(filter=filter_settings)
-        terminal_frontend = TerminalFrontend(max_results=display_max)
+        filter_settings = replace(
+            self._parse_filter_kwargs(kwargs),
+            order_by="created_at",
+            descending=True,
+            limit=display_max,
+            offset=offset,
+        )
+        self.compact_journal()
+        entries = self._backend.iter_entries(filter=filter_settings)
+        terminal_frontend = self._frontends.get("terminal")(max_results=display_max)
         terminal_frontend.show(entries)
 
+    def search_entries(
+        self, search: str, mode: str = "word", display_max: int = 10, **kwargs
+    ):
+        """
+        Prints entries matching a full text search to terminal,
+        most relevant first.
+
+        :param search: words to search for
+        :type search: str
+        :param mode: `word`, `prefix` or `phrase`
+        :type mode: str
+        :param display_max: max # of results to show
+        :type display_max: int
+        :see: `Controller.filter_kwargs` for more display options
+        """
+        filter_settings = replace(
+            self._parse_filter_kwargs(kwargs),
+            search=search,
+            search_mode=mode,
+            limit=display_max,
+        )
+        self.compact_journal()
+        entries = self._backend.iter_entries(filter=filter_settings)
+        terminal_frontend = self._frontends.get("terminal")(
+            max_results=display_max, ordered=True
+        )
+        terminal_frontend.show(entries)
+
+    def print_stats(self, group_by: str = "tag", output_file: str = None, **kwargs):
+        """
+        Shows # of entries per tag, day, week or month. Counts
+        are computed by the backend, so entries are never read.
+        By default shows a table in the terminal, or writes csv
+        if given an output file.
+
+        :param group_by: `tag`, `day`, `week` or `month`
+        :type group_by: str
+        :param output_file: optional path to output csv to
+        :type output_file: str
+        :see: `Controller.filter_kwargs` for more display options
+        """
+        filter_settings = self._parse_filter_kwargs(kwargs)
+        self.compact_journal()
+        counts = self._backend.aggregate(filter=filter_settings, group_by=group_by)
+        if output_file is None:
+            frontend = self._frontends.get("terminal")()
+        else:
+            frontend = self._init_file_frontend("csv", output_file)
+        frontend.show_counts(counts, group_by)
+
+    def rebuild_stats(self):
+        """
+        Recomputes the daily rollups stats are read from.
+        """
+        self.compact_journal()
+        self._backend.rebuild_rollups()
+
     def push_remote(self, backup_remote: bool = False):
         """
         Pushes current backend to remote. Overwrites
         existing backend in remote.
         """
+        self.compact_journal()
         self._remote.push(backup=backup_remote)
 
     def pull_remote(self, backup_local: bool = False):
@@ -137,8 +299,48 @@ class Controller:
         :param backup_local: optionally backs up local backend file
         :type backup_local: bool
         """
+        self.compact_journal()
         self._remote.pull(backup=backup_local)
 
+    def merge_remote(self) -> Optional[Dict[str, int]]:
+        """
+        Merges backend in remote into the local one, rather than
+        overwriting it, so that entries written on either side
+        are kept. Remotes that merge changes on pull, rather than
+        fetching whole dbs, are pulled instead.
+
+        :return: Optional[Dict[str, int]] # of rows added, for `tags`,
+                 `entries` and `tag_associations`, or None if the
+                 remote was pulled
+        """
+        self.compact_journal()
+        if not self._remote.supports_fetch:
+            if not self._remote.merges_on_pull:
+                raise TypeError(
+                    "Merging is not supported by {}. Pull or push without "
+                    "merging instead".format(type(self._remote).__name__)
+                )
+            self._remote.pull()
+            return None
+        directory = tempfile.mkdtemp(prefix="todayi-merge-")
+        try:
+            remote_file_path = str(path(directory, self._backend_filename))
+            if self._remote.fetch(remote_file_path) is False:
+                return dict.fromkeys(merged_tables, 0)
+            return self._backend.merge(remote_file_path)
+        finally:
+            shutil.rmtree(directory)
+
+    def compact_remote(self):
+        """
+        Compacts changes pushed to remote into a snapshot, for
+        remotes syncing changes rather than whole files.
+        """
+        if not hasattr(self._remote, "compact"):
+            raise TypeError("Remote does not support compaction")
+        self.compact_journal()
+        self._remote.compact()
+
     def file_report(self, format: str, output_file: str, **kwargs):
         """
         Generates a file report of entries.
@@ -151,7 +353,8 @@ class Controller:
         :see: `Controller.filter_kwargs` for more display options
         """
         filter_settings = self._parse_filter_kwargs(kwargs)
-        entries = self._backend.read_entries(filter=filter_settings)
+        self.compact_journal()
+        entries = self._backend.iter_entries(filter=filter_settings)
         frontend = self._init_file_frontend(format, output_file)
         frontend.show(entries)
 
@@ -171,6 +374,7 @@ class Controller:
         :see: `Controller.filter_kwargs` for more display options
         """
         filter_settings = self._parse_filter_kwargs(kwargs)
+        self.compact_journal()
         entries = self._backend.read_entries(filter=filter_settings)
         if len(entries) < 1:
             raise NoMatchingEntriesError(
@@ -183,7 +387,7 @@ class Controller:
                 "`github_auth_token` with a valid auth token and try again"
             )
         ff = self._init_file_frontend(format, output_name)
-        gf = GistFrontend(auth_token, output_name, ff, public=public)
+        gf = self._frontends.get("gist")(auth_token, output_name, ff, public=public)
         gf.show(entries)
 
     def read_config(self, key: str) -> str:
@@ -207,32 +411,57 @@ class Controller:
                 filter_kwargs[kwarg] = self._filter_kwargs.get(kwarg)(value)
         return EntryFilterSettings(**filter_kwargs)
 
-    def _init_backend(self):
-        backend_type = get_config("backend").lower()
-        backend = None
+    def open_backend(self) -> Backend:
+        """
+        Opens a new backend as configured, with its own connection,
+        ie for use by another thread. The backend used by the
+        controller itself is opened once, and cached.
+
+        :return: Backend
+        """
+        backend_type = get_config("backend")
         if backend_type is None:
             raise MissingConfigError("Backend type not specified in config")
-        elif backend_type == "sqlite":
-            backend = SqliteBackend(str(self._backend_file_path))
-        else:
+        backend_cls = self._backends.get(backend_type.lower())
+        if backend_cls is None:
             raise InvalidConfigError(
                 "Backend type: {} not supported".format(backend_type)
             )
-        self._cached_backend = backend
+        return backend_cls(
+            str(self._backend_file_path),
+            busy_timeout_ms=int(get_config("busy_timeout_ms")),
+            storage_profile=get_config("storage_profile"),
+        )
+
+    def _init_backend(self):
+        self._cached_backend = self.open_backend()
 
     def _init_remote(self):
-        remote_type = get_config("remote").lower()
+        remote_type = get_config("remote")
         remote = None
         if remote_type is None:
             raise MissingConfigError("Remote type not specified in config")
-        elif remote_type == "gcs":
+        remote_type = remote_type.lower()
+        if remote_type == "gcs":
+            remote = self._remotes.get("gcs")(
+                str(self._backend_file_path),
+                self._backend_filename,
+                get_config("gcs_bucket_name"),
+                get_config("gcs_compression"),
+            )
+        elif remote_type == "gcs_delta":
             bucket_name = get_config("gcs_bucket_name")
-            remote = GcsRemote(
+            remote = self._remotes.get("gcs_delta")(
                 str(self._backend_file_path), self._backend_filename, bucket_name
             )
         elif remote_type == "git":
             remote_uri = get_config("git_remote_uri")
-            remote = GitRemote(str(self._backend_path), remote_uri)
+            remote = self._remotes.get("git")(
+                str(self._backend_path),
+                remote_uri,
+                self._backend_filename,
+                get_config("git_format") or "db",
+            )
         else:
             raise InvalidConfigError(
                 "Remote type: {} not supported".format(remote_type)
@@ -258,6 +487,12 @@ class Controller:
     def _backend_file_path(self) -> Path:
         return path(self._backend_path, self._backend_filename)
 
+    @property
+    def _journal_path(self) -> str:
+        from todayi.backend.journal import journal_path
+
+        return journal_path(str(self._backend_file_path))
+
 
 class NoMatchingEntriesError(Exception):
     pass
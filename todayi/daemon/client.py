@@ -0,0 +1,129 @@
+"""
+Client of the resident daemon, see `todayi.daemon.server`. Kept
+to the standard library modules needed to talk to the socket, so
+that forwarding a command costs little more than starting python.
+
+`todayi.cli.run` forwards commands to the daemon when it is
+running, and runs them in process otherwise. Commands reading
+stdin, and commands run with different `TODAYI_` environment
+overrides than the daemon, are never forwarded.
+
+Each request is a single json line sent by the client, answered
+with a single json line once the command ran:
+    - request: `{"argv": [...], "cwd": ..., "env": {...}}`,
+      `{"ping": true}` to check the daemon is running, or
+      `{"stop": true}` to stop it
+    - response: `{"status": ..., "stdout": ..., "stderr": ...}`,
+      or `{"fallback": true}` if the client should run the
+      command itself
+"""
+
+import json
+import os
+import socket
+import sys
+from typing import Any, Dict, List, Optional
+
+
+socket_env = "TODAYI_SOCKET"
+
+_env_prefix = "TODAYI_"
+
+"""
+Commands never forwarded, as they do not return
+"""
+_local_commands = ["daemon", "serve"]
+
+"""
+Seconds to wait for the daemon to accept a connection before
+running a command in process
+"""
+_connect_timeout = 0.5
+
+
+def socket_path() -> str:
+    """
+    Gets path of the daemon's socket, `~/.todayi.sock` unless
+    overridden with `TODAYI_SOCKET`.
+
+    :return: str
+    """
+    return os.environ.get(socket_env) or os.path.join(
+        os.path.expanduser("~"), ".todayi.sock"
+    )
+
+
+def client_env(environ=os.environ) -> Dict[str, str]:
+    """
+    Gets environment that commands depend on, ie config overrides.
+    """
+    return dict(
+        (k, v)
+        for k, v in environ.items()
+        if (k.startswith(_env_prefix) and k != socket_env) or k == "HOME"
+    )
+
+
+def _forwardable(argv: List[str]) -> bool:
+    if len(argv) > 0 and argv[0] in _local_commands:
+        return False
+    return not (len(argv) > 0 and argv[0] == "import" and "-" in argv)
+
+
+def send_request(message: Dict[str, Any], path: str) -> Optional[Dict[str, Any]]:
+    """
+    Sends a request to the daemon.
+
+    :return: Optional[Dict[str, Any]] response, or None if the
+             daemon is not running
+    """
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.settimeout(_connect_timeout)
+        try:
+            client.connect(path)
+        except (FileNotFoundError, ConnectionRefusedError, socket.timeout):
+            return None
+        client.settimeout(None)
+        client.sendall(json.dumps(message).encode("utf-8") + b"\n")
+        with client.makefile("rb") as response:
+            line = response.readline()
+    finally:
+        client.close()
+    if line == b"":
+        return None
+    return json.loads(line)
+
+
+def forward(argv: List[str], path: Optional[str] = None) -> Optional[int]:
+    """
+    Runs a command in the daemon, if it is running, writing its
+    output to stdout and stderr.
+
+    :param argv: command line arguments, without the program name
+    :type argv: List[str]
+    :param path: path to socket, `socket_path()` if not given
+    :type path: Optional[str]
+    :return: Optional[int] exit status, or None if the command
+             should be run in process
+    """
+    if not _forwardable(argv):
+        return None
+    response = send_request(
+        {"argv": argv, "cwd": os.getcwd(), "env": client_env()},
+        path or socket_path(),
+    )
+    if response is None or response.get("fallback") is True:
+        return None
+    sys.stdout.write(response["stdout"])
+    sys.stderr.write(response["stderr"])
+    return response["status"]
+
+
+def stop(path: Optional[str] = None) -> bool:
+    """
+    Stops the daemon.
+
+    :return: bool whether or not a daemon was running
+    """
+    return send_request({"stop": True}, path or socket_path()) is not None
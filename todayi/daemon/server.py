@@ -0,0 +1,161 @@
+"""
+Resident daemon keeping a warm `Controller` and backend, serving
+cli commands over a Unix domain socket, so that commands skip
+importing and setting up the backend on every invocation. See
+`todayi.daemon.client` for the protocol.
+"""
+
+from contextlib import redirect_stderr, redirect_stdout
+import io
+import json
+import os
+import signal
+import socketserver
+import traceback
+from typing import Any, Dict, List, Optional, Tuple
+
+from todayi.daemon.client import client_env, send_request, socket_path
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        request = json.loads(self.rfile.readline())
+        if request.get("ping") is True:
+            response = {}
+        elif request.get("stop") is True:
+            self.server.stopping = True
+            response = {}
+        elif request.get("env") != client_env():
+            response = {"fallback": True}
+        else:
+            response = self.server.run_command(request["argv"], request["cwd"])
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+
+class DaemonServer(socketserver.UnixStreamServer):
+    """
+    Serves cli commands with a warm `Controller`. Requests are
+    handled one at a time, as commands run within the cwd of the
+    client and with stdout and stderr redirected. The controller
+    is replaced whenever config changes, or the db file is replaced,
+    ie by a pull, so that commands never see a stale backend.
+
+    :param path: path to socket to listen on
+    :type path: str
+    """
+
+    def __init__(self, path: str):
+        self.stopping = False
+        self._controller = None
+        self._config_key = None
+        self._db_id = None
+        if os.path.exists(path):
+            if send_request({"ping": True}, path) is not None:
+                raise RuntimeError("Daemon already running at {}".format(path))
+            os.remove(path)
+        umask = os.umask(0o077)
+        try:
+            super().__init__(path, _Handler)
+        finally:
+            os.umask(umask)
+
+    @property
+    def controller(self):
+        """
+        Gets the warm controller, replacing it first if config
+        changed, or the db file was replaced since it was created.
+        """
+        from todayi.config import DEFAULT_CONFIG, get as get_config
+        from todayi.controller import Controller
+
+        config_key = tuple(get_config(k) for k in DEFAULT_CONFIG)
+        if self._controller is None or config_key != self._config_key:
+            self._replace_controller(Controller())
+            self._config_key = config_key
+            self._db_id = None
+        db_id = _file_id(str(self._controller._backend_file_path))
+        if self._db_id is not None and db_id != self._db_id:
+            self._replace_controller(Controller())
+        self._db_id = db_id
+        return self._controller
+
+    def run_command(self, argv: List[str], cwd: str) -> Dict[str, Any]:
+        """
+        Runs a cli command with the warm controller.
+
+        :param argv: command line arguments, without the program name
+        :type argv: List[str]
+        :param cwd: directory to run command in
+        :type cwd: str
+        :return: Dict[str, Any] of exit status and output
+        """
+        from todayi.cli import run
+
+        stdout, stderr = io.StringIO(), io.StringIO()
+        status = 0
+        previous_cwd = os.getcwd()
+        try:
+            os.chdir(cwd)
+            with redirect_stdout(stdout), redirect_stderr(stderr):
+                run(argv, controller=self.controller)
+        except SystemExit as e:
+            if isinstance(e.code, int):
+                status = e.code
+            elif e.code is not None:
+                stderr.write("{}\n".format(e.code))
+                status = 1
+        except Exception:
+            stderr.write(traceback.format_exc())
+            status = 1
+        finally:
+            os.chdir(previous_cwd)
+        return {
+            "status": status,
+            "stdout": stdout.getvalue(),
+            "stderr": stderr.getvalue(),
+        }
+
+    def _replace_controller(self, controller):
+        # Closes the backend of the replaced controller, if opened,
+        # rather than leaving its connection to the garbage collector
+        if self._controller is not None:
+            backend = self._controller._cached_backend
+            if backend is not None:
+                backend.close()
+        self._controller = controller
+
+    def serve_until_stopped(self):
+        while self.stopping is False:
+            self.handle_request()
+        # Backends may only be closed by the thread that opened them
+        self._replace_controller(None)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+def _file_id(file_path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_dev, stat.st_ino)
+
+
+def serve(path: Optional[str] = None):
+    """
+    Runs the daemon until it is stopped, interrupted or terminated.
+
+    :param path: path to socket, `socket_path()` if not given
+    :type path: Optional[str]
+    """
+    server = DaemonServer(path or socket_path())
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        server.serve_until_stopped()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Any, Callable, List, Union
+from typing import Any, Callable, Iterable, Iterator, List, Union
 
 from todayi.model.entry import Entry
 
@@ -41,14 +41,18 @@ class Frontend(ABC):
     ]
 
     @abstractmethod
-    def show(self, entries: List[Entry]):
+    def show(self, entries: Iterable[Entry]):
         """
         'Shows' the data, whether that means
         outputting it via terminal, creating
-        a MD file, etc.
+        a MD file, etc. Entries may be a lazy
+        iterator, such as one returned by
+        `todayi.backend.base.Backend.iter_entries`,
+        in which case they should be consumed
+        as a stream where possible.
 
         :param entries: entries to be displayed
-        :type entries: List[Entry]
+        :type entries: Iterable[Entry]
         """
         pass
 
@@ -60,9 +64,9 @@ class Frontend(ABC):
         """
         return [a.header for a in self._default_attributes]
 
-    def _get_rows(self, entries: List[Entry]) -> List[List[str]]:
+    def _get_rows(self, entries: Iterable[Entry]) -> Iterator[List[str]]:
         """
-        Transforms List[Entry] into a List[List[str]]
+        Lazily transforms Iterable[Entry] into rows of List[str]
 
         Example:
         ```
@@ -70,14 +74,14 @@ class Frontend(ABC):
             created_at=datetime.now(), tags=['hello'])]
         >>> self._default_attributes = [FrontendAttribute('Content',
             lambda e: e.content)]
-        >>> self._parse_rows(entries)
+        >>> list(self._get_rows(entries))
         [['Hello world']]
 
-        :param entries: list of entries
-        :type entries: List[Entry]
-        :return: List[List[str]]
+        :param entries: entries to transform
+        :type entries: Iterable[Entry]
+        :return: Iterator[List[str]]
         """
-        return [[a.field(e) for a in self._default_attributes] for e in entries]
+        return ([a.field(e) for a in self._default_attributes] for e in entries)
 
 
 class FileFrontend(Frontend, ABC):
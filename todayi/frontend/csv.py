@@ -1,6 +1,6 @@
 import csv
 from io import StringIO
-from typing import List
+from typing import Iterable, TextIO, Tuple
 
 from todayi.frontend.base import (
     FileFrontend,
@@ -10,7 +10,7 @@ from todayi.frontend.base import (
     entry_tags_csv_str,
 )
 from todayi.model.entry import Entry
-from todayi.util.fs import write_file
+from todayi.util.fs import path
 
 
 class CsvFrontend(FileFrontend):
@@ -23,27 +23,43 @@ class CsvFrontend(FileFrontend):
         FrontendAttribute("tags", entry_tags_csv_str),
     ]
 
-    def show(self, entries: List[Entry]):
+    def show(self, entries: Iterable[Entry]):
         """
-        Creates markdown from list of entries ordered
-        by date.
+        Creates csv file from entries, writing each
+        row as entries are consumed.
 
         :param entries: entries to be displayed
-        :type entries: List[Entry]
+        :type entries: Iterable[Entry]
         """
-        content = self.to_string(entries)
-        write_file(content, self._output_file)
+        with open(str(path(self._output_file)), "w", newline="") as output:
+            self._write(entries, output)
 
-    def to_string(self, entries: List[Entry]) -> str:
+    def show_counts(self, counts: Iterable[Tuple[str, int]], group_by: str):
+        """
+        Creates csv file of # of entries per group, ie as
+        returned by `Backend.aggregate`.
+
+        :param counts: group and # of entries
+        :type counts: Iterable[Tuple[str, int]]
+        :param group_by: what entries are grouped by, used as header
+        :type group_by: str
+        """
+        with open(str(path(self._output_file)), "w", newline="") as output:
+            csvwriter = csv.writer(output, delimiter=",")
+            csvwriter.writerow([group_by, "entries"])
+            csvwriter.writerows(counts)
+
+    def to_string(self, entries: Iterable[Entry]) -> str:
         """
         Does the same thing as `Frontend.show`,
         but instead of writing to file returns
         file contents as string
         """
-        rows = [self._get_headers()]
-        rows.extend(self._get_rows(entries))
         output = StringIO()
+        self._write(entries, output)
+        return output.getvalue()
+
+    def _write(self, entries: Iterable[Entry], output: TextIO):
         csvwriter = csv.writer(output, delimiter=",")
-        csvwriter.writerows(rows)
-        output.seek(0)
-        return output.read()
+        csvwriter.writerow(self._get_headers())
+        csvwriter.writerows(self._get_rows(entries))
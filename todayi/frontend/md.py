@@ -1,12 +1,13 @@
 from abc import ABC, abstractmethod
 from collections import defaultdict
-from typing import Any, List, Optional
+from itertools import groupby
+from typing import Any, Iterable, Iterator, List, Optional, TextIO
 
 from jinja2 import Template
 
 from todayi.frontend.base import FileFrontend
 from todayi.model.entry import Entry
-from todayi.util.fs import write_file
+from todayi.util.fs import path
 from todayi.util.iter import is_iterable
 
 
@@ -48,7 +49,7 @@ class MdSection(ABC):
         pass
 
     @staticmethod
-    def group_entries_by_section(cls, entries: List[Entry]):
+    def group_entries_by_section(cls, entries: Iterable[Entry]):
         groups = defaultdict(list)
         for e in entries:
             keys = cls.get_attr(e)
@@ -58,6 +59,16 @@ class MdSection(ABC):
                 groups[key].append(e)
         return [cls(entries, group_key=key) for key, entries in groups.items()]
 
+    @staticmethod
+    def stream_entries_by_section(cls, entries: Iterable[Entry]):
+        """
+        Lazily groups entries into sections, assuming entries
+        are already ordered by section. Only a single section
+        is held in memory at a time.
+        """
+        for key, section_entries in groupby(entries, key=cls.get_attr):
+            yield cls(list(section_entries), group_key=key)
+
 
 class DateSection(MdSection):
 
@@ -111,18 +122,27 @@ class MarkdownFrontend(FileFrontend):
         self._group_by = section_grouping
         FileFrontend.__init__(self, output_file)
 
-    def show(self, entries: List[Entry]):
+    """
+    Section groupings that can be streamed, given entries
+    ordered by creation time.
+    """
+    streamable_section_groupings = ["created_at"]
+
+    def show(self, entries: Iterable[Entry]):
         """
-        Creates csv file from list of entries ordered
-        by date.
+        Creates markdown file from entries. When grouping
+        by date and entries are ordered by date, the file
+        is written a section at a time.
 
         :param entries: entries to be displayed
-        :type entries: List[Entry]
+        :type entries: Iterable[Entry]
         """
-        content = self.to_string(entries)
-        write_file(content, self._output_file)
+        with open(str(path(self._output_file)), "w") as output:
+            _write_stripped(
+                self.template.generate(sections=self._sections(entries)), output
+            )
 
-    def to_string(self, entries: List[Entry]) -> str:
+    def to_string(self, entries: Iterable[Entry]) -> str:
         """
         Does the same thing as `Frontend.show`,
         but instead of writing to file returns
@@ -132,3 +152,31 @@ class MarkdownFrontend(FileFrontend):
             self.allowed_section_groupings.get(self._group_by), entries
         )
         return self.template.render(sections=sections).strip("\n")
+
+    def _sections(self, entries: Iterable[Entry]) -> Iterator[MdSection]:
+        section = self.allowed_section_groupings.get(self._group_by)
+        if self._group_by in self.streamable_section_groupings:
+            return MdSection.stream_entries_by_section(section, entries)
+        return iter(MdSection.group_entries_by_section(section, entries))
+
+
+def _write_stripped(chunks: Iterable[str], output: TextIO):
+    """
+    Writes chunks of text to output, stripping leading and
+    trailing newlines from the text as a whole, like
+    `str.strip("\n")` would.
+    """
+    started = False
+    pending = ""
+    for chunk in chunks:
+        if not started:
+            chunk = chunk.lstrip("\n")
+            if chunk == "":
+                continue
+            started = True
+        content = chunk.rstrip("\n")
+        if content == "":
+            pending += chunk
+            continue
+        output.write(pending + content)
+        pending = chunk[len(content) :]
@@ -1,4 +1,6 @@
-from typing import List
+import heapq
+from itertools import islice
+from typing import Iterable, Tuple
 
 from prettytable import PrettyTable
 
@@ -9,21 +11,33 @@ from todayi.model.entry import Entry
 class TerminalFrontend(Frontend):
     """
     Frontend for viewing entries via the terminal.
+
+    :param max_results: max # of entries to display
+    :type max_results: int
+    :param ordered: display entries in the order given, rather
+                    than most recent first. ie for ranked results
+    :type ordered: bool
     """
 
-    def __init__(self, max_results=10):
+    def __init__(self, max_results=10, ordered: bool = False):
         self._max_results = max_results
+        self._ordered = ordered
 
-    def show(self, entries: List[Entry]):
+    def show(self, entries: Iterable[Entry]):
         """
-        Outputs entries to terminal in table
-        format
+        Outputs most recent entries to terminal in table
+        format. Only `max_results` entries are held in
+        memory at a time.
 
         :param entries: entries to be displayed
-        :type entries: List[Entry]
+        :type entries: Iterable[Entry]
         """
-        entries = sorted(entries, key=lambda e: e.created_at, reverse=True)
-        entries = entries[0 : min(len(entries), self._max_results)]
+        if self._ordered is True:
+            entries = list(islice(entries, self._max_results))
+        else:
+            entries = heapq.nlargest(
+                self._max_results, entries, key=lambda e: e.created_at
+            )
         if len(entries) == 0:
             print("No matching entries...")
             return
@@ -33,3 +47,22 @@ class TerminalFrontend(Frontend):
         table.field_names = table_headers
         table.add_rows(parsed_rows)
         print(table.get_string())
+
+    def show_counts(self, counts: Iterable[Tuple[str, int]], group_by: str):
+        """
+        Outputs # of entries per group to terminal in table
+        format, ie as returned by `Backend.aggregate`.
+
+        :param counts: group and # of entries
+        :type counts: Iterable[Tuple[str, int]]
+        :param group_by: what entries are grouped by, used as header
+        :type group_by: str
+        """
+        counts = list(counts)
+        if len(counts) == 0:
+            print("No matching entries...")
+            return
+        table = PrettyTable()
+        table.field_names = ["{}:".format(group_by.capitalize()), "Entries:"]
+        table.add_rows(counts)
+        print(table.get_string())
@@ -0,0 +1,95 @@
+"""
+Module used to read entries from external sources, such
+as exported reports or automation hooks. Readers are
+generators, so input is streamed rather than loaded into
+memory all at once.
+"""
+
+import csv
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, TextIO, Union
+import uuid
+
+from todayi.model.entry import Entry
+from todayi.model.tag import Tag
+
+
+def _parse_tags(tags: Union[None, str, List[str]]) -> List[Tag]:
+    if tags is None:
+        return []
+    if isinstance(tags, str):
+        tags = tags.split(",")
+    return [Tag(t.strip()) for t in tags if t.strip() != ""]
+
+
+def _parse_created_at(created_at: Union[None, str]) -> datetime:
+    if created_at is None or created_at == "":
+        return datetime.now()
+    return datetime.fromisoformat(created_at.strip())
+
+
+def entry_from_dict(record: Dict[str, Any]) -> Entry:
+    """
+    Creates an entry from a dict with the keys `content`,
+    and optionally `tags`, `created_at` (or `when`) and `uuid`.
+    Tags may either be a list of names or a comma separated str.
+
+    :param record: dict describing entry
+    :type record: Dict[str, Any]
+    :return: Entry
+    """
+    content = record.get("content")
+    if content is None or content == "":
+        raise InvalidImportError("Entry is missing content: {}".format(record))
+    return Entry(
+        content,
+        uuid=record.get("uuid") or str(uuid.uuid4()),
+        tags=_parse_tags(record.get("tags")),
+        created_at=_parse_created_at(record.get("created_at", record.get("when"))),
+    )
+
+
+def read_jsonl(stream: TextIO) -> Iterator[Entry]:
+    """
+    Reads entries from a stream of json lines, one entry
+    per line. Blank lines are skipped.
+
+    :param stream: text stream to read from
+    :type stream: TextIO
+    :return: Iterator[Entry]
+    """
+    for line_number, line in enumerate(stream, start=1):
+        if line.strip() == "":
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise InvalidImportError(
+                "Invalid json on line {}: {}".format(line_number, e)
+            )
+        yield entry_from_dict(record)
+
+
+def read_csv(stream: TextIO) -> Iterator[Entry]:
+    """
+    Reads entries from csv with a header row. Accepts the
+    same columns that `todayi.frontend.csv.CsvFrontend`
+    writes, so csv reports can be imported back.
+
+    :param stream: text stream to read from
+    :type stream: TextIO
+    :return: Iterator[Entry]
+    """
+    for record in csv.DictReader(stream):
+        yield entry_from_dict(record)
+
+
+readers = {
+    "jsonl": read_jsonl,
+    "csv": read_csv,
+}
+
+
+class InvalidImportError(Exception):
+    pass
@@ -1,6 +1,6 @@
 from datetime import datetime
-from typing import List
-import uuid
+from typing import List, Optional
+from uuid import uuid4
 
 from todayi.model.tag import Tag
 
@@ -16,7 +16,7 @@ class Entry:
     :type content: str
     :param uuid: randomly generated uuid, by default
                  uuid v4
-    :type uuid: datetime
+    :type uuid: str
     :param tags: tags that entry is associated with
     :type tags: List
     :param created_at: when entry was created
@@ -26,11 +26,11 @@ class Entry:
     def __init__(
         self,
         content: str,
-        uuid: str = str(uuid.uuid4()),
-        tags: List[Tag] = [],
-        created_at: datetime = datetime.now(),
+        uuid: Optional[str] = None,
+        tags: Optional[List[Tag]] = None,
+        created_at: Optional[datetime] = None,
     ):
         self.content = content
-        self.uuid = uuid
-        self.tags = tags
-        self.created_at = created_at
+        self.uuid = str(uuid4()) if uuid is None else uuid
+        self.tags = [] if tags is None else tags
+        self.created_at = datetime.now() if created_at is None else created_at
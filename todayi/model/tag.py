@@ -1,4 +1,5 @@
-import uuid
+from typing import Optional
+from uuid import uuid4
 
 
 class InvalidTagError(Exception):
@@ -20,9 +21,9 @@ class Tag:
     :type uuid: str
     """
 
-    def __init__(self, name: str, uuid: str = str(uuid.uuid4())):
+    def __init__(self, name: str, uuid: Optional[str] = None):
         contains_space = any([c.isspace() for c in name])
         if contains_space:
             raise InvalidTagError("Tags are not allowed to contain whitespace")
         self.name = name.lower()
-        self.uuid = uuid
+        self.uuid = str(uuid4()) if uuid is None else uuid
@@ -3,6 +3,19 @@ from datetime import datetime
 
 
 class Remote(ABC):
+    """
+    Capabilities of a remote:
+        - supports_fetch: implements `fetch(target_path) -> bool`,
+          downloading the db in remote to a file, ie to merge it
+          locally rather than overwriting local state
+        - merges_on_pull: pulls keep local entries, merging
+          changes from remote into them
+    """
+
+    supports_fetch = False
+
+    merges_on_pull = False
+
     @abstractmethod
     def push(self, backup: bool = False):
         """
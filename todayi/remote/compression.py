@@ -0,0 +1,148 @@
+"""
+Module used to compress files as they are streamed to a remote,
+and decompress them as they are streamed back, so that no
+compressed copy is ever staged on disk.
+
+zstd requires the optional `zstandard` package.
+"""
+
+import hashlib
+import io
+import zlib
+from typing import IO, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+"""
+Available compressions, named as the content encoding marking
+compressed blobs:
+    - gzip
+    - zstd
+"""
+compressions = ["gzip", "zstd"]
+
+
+def check_compression(compression: str):
+    if compression not in compressions:
+        raise KeyError(
+            "Invalid compression. Allowed: \n {}".format("\n".join(compressions))
+        )
+    if compression == "zstd" and zstandard is None:
+        raise ImportError("zstd compression requires the zstandard package")
+
+
+def _compressor(compression: str):
+    check_compression(compression)
+    if compression == "gzip":
+        return zlib.compressobj(6, zlib.DEFLATED, 31)
+    return zstandard.ZstdCompressor().compressobj()
+
+
+def _decompressor(compression: str):
+    check_compression(compression)
+    if compression == "gzip":
+        return zlib.decompressobj(31)
+    return zstandard.ZstdDecompressor().decompressobj()
+
+
+class CompressingReader(io.RawIOBase):
+    """
+    Readable stream of a file's compressed content, compressed
+    as it is read. Reads return as many bytes as requested,
+    unless the end of the stream was reached.
+
+    :param source: file opened for reading bytes
+    :type source: IO[bytes]
+    :param compression: one of `compressions`
+    :type compression: str
+    :param chunk_size: # of bytes read from source at a time
+    :type chunk_size: int
+    """
+
+    def __init__(self, source: IO[bytes], compression: str, chunk_size: int = 1 << 20):
+        self._source = source
+        self._compressor = _compressor(compression)
+        self._chunk_size = chunk_size
+        self._buffer = bytearray()
+        self._position = 0
+        self._flushed = False
+
+    def readable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        while not self._flushed and (
+            size is None or size < 0 or len(self._buffer) < size
+        ):
+            chunk = self._source.read(self._chunk_size)
+            if chunk:
+                self._buffer += self._compressor.compress(chunk)
+            else:
+                self._buffer += self._compressor.flush()
+                self._flushed = True
+        if size is None or size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        self._position += len(data)
+        return data
+
+    def readinto(self, b) -> int:
+        data = self.read(len(b))
+        b[: len(data)] = data
+        return len(data)
+
+
+class DecompressingWriter(io.RawIOBase):
+    """
+    Writable stream decompressing what is written to it into
+    a file. Keeps the MD5 hash of the decompressed content.
+
+    :param target: file opened for writing bytes
+    :type target: IO[bytes]
+    :param compression: one of `compressions`
+    :type compression: str
+    """
+
+    def __init__(self, target: IO[bytes], compression: str):
+        self._target = target
+        self._decompressor = _decompressor(compression)
+        self.md5 = hashlib.md5()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._write(self._decompressor.decompress(bytes(b)))
+        return len(b)
+
+    def close(self):
+        """
+        Flushes what is left of the decompressed content. Raises
+        if the compressed stream did not end, ie as the download
+        was cut short, so that partial content is never used.
+        The target file is left open.
+        """
+        if self.closed:
+            return
+        try:
+            self._write(self._decompressor.flush())
+            if not self._decompressor.eof:
+                raise IncompleteStreamError("Compressed stream ended early")
+        finally:
+            super().close()
+
+    def _write(self, data: bytes):
+        self.md5.update(data)
+        self._target.write(data)
+
+
+class IncompleteStreamError(Exception):
+    pass
@@ -1,7 +1,33 @@
+"""
+Syncs the local db file with a blob in Google Cloud Storage.
+Pushes upload a consistent snapshot of the db rather than
+the live file. Pushes and pulls are skipped when the local
+file already matches the blob, going by its MD5 hash and
+generation as recorded after the last sync in a state file
+next to the db.
+
+Blobs may be compressed, in which case their content encoding
+names the compression and their metadata holds the MD5 hash of
+the uncompressed file. Uncompressed blobs are still pulled as is.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import tempfile
+from typing import Any, Dict, List, Optional
+
 from google.cloud import storage
 
+from todayi.backend.concurrency import replace_db
+from todayi.backend.snapshot import snapshot_file
 from todayi.remote.base import Remote
-from todayi.util.fs import path
+from todayi.remote.compression import (
+    check_compression,
+    CompressingReader,
+    DecompressingWriter,
+)
 
 
 class GcsRemote(Remote):
@@ -15,17 +41,41 @@ class GcsRemote(Remote):
     :type remote_path: str
     :param bucket_name: name of gcs bucket
     :type bucket_name: str
+    :param compression: compression used when pushing, if any
+    :type compression: Optional[str]
     """
 
+    supports_fetch = True
+
     _bucket_prefix = "gs://"
 
     _bucket_suffix = "/"
 
-    def __init__(self, local_file_path: str, remote_path: str, bucket_name: str):
+    _state_suffix = ".gcs-state.json"
+
+    _md5_metadata_key = "todayi-md5"
+
+    """
+    # of compressed bytes held in memory at a time while uploading
+    """
+    _upload_chunk_size = 16 * 1024 * 1024
+
+    def __init__(
+        self,
+        local_file_path: str,
+        remote_path: str,
+        bucket_name: str,
+        compression: Optional[str] = None,
+    ):
         self._local_file_path = local_file_path
         self._remote_path = remote_path
         self._bucket_name = self._clean_bucket_name(bucket_name)
         self._bucket = None
+        if compression == "":
+            compression = None
+        if compression is not None:
+            check_compression(compression)
+        self._compression = compression
 
     @property
     def bucket(self):
@@ -35,33 +85,123 @@ class GcsRemote(Remote):
 
     def push(self, backup: bool = False):
         """
-        Pushes up current state to GCS remote. Optionally write
-        backup file to remote.
+        Pushes up a consistent snapshot of current state to GCS
+        remote, so local writers need not stop while pushing.
+        Optionally write backup file to remote. Does nothing if
+        the remote already matches the local file.
 
         :param backup: whether or not to backup remote backend file
         :type backup: bool
         """
-        if backup is True:
-            self.bucket.rename_blob(
-                self._blob(), self._backup_file_name(self._remote_path)
-            )
-        blob = self._blob()
-        blob.upload_from_filename(self._local_file_path)
+        remote_blob = self.bucket.get_blob(self._remote_path)
+        stamp = self._local_stamp()
+        if remote_blob is not None and self._unchanged_since_sync(remote_blob, stamp):
+            return
+        with snapshot_file(self._local_file_path) as snapshot_path:
+            md5 = _file_md5(snapshot_path)
+            if remote_blob is not None and self._remote_md5(remote_blob) == md5:
+                self._save_state(remote_blob, md5, stamp)
+                return
+            if backup is True and remote_blob is not None:
+                self.bucket.rename_blob(
+                    remote_blob, self._backup_file_name(self._remote_path)
+                )
+            blob = self._upload(snapshot_path, md5)
+        self._save_state(blob, md5, stamp)
 
     def pull(self, backup: bool = False):
         """
         Updates current state from remote. Optionally write
-        local backup file.
+        local backup file. Does nothing if the local file
+        already matches the remote.
 
         :param backup: whether or not to backup local backend file
         :type backup: bool
         """
-        if backup is True:
-            path(self._local_file_path).rename(
-                path(self._backup_file_name(self._local_file_path))
+        blob = self.bucket.get_blob(self._remote_path)
+        if blob is not None and self._in_sync(blob):
+            return
+        if blob is None:
+            blob = self._blob()
+        # Downloaded next to the db, then moved over it, so that
+        # the db is never partially written, and its wal is dropped
+        fd, download_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self._local_file_path)),
+            prefix=".todayi-pull-",
+        )
+        os.close(fd)
+        try:
+            md5 = self._download(blob, download_path)
+            replace_db(
+                download_path,
+                self._local_file_path,
+                self._backup_file_name(self._local_file_path)
+                if backup is True
+                else None,
+            )
+        finally:
+            if os.path.exists(download_path):
+                os.remove(download_path)
+        self._save_state(blob, md5, self._local_stamp())
+
+    def fetch(self, target_path: str) -> bool:
+        """
+        Downloads the db in remote to a file, decompressing it
+        if it was compressed.
+
+        :param target_path: path to download db to
+        :type target_path: str
+        :return: bool whether or not remote has a db yet
+        """
+        blob = self.bucket.get_blob(self._remote_path)
+        if blob is None:
+            return False
+        self._download(blob, target_path)
+        return True
+
+    def _download(self, blob, file_path: str) -> str:
+        """
+        Downloads blob to a file, decompressing it if needed.
+        Decompressed files are checked against the MD5 hash of the
+        file pushed, so that corrupt or truncated blobs are never
+        used.
+
+        :return: str MD5 hash of file
+        """
+        if blob.content_encoding is None:
+            blob.download_to_filename(file_path)
+            return blob.md5_hash
+        with open(file_path, "wb") as f:
+            writer = DecompressingWriter(f, blob.content_encoding)
+            blob.download_to_file(writer, raw_download=True)
+            writer.close()
+        md5 = base64.b64encode(writer.md5.digest()).decode("ascii")
+        expected = self._remote_md5(blob)
+        if expected is not None and md5 != expected:
+            raise CorruptDownloadError(
+                "MD5 hash of {} does not match the db pushed".format(blob.name)
+            )
+        return md5
+
+    def _upload(self, file_path: str, md5: str):
+        """
+        Uploads file, compressing it as it is streamed if configured.
+
+        :return: google.cloud.storage.Blob uploaded
+        """
+        if self._compression is None:
+            blob = self._blob()
+            blob.upload_from_filename(file_path)
+            return blob
+        blob = self.bucket.blob(self._remote_path, chunk_size=self._upload_chunk_size)
+        blob.content_encoding = self._compression
+        blob.metadata = {self._md5_metadata_key: md5}
+        with open(file_path, "rb") as f:
+            blob.upload_from_file(
+                CompressingReader(f, self._compression),
+                content_type="application/octet-stream",
             )
-        blob = self._blob()
-        blob.download_to_filename(self._local_file_path)
+        return blob
 
     def _blob(self):
         return self.bucket.blob(self._remote_path)
@@ -72,3 +212,111 @@ class GcsRemote(Remote):
         if bucket_name[-1] == self._bucket_suffix:
             bucket_name = bucket_name[0 : len(bucket_name) - 1]
         return bucket_name
+
+    def _in_sync(self, blob) -> bool:
+        """
+        Checks whether the local file matches blob. If the local
+        file did not change since the last sync, the generation
+        and hash recorded then are used rather than reading it.
+        """
+        stamp = self._local_stamp()
+        if stamp is None:
+            return False
+        if self._unchanged_since_sync(blob, stamp):
+            return True
+        remote_md5 = self._remote_md5(blob)
+        if remote_md5 is None:
+            return False
+        state = self._load_state()
+        if state.get("stamp") == stamp:
+            local_md5 = state.get("md5")
+        else:
+            local_md5 = _file_md5(self._local_file_path)
+        if local_md5 != remote_md5:
+            return False
+        self._save_state(blob, local_md5, stamp)
+        return True
+
+    def _unchanged_since_sync(self, blob, stamp: Optional[List[int]]) -> bool:
+        state = self._load_state()
+        return (
+            stamp is not None
+            and state.get("remote_path") == self._remote_path
+            and state.get("stamp") == stamp
+            and state.get("generation") == blob.generation
+        )
+
+    def _local_stamp(self) -> Optional[List[int]]:
+        """
+        Gets size and mtime of the local db, as well as of its
+        write-ahead log if it has one, as writes in WAL mode may
+        not touch the db file until checkpointed.
+
+        :return: Optional[List[int]], or None if there is no local db
+        """
+        stamp = []
+        for file_path in [self._local_file_path, self._local_file_path + "-wal"]:
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                if file_path == self._local_file_path:
+                    return None
+                continue
+            stamp.extend([stat.st_size, stat.st_mtime_ns])
+        return stamp
+
+    def _remote_md5(self, blob) -> Optional[str]:
+        """
+        Gets MD5 hash of blob's uncompressed content.
+        """
+        if blob.content_encoding is None:
+            return blob.md5_hash
+        return (blob.metadata or {}).get(self._md5_metadata_key)
+
+    @property
+    def _state_file_path(self) -> str:
+        return "{}{}".format(self._local_file_path, self._state_suffix)
+
+    def _load_state(self) -> Dict[str, Any]:
+        try:
+            with open(self._state_file_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_state(self, blob, md5: Optional[str], stamp: Optional[List[int]]):
+        """
+        Records blob synced with, and the local file as it was
+        then, so that the next sync can skip hashing it.
+
+        :param blob: blob synced with
+        :type blob: google.cloud.storage.Blob
+        :param md5: MD5 hash of content synced
+        :type md5: Optional[str]
+        :param stamp: stamp of local file when synced
+        :type stamp: Optional[List[int]]
+        """
+        state = {
+            "remote_path": self._remote_path,
+            "generation": blob.generation,
+            "md5": md5,
+            "stamp": stamp,
+        }
+        if state != self._load_state():
+            with open(self._state_file_path, "w") as f:
+                json.dump(state, f)
+
+
+def _file_md5(file_path: str) -> str:
+    """
+    Hashes file, encoded as GCS encodes blob hashes.
+    """
+    md5 = hashlib.md5()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            md5.update(chunk)
+    return base64.b64encode(md5.digest()).decode("ascii")
+
+
+class CorruptDownloadError(Exception):
+    pass
@@ -0,0 +1,213 @@
+"""
+Syncs entries with Google Cloud Storage as a log of changes, rather
+than as a whole db file. Pushes upload only entries changed since
+the previous push, and pulls download only segments not seen yet,
+so both cost O(changes) rather than O(journal).
+
+Objects are kept under `<remote_path>.segments/`, named so that
+they sort in the order they were pushed:
+    - `<ms>-<device>-changes.jsonl.gz`: entries changed on a
+      device since its previous push
+    - `<ms>-<device>-snapshot.jsonl.gz`: all entries, replacing
+      the segments before it once segments are compacted
+"""
+
+import gzip
+import io
+import json
+import shutil
+import sqlite3
+import tempfile
+import time
+from typing import Any, Dict, IO, Iterable, Iterator, List
+
+from todayi.backend import changes
+from todayi.backend.migrations import migrate
+from todayi.remote.gcs import GcsRemote
+
+
+class GcsDeltaRemote(GcsRemote):
+    """
+    Manages syncing changes to entries with Google Cloud Storage.
+
+    :param local_file_path: path to local sqlite db
+    :type local_file_path: str
+    :param remote_path: path segments are kept under
+    :type remote_path: str
+    :param bucket_name: name of gcs bucket
+    :type bucket_name: str
+    """
+
+    supports_fetch = False
+
+    merges_on_pull = True
+
+    _segments_suffix = ".segments/"
+
+    """
+    # of segments after which a push compacts them into a snapshot
+    """
+    _compact_after = 50
+
+    def push(self, backup: bool = False):
+        """
+        Pulls segments not seen yet, then pushes entries changed
+        since the previous push as a new segment. Compacts
+        segments if there are more than `_compact_after`.
+
+        :param backup: not supported, as segments are never overwritten
+        :type backup: bool
+        """
+        if backup is True:
+            raise NotImplementedError(
+                "Backup logic not configured for GcsDeltaRemote.push"
+            )
+        conn = self._connect()
+        try:
+            segments = len(self._pull(conn))
+            if self._push_changes(conn) is True:
+                segments += 1
+            # Skipped if other devices pushed meanwhile, until a later push
+            if segments > self._compact_after:
+                self._compact(conn)
+        finally:
+            conn.close()
+
+    def pull(self, backup: bool = False):
+        """
+        Applies segments not seen yet to the local db. Local
+        changes not pushed yet are kept.
+
+        :param backup: whether or not to backup local backend file
+        :type backup: bool
+        """
+        if backup is True:
+            shutil.copyfile(
+                self._local_file_path, self._backup_file_name(self._local_file_path)
+            )
+        conn = self._connect()
+        try:
+            self._pull(conn)
+        finally:
+            conn.close()
+
+    def compact(self):
+        """
+        Replaces all segments seen with a single snapshot of all
+        entries, so that new devices do not replay the full history.
+        """
+        conn = self._connect()
+        try:
+            self._pull(conn)
+            self._push_changes(conn)
+            if self._compact(conn) is False:
+                raise CompactionConflictError(
+                    "Segments were pushed by other devices while compacting. "
+                    "Try again"
+                )
+        finally:
+            conn.close()
+
+    @property
+    def _prefix(self) -> str:
+        return self._remote_path + self._segments_suffix
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self._local_file_path)
+        migrate(conn)
+        return conn
+
+    def _pull(self, conn: sqlite3.Connection) -> List[str]:
+        """
+        Applies segments not seen yet, in the order they were pushed.
+
+        :return: List[str] names of all segments in the remote
+        """
+        blobs = sorted(self.bucket.list_blobs(prefix=self._prefix), key=_name)
+        names = [blob.name for blob in blobs]
+        seen = changes.seen_segments(conn)
+        changes.forget_segments(conn, seen - set(names))
+        for blob in blobs:
+            if blob.name in seen:
+                continue
+            with tempfile.TemporaryFile() as f:
+                blob.download_to_file(f)
+                f.seek(0)
+                changes.apply_changes(conn, _read_records(f), blob.name)
+        return names
+
+    def _push_changes(self, conn: sqlite3.Connection) -> bool:
+        """
+        Pushes entries changed since the previous push as a segment.
+
+        :return: bool whether or not there were changes to push
+        """
+        name = self._segment_name(conn, "changes")
+        seq, records = changes.pending_changes(conn)
+        if seq == changes.pushed_seq(conn):
+            return False
+        self._upload(name, records)
+        changes.mark_pushed(conn, seq, name)
+        return True
+
+    def _compact(self, conn: sqlite3.Connection) -> bool:
+        """
+        Pushes a snapshot of all entries, then deletes segments
+        it replaces. Should follow a pull, so that all segments
+        were applied locally. If segments not applied locally
+        sort before the snapshot, ie were pushed by other devices
+        in the meantime, the snapshot would replay over them, so
+        it is deleted again.
+
+        :return: bool whether or not segments were compacted
+        """
+        name = self._segment_name(conn, "snapshot")
+        self._upload(name, changes.snapshot_changes(conn))
+        seen = changes.seen_segments(conn)
+        unseen = [
+            blob.name
+            for blob in self.bucket.list_blobs(prefix=self._prefix)
+            if blob.name < name and blob.name not in seen
+        ]
+        if len(unseen) > 0:
+            self.bucket.delete_blobs([self.bucket.blob(name)], on_error=lambda b: None)
+            return False
+        changes.mark_seen(conn, name)
+        replaced = sorted(s for s in changes.seen_segments(conn) if s < name)
+        self.bucket.delete_blobs(
+            [self.bucket.blob(s) for s in replaced], on_error=lambda blob: None
+        )
+        changes.forget_segments(conn, replaced)
+        return True
+
+    def _segment_name(self, conn: sqlite3.Connection, kind: str) -> str:
+        return "{}{:013d}-{}-{}.jsonl.gz".format(
+            self._prefix, int(time.time() * 1000), changes.device_id(conn), kind
+        )
+
+    def _upload(self, name: str, records: Iterable[Dict[str, Any]]):
+        """
+        Streams records through gzip into a temp file, then uploads it.
+        """
+        with tempfile.TemporaryFile() as f:
+            with gzip.GzipFile(fileobj=f, mode="wb") as compressed:
+                for record in records:
+                    compressed.write(json.dumps(record).encode("utf-8") + b"\n")
+            self.bucket.blob(name).upload_from_file(
+                f, rewind=True, content_type="application/gzip"
+            )
+
+
+def _name(blob) -> str:
+    return blob.name
+
+
+def _read_records(f: IO[bytes]) -> Iterator[Dict[str, Any]]:
+    with io.TextIOWrapper(gzip.GzipFile(fileobj=f), encoding="utf-8") as lines:
+        for line in lines:
+            if line.strip() != "":
+                yield json.loads(line)
+
+
+class CompactionConflictError(Exception):
+    pass
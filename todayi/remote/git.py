@@ -5,12 +5,28 @@ content at remote.
 """
 
 from datetime import datetime
+import sqlite3
 import subprocess
+from typing import Optional
 
+from todayi.backend.concurrency import checkpoint
+from todayi.backend.migrations import migrate
+from todayi.backend.shards import export_shards, import_shards
+from todayi.backend.snapshot import snapshot_file
 from todayi.remote.base import Remote
 from todayi.util.fs import path, InvalidDirectoryError
 
 
+"""
+Available formats entries are committed in:
+    - db: the sqlite db, as a binary file
+    - jsonl: text shards of entries, one file per month under
+      `journal/`, so that only months that changed are rewritten,
+      and history can be diffed and delta compressed by git
+"""
+git_formats = ["db", "jsonl"]
+
+
 class GitRemote(Remote):
     """
     A rough git remote implementation to use a git repository as
@@ -20,18 +36,57 @@ class GitRemote(Remote):
     :type local_backend_path: str
     :param remote_uri: the uri for the remote to push/pull from
     :type remote_uri: str
+    :param backend_filename: name of sqlite db within backend dir,
+                             committed as a consistent snapshot
+    :type backend_filename: Optional[str]
+    :param format: format entries are committed in, see `git_formats`
+    :type format: str
     """
 
     _remote_origin_exists = "already exists"
 
     _no_init_commit = "do not have the initial commit yet"
 
-    def __init__(self, local_backend_path: str, remote_uri: str):
+    """
+    Files sqlite keeps next to a db while it is written to
+    """
+    _db_side_file_suffixes = ["-journal", "-wal", "-shm"]
+
+    """
+    Files entries are journaled to before they are written to
+    the db, see `todayi.backend.journal`
+    """
+    _db_journal_pattern = ".journal.jsonl*"
+
+    _shards_dir = "journal"
+
+    def __init__(
+        self,
+        local_backend_path: str,
+        remote_uri: str,
+        backend_filename: Optional[str] = None,
+        format: str = "db",
+    ):
+        if format not in git_formats:
+            raise KeyError(
+                "Invalid git format. Allowed: \n {}".format("\n".join(git_formats))
+            )
+        if format == "jsonl" and backend_filename is None:
+            raise ValueError("Backend filename required for jsonl git format")
         self._local_backend_path = local_backend_path
         self._remote_uri = remote_uri
+        self._backend_filename = backend_filename
+        self._format = format
         self._init_checked = False
         self._origin_checked = False
 
+    @property
+    def supports_fetch(self) -> bool:
+        """
+        Only dbs committed as is can be fetched as a file.
+        """
+        return self._format == "db"
+
     @property
     def initialized(self):
         if self._init_checked is False:
@@ -53,6 +108,8 @@ class GitRemote(Remote):
         if backup is True:
             raise NotImplementedError("Backup logic not configured for GitRemote.push")
         else:
+            if self._format == "jsonl":
+                self._export_shards()
             self._stage_changes()
             self._commit_changes()
             self._push_changes(force=True)
@@ -71,12 +128,44 @@ class GitRemote(Remote):
         if backup is True:
             raise NotImplementedError("Backup logic not configured for GitRemote.pull")
         else:
+            self._checkpoint_db()
             self._stash_changes()
             try:
                 self._reset_from_origin()
             except Exception as e:
                 self._rollback_from_stash()
                 raise e
+            if self._format == "jsonl":
+                self._import_shards()
+
+    def fetch(self, target_path: str) -> bool:
+        """
+        Fetches origins master branch, and writes the db
+        committed there to a file. Local changes are kept.
+
+        :param target_path: path to write db to
+        :type target_path: str
+        :return: bool whether or not origin has a db yet
+        """
+        assert self.initialized is True
+        if self._backend_filename is None:
+            raise GitException("Backend filename not configured for GitRemote")
+        if self._format == "jsonl":
+            raise NotImplementedError(
+                "Fetch not supported for jsonl git format, as pull applies "
+                "only shards that changed"
+            )
+        fetch_call = self._git_call("fetch", "origin", "master")
+        if fetch_call.returncode != 0:
+            return False
+        with open(target_path, "wb") as f:
+            show_call = subprocess.run(
+                ["git", "show", "FETCH_HEAD:{}".format(self._backend_filename)],
+                cwd=str(self._local_backend_path),
+                stdout=f,
+                stderr=subprocess.DEVNULL,
+            )
+        return show_call.returncode == 0
 
     def _init_repo(self):
         backend_path = path(self._local_backend_path)
@@ -89,8 +178,66 @@ class GitRemote(Remote):
                 raise GitException(
                     "Could not initialize repo in {}".format(self._local_backend_path)
                 )
+        self._exclude_local_files()
         self._init_checked = True
 
+    def _exclude_local_files(self):
+        """
+        Excludes files only used locally from the repo, so that
+        they are neither committed nor removed by stashing: the
+        journal of the db, and in jsonl format, where only shards
+        are committed, the db itself.
+        """
+        if self._backend_filename is None:
+            return
+        exclude_path = path(self._local_backend_path, ".git", "info", "exclude")
+        excluded = exclude_path.read_text() if exclude_path.exists() else ""
+        suffixes = [self._db_journal_pattern]
+        if self._format == "jsonl":
+            suffixes += [""] + self._db_side_file_suffixes
+        patterns = [
+            "/{}{}".format(self._backend_filename, suffix) for suffix in suffixes
+        ]
+        missing = [p for p in patterns if p not in excluded.splitlines()]
+        if len(missing) > 0:
+            exclude_path.parent.mkdir(parents=True, exist_ok=True)
+            if excluded != "" and not excluded.endswith("\n"):
+                excluded += "\n"
+            exclude_path.write_text(excluded + "".join(p + "\n" for p in missing))
+
+    def _checkpoint_db(self):
+        """
+        Moves changes left in the wal of the db into the db file,
+        so that they are stashed with it, and never applied to the
+        db reset from origin.
+        """
+        if self._backend_filename is None or self._format == "jsonl":
+            return
+        db_path = path(self._local_backend_path, self._backend_filename)
+        if db_path.exists():
+            checkpoint(str(db_path))
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            str(path(self._local_backend_path, self._backend_filename))
+        )
+        migrate(conn)
+        return conn
+
+    def _export_shards(self):
+        conn = self._connect()
+        try:
+            export_shards(conn, str(path(self._local_backend_path, self._shards_dir)))
+        finally:
+            conn.close()
+
+    def _import_shards(self):
+        conn = self._connect()
+        try:
+            import_shards(conn, str(path(self._local_backend_path, self._shards_dir)))
+        finally:
+            conn.close()
+
     def _init_origin(self):
         check_origin_call = self._git_call("config", "--get", "remote.origin.url")
         check_origin_out = check_origin_call.stdout.strip()
@@ -113,7 +260,7 @@ class GitRemote(Remote):
         stash_call = self._git_call(
             "stash", "save", "--keep-index", "--include-untracked"
         )
-        stash_call_out = stash_call.stdout.strip()
+        stash_call_out = (stash_call.stdout + stash_call.stderr).strip()
         if stash_call.returncode != 0 and self._no_init_commit not in stash_call_out:
             raise GitException("Unknown error stashing local changes")
 
@@ -137,11 +284,43 @@ class GitRemote(Remote):
             _reset_error()
 
     def _stage_changes(self):
-        stage_call = self._git_call("add", "--all")
+        """
+        Stages all changes. The db is staged as a consistent
+        snapshot rather than as is, as it may be written to
+        while staged. In jsonl format, the db is already
+        excluded from the repo.
+        """
+        if self._backend_filename is None or self._format == "jsonl":
+            excluded = []
+        else:
+            excluded = [
+                ":(exclude){}{}".format(self._backend_filename, suffix)
+                for suffix in [""] + self._db_side_file_suffixes
+            ]
+        stage_call = self._git_call("add", "--all", "--", ".", *excluded)
         if stage_call.returncode != 0:
             raise GitException("Problem adding changes to staging")
+        if self._backend_filename is not None and self._format == "db":
+            self._stage_db_snapshot()
+
+    def _stage_db_snapshot(self):
+        db_path = path(self._local_backend_path, self._backend_filename)
+        if not db_path.exists():
+            return
+        with snapshot_file(str(db_path)) as snapshot_path:
+            hash_call = self._git_call("hash-object", "-w", snapshot_path)
+        if hash_call.returncode != 0:
+            raise GitException("Problem writing db snapshot")
+        cache_info = "100644,{},{}".format(
+            hash_call.stdout.strip(), self._backend_filename
+        )
+        update_call = self._git_call("update-index", "--add", "--cacheinfo", cache_info)
+        if update_call.returncode != 0:
+            raise GitException("Problem adding db snapshot to staging")
 
     def _commit_changes(self):
+        if self._git_call("diff", "--cached", "--quiet").returncode == 0:
+            return
         commit_message = "'Push to remote {}'".format(
             datetime.now().strftime("%m.%d.%Y-%H.%M.%S")
         )
@@ -2,7 +2,8 @@
 Module deals with iterables.
 """
 
-from typing import Any
+from itertools import islice
+from typing import Any, Iterable, Iterator, List
 
 
 def is_iterable(obj: Any, allow_str: bool = False):
@@ -24,3 +25,23 @@ def is_iterable(obj: Any, allow_str: bool = False):
     except TypeError:
         return False
     return True
+
+
+def chunked(iterable: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """
+    Splits iterable into lists of at most `size` elements,
+    consuming the iterable lazily.
+
+    :param iterable: iterable to split
+    :type iterable: Iterable[Any]
+    :param size: max # of elements per chunk
+    :type size: int
+    :return: Iterator[List[Any]]
+    """
+    if size < 1:
+        raise ValueError("size must be a positive integer")
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while len(chunk) > 0:
+        yield chunk
+        chunk = list(islice(iterator, size))
@@ -0,0 +1,56 @@
+"""
+Module used to resolve implementations by name, importing
+them only once they are first used. Keeps optional and heavy
+dependencies, such as SQLAlchemy or google-cloud-storage,
+off of code paths that do not need them.
+"""
+
+from importlib import import_module
+from typing import Any, Dict, KeysView, Optional
+
+
+class Registry:
+    """
+    Maps names to implementations, given as import paths
+    in the form `package.module:attribute`.
+
+    :param implementations: name to import path
+    :type implementations: Dict[str, str]
+    """
+
+    def __init__(self, implementations: Dict[str, str]):
+        self._implementations = implementations
+        self._resolved = {}
+
+    def keys(self) -> KeysView[str]:
+        return self._implementations.keys()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._implementations
+
+    def get(self, name: str) -> Optional[Any]:
+        """
+        Gets implementation registered under name, importing
+        its module if not yet imported.
+
+        :param name: registered name
+        :type name: str
+        :return: implementation, or None if not registered
+        """
+        if name not in self._implementations:
+            return None
+        if name not in self._resolved:
+            self._resolved[name] = resolve(self._implementations[name])
+        return self._resolved[name]
+
+
+def resolve(import_path: str) -> Any:
+    """
+    Imports attribute given path in the form `package.module:attribute`
+
+    :param import_path: path to attribute
+    :type import_path: str
+    :return: Any
+    """
+    module_name, _, attribute = import_path.partition(":")
+    return getattr(import_module(module_name), attribute)